@@ -3,10 +3,14 @@ from .reader import Reader
 from .designer import Designer
 
 from .developer import Developer
+from .context import ContextProvider, DocumentContext, RAGContext
 
 __all__ = [
     "Planner",
     "Reader",
     "Designer",
-    "Developer"
+    "Developer",
+    "ContextProvider",
+    "DocumentContext",
+    "RAGContext"
 ]
@@ -3,18 +3,23 @@ import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from utils import LLMClient
+from utils.llm import AsyncLLMStream
+from utils.retry import RetryPolicy
 
 class BaseAgent:
     def __init__(
             self,
             model: str = "Qwen/Qwen3-8B", 
-            timeout: int = 30
+            timeout: int = 30,
+            retry: RetryPolicy | None = None
             ):
-        self.model = LLMClient(model, timeout)
+        self.model = LLMClient(model, timeout, retry=retry)
         self.history = []
 
     @staticmethod
     def find_json(response : str):
+        if not response:
+            raise ValueError("LLM returned no answer after retries")
         json_start = response.find('{')
         json_end = response.rfind('}') + 1
         json_str = response[json_start:json_end]
@@ -31,6 +36,24 @@ class BaseAgent:
             ).get("answer")
         return response
 
+    async def aoneshot(self, prompt: str, format: bool = False, **params):
+        if format:
+            params["response_format"] = {"type": "json_object"}
+        response = (await self.model.achat(
+            prompt, 
+            "user", 
+            **params
+            )).get("answer")
+        return response
+
+    def aoneshot_stream(self, prompt: str, format: bool = False, **params) -> AsyncLLMStream:
+        """
+        流式单轮调用，返回可 async for 迭代的增量流。
+        """
+        if format:
+            params["response_format"] = {"type": "json_object"}
+        return self.model.astream([{"role": "user", "content": prompt}], **params)
+
     def chat(self, prompt: str, **params):
         massage = self.history + [{"role": "user", "content": prompt}]
         response = self.model.dialogue(massage, **params).get("answer")
@@ -40,6 +63,16 @@ class BaseAgent:
                 {"role": "assistant", "content": response}
                 ]
             return response
+
+    async def achat(self, prompt: str, **params):
+        massage = self.history + [{"role": "user", "content": prompt}]
+        response = (await self.model.adialogue(massage, **params)).get("answer")
+        if response:
+            self.history += [
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": response}
+                ]
+            return response
     
     def clear_history(self):
         self.history.clear()
\ No newline at end of file
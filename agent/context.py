@@ -0,0 +1,179 @@
+import asyncio
+import threading
+import time
+import numpy as np
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import CONTEXT
+from utils.embedding import EmbeddingModel, estimate_tokens
+from utils.chunk_split import semantic_split
+
+DOC_PATH = os.path.join(currunt_dir, "..", "data", "books", "curl-commands.md")
+
+_docs: dict[str, tuple[float, str]] = {}
+_docs_lock = threading.Lock()
+
+def load_deeppath(path: str = DOC_PATH) -> str:
+    """
+    读取知识文档，按修改时间缓存，文件未变时不再读盘。
+    """
+    mtime = os.path.getmtime(path)
+    with _docs_lock:
+        cached = _docs.get(path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path, encoding="utf-8") as f:
+        doc = f.read()
+    with _docs_lock:
+        _docs[path] = (mtime, doc)
+    return doc
+
+def pack(chunks: list[str], scores: list[float], budget: int) -> str:
+    """
+    按相关度从高到低选取片段直至 token 预算用尽，再按原文顺序拼接。
+    """
+    chosen, used = [], 0
+    for i in sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True):
+        cost = estimate_tokens(chunks[i])
+        if used + cost > budget:
+            continue
+        chosen.append(i)
+        used += cost
+    return "\n\n".join(chunks[i] for i in sorted(chosen))
+
+class ContextProvider:
+    """
+    为提示词提供与当前任务相关的知识片段。
+    """
+    def __init__(self, top_k: int = CONTEXT["top_k"], budget: int = CONTEXT["budget"]):
+        self.top_k = top_k
+        self.budget = budget
+
+    def retrieve(self, query: str) -> str:
+        raise NotImplementedError
+
+    async def aretrieve(self, query: str) -> str:
+        return await asyncio.to_thread(self.retrieve, query)
+
+class DocumentContext(ContextProvider):
+    """
+    基于单个文档的内存检索：文档只读取、分块、向量化一次，之后每次只需对查询做一次向量化。
+
+    文档向量化失败时暂时按原文顺序截取，retry_interval 秒后的下一次检索重新向量化。
+    """
+    def __init__(
+            self,
+            path: str = DOC_PATH,
+            top_k: int = CONTEXT["top_k"],
+            budget: int = CONTEXT["budget"],
+            embedder: EmbeddingModel | None = None,
+            retry_interval: float = 30.0
+        ):
+        super().__init__(top_k, budget)
+        self.path = path
+        self.embedder = embedder or EmbeddingModel()
+        self.retry_interval = retry_interval
+        self.doc = None
+        self.chunks: list[str] = []
+        self.matrix = None
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self):
+        doc = load_deeppath(self.path)
+        with self._lock:
+            if doc is self.doc and (self.matrix is not None or time.monotonic() < self._retry_at):
+                return
+            chunks = self.chunks if doc is self.doc else semantic_split(doc)
+            try:
+                vectors = np.asarray(self.embedder.embed_batch(chunks), dtype=np.float32)
+                vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+            except Exception as e:
+                print(f"[ERROR] 文档 {self.path} 向量化失败，退化为按原文顺序截取，{self.retry_interval:g} 秒后重试:", e)
+                vectors = None
+                self._retry_at = time.monotonic() + self.retry_interval
+            self.doc, self.chunks, self.matrix = doc, chunks, vectors
+
+    def retrieve(self, query: str) -> str:
+        self._index()
+        if not self.chunks:
+            return ""
+        try:
+            qvec = np.asarray(self.embedder.embed(query), dtype=np.float32) if self.matrix is not None else None
+        except Exception as e:
+            print("[ERROR] 查询向量化失败，退化为按原文顺序截取:", e)
+            qvec = None
+        if qvec is None:
+            return pack(self.chunks, [-i for i in range(len(self.chunks))], self.budget)
+        scores = self.matrix @ (qvec / (np.linalg.norm(qvec) + 1e-12))
+        top = sorted(np.argsort(-scores)[:self.top_k])
+        return pack([self.chunks[i] for i in top], [float(scores[i]) for i in top], self.budget)
+
+class RAGContext(ContextProvider):
+    """
+    基于 RAGDatabase 数据表的检索上下文。
+    """
+    def __init__(
+            self,
+            database,
+            table: str,
+            top_k: int = CONTEXT["top_k"],
+            budget: int = CONTEXT["budget"]
+        ):
+        super().__init__(top_k, budget)
+        self.database = database
+        self.table = table
+
+    def retrieve(self, query: str) -> str:
+        hits = self.database.query(self.table, query, top_k=self.top_k)
+        return pack([hit["chunk"] for hit in hits], [hit["score"] for hit in hits], self.budget)
+
+_default: DocumentContext | None = None
+
+def default_context() -> DocumentContext:
+    """
+    进程内共享的默认知识文档上下文。
+    """
+    global _default
+    with _docs_lock:
+        if _default is None:
+            _default = DocumentContext()
+        return _default
+
+if __name__ == "__main__":
+    import tempfile
+
+    class FlakyEmbedder:
+        """
+        第一次批量向量化失败，之后正常；向量为各关键词的出现次数。
+        """
+        words = ["curl", "header", "proxy", "cookie"]
+
+        def __init__(self):
+            self.batches = 0
+
+        def _vector(self, text: str) -> list[float]:
+            return [float(text.count(w)) + 1e-3 for w in self.words]
+
+        def embed_batch(self, texts: list[str]) -> list[list[float]]:
+            self.batches += 1
+            if self.batches == 1:
+                raise RuntimeError("transient embedding error")
+            return [self._vector(t) for t in texts]
+
+        def embed(self, text: str) -> list[float]:
+            return self._vector(text)
+
+    with tempfile.NamedTemporaryFile("w", suffix=".md", encoding="utf-8", delete=False) as f:
+        f.write("# curl\ncurl 基本用法\n\n# header\nheader header header 设置请求头\n\n# proxy\nproxy proxy 代理\n")
+    try:
+        embedder = FlakyEmbedder()
+        context = DocumentContext(f.name, top_k=1, budget=100, embedder=embedder, retry_interval=0.2)
+        assert context.retrieve("proxy").startswith("#curl") and context.matrix is None
+        assert context.retrieve("proxy").startswith("#curl") and embedder.batches == 1
+        time.sleep(0.25)
+        assert "代理" in context.retrieve("proxy") and context.matrix is not None and embedder.batches == 2
+        print("[OK] 文档向量化失败后按间隔重试并恢复语义检索")
+    finally:
+        os.remove(f.name)
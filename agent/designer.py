@@ -1,35 +1,131 @@
+import json
+from collections import Counter
+
 import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from agent.base import BaseAgent
+from utils.retry import RetryPolicy
+from utils.scheduler import PRIORITY_HIGH
 from agent.templates import DESIGNER
-
-def load_deeppath():
-    doc_path = os.path.join(currunt_dir, "..", "data", "books", "curl-commands.md")
-    with open(doc_path) as f:
-        doc = f.read()
-        return doc
+from agent.context import ContextProvider, default_context
+from utils.json_stream import JSONArrayStream
 
 class Designer(BaseAgent):
     def __init__(
             self, 
             task: str,
             model = "Qwen/Qwen3-8B", 
-            timeout = 30
+            timeout = 30,
+            retry: RetryPolicy | None = None,
+            context: ContextProvider | None = None
             ):
-        super().__init__(model, timeout)
+        super().__init__(model, timeout, retry)
+        self.model.priority = PRIORITY_HIGH
         self.task = task
+        self.context = context or default_context()
     
     def mcp_design(self):
-        prompt = DESIGNER.format(user_prompt=self.task,info=load_deeppath())
+        prompt = DESIGNER.format(user_prompt=self.task,info=self.context.retrieve(self.task))
         response = self.oneshot(
             prompt,
             format=True
             )
+        return self._tools(response)
+
+    async def amcp_design(self):
+        prompt = DESIGNER.format(user_prompt=self.task,info=await self.context.aretrieve(self.task))
+        response = await self.aoneshot(
+            prompt,
+            format=True
+            )
+        return self._tools(response)
+
+    async def astream_design(self):
+        """
+        流式设计：每个工具的 JSON 一完整就产出，便于下游提前开始开发。
+        """
+        prompt = DESIGNER.format(user_prompt=self.task,info=await self.context.aretrieve(self.task))
+        stream = self.aoneshot_stream(
+            prompt,
+            format=True
+            )
+        async for tool in self._stream_tools(stream):
+            yield tool
+
+    async def _stream_tools(self, stream):
+        """
+        增量解析流式响应中的 tools 数组，结束后以完整响应兜底，只补齐增量解析未产出的工具。
+
+        增量解析可能跳过中间某个元素（非对象或格式错误），因此按内容而非位置核对已产出的工具；
+        完整响应本身无法解析时，保留已产出的工具并结束。
+        """
+        parser = JSONArrayStream("tools")
+        emitted = Counter()
+        async for delta in stream:
+            if not delta["answer"]:
+                continue
+            for tool in parser.feed(delta["answer"]):
+                if isinstance(tool, dict):
+                    emitted[self._tool_key(tool)] += 1
+                    yield tool
+        try:
+            tools = self._tools(stream.result()["answer"])
+        except (ValueError, KeyError, TypeError) as e:
+            if not emitted:
+                raise
+            print("[ERROR] 完整响应解析失败，仅保留已解析的工具:", e)
+            return
+        for tool in tools:
+            if not isinstance(tool, dict):
+                continue
+            key = self._tool_key(tool)
+            if emitted[key] > 0:
+                emitted[key] -= 1
+            else:
+                yield tool
+
+    @staticmethod
+    def _tool_key(tool: dict) -> str:
+        return json.dumps(tool, sort_keys=True, ensure_ascii=False)
+
+    def _tools(self, response: str) -> list:
         data = self.find_json(response)
         print(data)
         return data["tools"]
     
+class _ReplayStream:
+    """
+    按给定分块回放的流式响应，用于离线检查兜底逻辑。
+    """
+    def __init__(self, text: str, size: int = 7):
+        self.text = text
+        self.size = size
+
+    async def __aiter__(self):
+        for i in range(0, len(self.text), self.size):
+            yield {"reasoning": None, "answer": self.text[i:i + self.size]}
+
+    def result(self) -> dict:
+        return {"reasoning": None, "answer": self.text}
+
+def _check_stream_fallback():
+    import asyncio
+
+    async def collect(text: str) -> list:
+        return [tool["name"] async for tool in Designer("检查")._stream_tools(_ReplayStream(text))]
+
+    # 中间元素不是对象：增量解析跳过它，兜底不能重复产出其后的工具
+    assert asyncio.run(collect('{"tools": [{"name": "a"}, "oops", {"name": "c"}, {"name": "d"}]}')) == ["a", "c", "d"]
+    # 中间元素格式错误：完整响应也无法解析，保留增量解析得到的工具
+    assert asyncio.run(collect('{"tools": [{"name": "a"}, {"name": b}, {"name": "c"}]}')) == ["a", "c"]
+    # 全部由增量解析产出时兜底不再重复产出
+    assert asyncio.run(collect('{"tools": [{"name": "a"}, {"name": "b"}]}')) == ["a", "b"]
+    # 内容相同的工具按出现次数核对
+    assert asyncio.run(collect('{"tools": [{"name": "a"}, 1, {"name": "a"}]}')) == ["a", "a"]
+    print("[OK] 流式设计兜底只补齐缺失的工具")
+
 if __name__ == '__main__':
+    _check_stream_fallback()
     d = Designer("每次用户输入学习的时候就开始打开台灯")
     print(d.mcp_design())
\ No newline at end of file
@@ -2,14 +2,11 @@ import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from agent.base import BaseAgent
+from utils.retry import RetryPolicy
+from utils.scheduler import PRIORITY_LOW
 from agent.templates import DEVELOPER, DEV_CON
-from utils import ToolInf, CodeTester
-
-def load_deeppath():
-    doc_path = os.path.join(currunt_dir, "..", "data", "books", "curl-commands.md")
-    with open(doc_path) as f:
-        doc = f.read()
-        return doc
+from agent.context import ContextProvider, default_context
+from utils import ToolInf, CodeTest
 
 class Developer(BaseAgent):
     def __init__(
@@ -17,34 +14,80 @@ class Developer(BaseAgent):
             task: str,
             tool: ToolInf,
             model = "Qwen/Qwen3-8B", 
-            timeout = 30
+            timeout = 30,
+            retry: RetryPolicy | None = None,
+            context: ContextProvider | None = None,
+            initial: bool = True
             ):
-        super().__init__(model, timeout)
+        super().__init__(model, timeout, retry)
         self.task = task
         self.tool = tool
         self.code = ""
         self.test = ""
-        self.initial_dev()
+        self.context = context or default_context()
+        # 任务不变，检索到的知识片段在多轮开发中复用
+        self.info = None
+        if initial:
+            self.initial_dev()
+
+    @classmethod
+    async def create(
+            cls,
+            task: str,
+            tool: ToolInf,
+            model = "Qwen/Qwen3-8B", 
+            timeout = 30,
+            retry: RetryPolicy | None = None,
+            context: ContextProvider | None = None
+            ):
+        """
+        异步构造：初版代码生成不阻塞事件循环。
+        """
+        dev = cls(task, tool, model, timeout, retry, context, initial=False)
+        await dev.ainitial_dev()
+        return dev
+
+    def _apply_initial(self, response: str):
+        data = self.find_json(response)
+        print(data)
+        self.code = data["codes"]
+        self.test = data["test"]
+
+    def _info(self) -> str:
+        if self.info is None:
+            self.info = self.context.retrieve(self.task)
+        return self.info
+
+    async def _ainfo(self) -> str:
+        if self.info is None:
+            self.info = await self.context.aretrieve(self.task)
+        return self.info
 
     def initial_dev(self):
-        prompt = DEVELOPER.format(task=self.task,info=load_deeppath())
+        prompt = DEVELOPER.format(task=self.task,info=self._info())
         response = self.oneshot(
             prompt,
             format=True
             )
-        data = self.find_json(response)
-        print(data)
-        self.code = data["codes"]
-        self.test = data["test"]
+        self._apply_initial(response)
+
+    async def ainitial_dev(self):
+        prompt = DEVELOPER.format(task=self.task,info=await self._ainfo())
+        response = await self.aoneshot(
+            prompt,
+            format=True
+            )
+        self._apply_initial(response)
 
     async def code_test(self):
-        tester = CodeTester(self.code + "\n" + self.test)
+        tester = CodeTest(self.code + "\n" + self.test)
         result = await tester.run()
         test = f"Output: {result.output}\nError: {result.error}"
-        prompt = DEV_CON.format(task=self.task,info=load_deeppath(),code=self.code,result=test)
-        response = self.oneshot(
+        prompt = DEV_CON.format(task=self.task,info=await self._ainfo(),code=self.code,result=test)
+        response = await self.aoneshot(
             prompt,
-            format=True
+            format=True,
+            priority=PRIORITY_LOW
             )
         data = self.find_json(response)
         print(data)
@@ -2,15 +2,17 @@ import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from agent.base import BaseAgent
+from utils.retry import RetryPolicy
 from agent.templates import PLANNER
 
 class Planner(BaseAgent):
     def __init__(
             self,
             model = "Qwen/Qwen3-8B",
-            timeout = 30
+            timeout = 30,
+            retry: RetryPolicy | None = None
     ):
-        super().__init__(model, timeout)
+        super().__init__(model, timeout, retry)
 
     def plan(self, task: str):
         prompt = PLANNER.format(task=task)
@@ -2,18 +2,29 @@ import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from agent.base import BaseAgent
+from utils.retry import RetryPolicy
 from utils import RAGDatabase
+from agent.context import RAGContext
+from config import CONTEXT
 
 class Reader(BaseAgent):
     def __init__(
             self, 
             task: str,
             model = "Qwen/Qwen3-8B", 
-            timeout = 30
+            timeout = 30,
+            retry: RetryPolicy | None = None
             ):
-        super().__init__(model, timeout)
+        super().__init__(model, timeout, retry)
 
         self.table = task
         self.database = RAGDatabase()
-        
-    pass
\ No newline at end of file
+
+    def context(self, top_k: int = CONTEXT["top_k"], budget: int = CONTEXT["budget"]) -> RAGContext:
+        """
+        以当前数据表为知识源的检索上下文，可直接传给 Designer/Developer。
+        """
+        return RAGContext(self.database, self.table, top_k, budget)
+
+    def retrieve(self, query: str, top_k: int = CONTEXT["top_k"], budget: int = CONTEXT["budget"]) -> str:
+        return self.context(top_k, budget).retrieve(query)
\ No newline at end of file
@@ -5,15 +5,84 @@ load_dotenv()
 
 EMBEDDING = {
     "url": os.getenv("EMBEDDING_API_URL", "https://api.siliconflow.cn/v1/embeddings"),
-    "key": os.getenv("EMBEDDING_API_KEY")
+    "key": os.getenv("EMBEDDING_API_KEY"),
+    "batch_size": int(os.getenv("EMBEDDING_BATCH_SIZE", 32)),
+    "max_batch_tokens": int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", 8192)),
+    # 向量维度，留空时按模型名查表，查不到再发一次请求探测
+    "dim": int(os.getenv("EMBEDDING_DIM") or 0) or None,
+    "cache": os.getenv("EMBEDDING_CACHE", "1") == "1",
+    "cache_dir": os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.path.dirname(__file__), "data", "embed_cache")),
+    "cache_size": int(os.getenv("EMBEDDING_CACHE_SIZE", 200000))
 }
 
 LLM = {
     "url": os.getenv("LLM_API_URL", "https://api.siliconflow.cn/v1/chat/completions"),
-    "key": os.getenv("LLM_API_KEY")
+    "key": os.getenv("LLM_API_KEY"),
+    "cache": os.getenv("LLM_CACHE", "0") == "1",
+    "cache_path": os.getenv("LLM_CACHE_PATH", os.path.join(os.path.dirname(__file__), "data", "llm_cache.sqlite")),
+    "cache_ttl": float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600)),
+    "cache_size": int(os.getenv("LLM_CACHE_SIZE", 10000)),
+    "max_attempts": int(os.getenv("LLM_MAX_ATTEMPTS", 3)),
+    "deadline": float(os.getenv("LLM_DEADLINE")) if os.getenv("LLM_DEADLINE") else None,
+    "hedge": os.getenv("LLM_HEDGE", "0") == "1",
+    "scheduler": os.getenv("LLM_SCHEDULER", "1") == "1",
+    "rpm": float(os.getenv("LLM_RPM", 1000)),
+    "tpm": float(os.getenv("LLM_TPM", 50000)),
+    "max_concurrent": int(os.getenv("LLM_MAX_CONCURRENT", 16))
+}
+
+HTTP = {
+    "pool_connections": int(os.getenv("HTTP_POOL_CONNECTIONS", 10)),
+    "pool_maxsize": int(os.getenv("HTTP_POOL_MAXSIZE", 32)),
+    "pool_block": os.getenv("HTTP_POOL_BLOCK", "0") == "1",
+    "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", 5)),
+    "read_timeout": float(os.getenv("HTTP_READ_TIMEOUT", 60))
+}
+
+RAG = {
+    "backend": os.getenv("RAG_BACKEND", "milvus"),
+    "milvus_url": os.getenv("MILVUS_URL", "http://localhost:19530"),
+    "db_name": os.getenv("RAG_DB_NAME", "CodexAidBooks"),
+    # shared: 所有文档写入同一个按 doc_id 分区的数据表；table: 每个文档一个数据表（旧布局）
+    # 默认 table 以便直接打开已有数据库；切换到 shared 前先按 table 布局导出快照，再以 shared 布局导入
+    "layout": os.getenv("RAG_LAYOUT", "table"),
+    "collection": os.getenv("RAG_COLLECTION", "documents"),
+    "meta_path": os.getenv("RAG_META_PATH", os.path.join(os.path.dirname(__file__), "data", "metadata.sqlite")),
+    "bm25_path": os.getenv("RAG_BM25_PATH", os.path.join(os.path.dirname(__file__), "data", "bm25")),
+    # vector | lexical | hybrid
+    "query_mode": os.getenv("RAG_QUERY_MODE", "hybrid"),
+    "query_cache": os.getenv("RAG_QUERY_CACHE", "1") == "1",
+    "query_cache_threshold": float(os.getenv("RAG_QUERY_CACHE_THRESHOLD", 0.95)),
+    "query_cache_ttl": float(os.getenv("RAG_QUERY_CACHE_TTL", 600)),
+    "query_cache_size": int(os.getenv("RAG_QUERY_CACHE_SIZE", 1024)),
+    # 新建数据表的向量存储精度：float32 | float16 | bfloat16 | int8
+    "vector_type": os.getenv("RAG_VECTOR_TYPE", "float32"),
+    # 额外存储符号位二值码，检索时先按汉明距离粗排
+    "binary_prefilter": os.getenv("RAG_BINARY_PREFILTER", "0") == "1",
+    # 二值码粗排多取的候选倍数，候选以存储的向量精排后取 top_k
+    "rescore_factor": int(os.getenv("RAG_RESCORE_FACTOR", 10)),
+    # MMR 多样性重排：默认是否开启、多取的候选倍数与相关度权重 lambda
+    "mmr": os.getenv("RAG_MMR", "0") == "1",
+    "mmr_fetch_factor": int(os.getenv("RAG_MMR_FETCH_FACTOR", 4)),
+    "mmr_lambda": float(os.getenv("RAG_MMR_LAMBDA", 0.5)),
+    # 单次写入请求的行数与字节数上限，需小于 Milvus gRPC 消息上限（默认 64 MB）
+    "insert_batch_rows": int(os.getenv("RAG_INSERT_BATCH_ROWS", 512)),
+    "insert_batch_bytes": int(float(os.getenv("RAG_INSERT_BATCH_MB", 16)) * 1024 * 1024),
+    "insert_workers": int(os.getenv("RAG_INSERT_WORKERS", 4)),
+    "local_path": os.getenv("RAG_LOCAL_PATH", os.path.join(os.path.dirname(__file__), "data", "vectors")),
+    # 本地后端删除墓碑超过该比例（且不少于最小行数）时压缩数据表
+    "local_compact_ratio": float(os.getenv("RAG_LOCAL_COMPACT_RATIO", 0.2)),
+    "local_compact_min": int(os.getenv("RAG_LOCAL_COMPACT_MIN", 1024))
+}
+
+CONTEXT = {
+    "top_k": int(os.getenv("CONTEXT_TOP_K", 6)),
+    "budget": int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
 }
 
 currunt_dir = os.path.dirname(__file__)
 MCPPATH = os.path.join(currunt_dir, "mcp", "servers", "skills.py")
 
-TOOLPORT = 8848
\ No newline at end of file
+TOOLPORT = 8848
+# 工具调用的读超时（秒），0 表示不设超时，工具执行时长不定
+TOOL_TIMEOUT = float(os.getenv("TOOL_TIMEOUT", 0))
\ No newline at end of file
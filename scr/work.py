@@ -5,17 +5,19 @@ from agent.designer import Designer
 from agent.developer import Developer
 from utils.mcpbuild import build_mcp_server
 from utils.mcpbuild import ToolInf
+from utils.scheduler import current_job
 
+import uuid
 import asyncio
 from typing import List
 
 async def mcp_create_async(task: str) -> str:
     print(f"[Start] Task start {task}")
+    # 每次生成作为一个调度作业，与并发的其他生成任务公平共享 LLM 额度
+    current_job.set(uuid.uuid4().hex)
     designe = Designer(task)
-    todo: List[dict] = designe.mcp_design()
-    print(f"[Designe] Designe completed.")
     async def _run_dev(tool: dict) -> str | None:
-        dev = Developer(
+        dev = await Developer.create(
             tool["dev_tasks"],
             ToolInf(
                 tool_name=tool["name"],
@@ -27,7 +29,19 @@ async def mcp_create_async(task: str) -> str:
         success = await dev.dev()
         return dev.get_tool() if success else None
 
-    results = await asyncio.gather(*[_run_dev(tool) for tool in todo])
+    # Designer 流式产出工具，每个工具立即启动对应的 Developer
+    dev_tasks: List[asyncio.Task] = []
+    try:
+        async for tool in designe.astream_design():
+            print(f"[Designe] Tool {tool['name']} designed.")
+            dev_tasks.append(asyncio.create_task(_run_dev(tool)))
+    except Exception:
+        for t in dev_tasks:
+            t.cancel()
+        raise
+    print(f"[Designe] Designe completed.")
+
+    results = await asyncio.gather(*dev_tasks)
     print(f"[Build] Build MCP server")
     codes = [code for code in results if code is not None]
     return build_mcp_server(codes)
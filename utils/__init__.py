@@ -1,16 +1,35 @@
 from .embedding import EmbeddingModel
+from .embed_cache import EmbeddingCache
 from .llm import LLMClient
+from .retry import RetryPolicy
 from .ragdb import RAGDatabase
+from .ingest import IngestPipeline
+from .bulk_writer import BulkWriter
+from .vectorstore import VectorStore, MilvusStore, LocalStore
+from .metastore import MetaStore
+from .query_cache import SemanticQueryCache
 from .codetest import CodeTest
-from .chunk_split import semantic_split
+from .chunk_split import semantic_split, iter_split
+from .json_stream import JSONArrayStream
 from .mcpbuild import build_mcp_server, build_tool_block, ToolInf
 
 __all__ = [
     "EmbeddingModel",
+    "EmbeddingCache",
     "LLMClient",
+    "RetryPolicy",
     "RAGDatabase",
+    "IngestPipeline",
+    "BulkWriter",
+    "VectorStore",
+    "MilvusStore",
+    "LocalStore",
+    "MetaStore",
+    "SemanticQueryCache",
     "CodeTest",
     "semantic_split",
+    "iter_split",
+    "JSONArrayStream",
     "build_mcp_server",
     "build_tool_block",
     "ToolInf"
@@ -0,0 +1,306 @@
+import json
+import math
+import re
+import threading
+from collections import Counter
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import RAG
+
+_WORD = re.compile(r"[A-Za-z0-9_]+")
+_CJK = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+")
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+def tokenize(text: str) -> list[str]:
+    """
+    中英混合分词：英文标识符保留完整小写形式，并按 camelCase / snake_case 拆出子词；
+    中文按相邻二字切分（单字片段保留单字）。
+
+    例如 "toggleLamp 开关灯" -> ["togglelamp", "toggle", "lamp", "开关", "关灯"]
+    """
+    tokens = []
+    for word in _WORD.findall(text):
+        tokens.append(word.lower())
+        parts = [p.lower() for piece in word.split("_") for p in _CAMEL.findall(piece)]
+        if len(parts) > 1:
+            tokens.extend(parts)
+    for run in _CJK.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+class BM25Index:
+    """
+    单个数据表的 BM25 倒排索引，常驻内存，变更以追加日志方式持久化。
+
+    日志每行为 {"op": "add", "id", "len", "tf", "fields"} 或 {"op": "del", "ids"}；
+    删除占比过高时重写日志。fields 保存分块文本与文档字段，用于过滤和返回结果。
+    每次读写前检查日志文件：其他进程（批量入库、BulkWriter 命令行等）追加的记录增量载入，
+    日志被重写或删除时整体重新加载。多个进程同时重写同一日志时仍可能丢失其间的追加，重写只在删除时发生。
+
+    :param path: 日志文件路径
+    :param k1: 词频饱和参数
+    :param b: 文档长度归一化参数
+    """
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[int, int]] = {}
+        self.lengths: dict[int, int] = {}
+        self.fields: dict[int, dict] = {}
+        self.total_length = 0
+        self.deleted_records = 0
+        # 已载入的日志文件 inode 与字节数
+        self._inode: int | None = None
+        self._offset = 0
+        self._lock = threading.RLock()
+        self._refresh()
+
+    def _reset(self):
+        self.postings.clear()
+        self.lengths.clear()
+        self.fields.clear()
+        self.total_length = 0
+        self.deleted_records = 0
+        self._inode = None
+        self._offset = 0
+
+    def _refresh(self):
+        """
+        载入日志中尚未读取的记录；日志被重写（inode 变化）、截短或删除时从头重新加载。
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            self._reset()
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            data = f.read(stat.st_size - self._offset)
+        # 没有换行符的末行可能正在写入，留到下次读取
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # 上次中断写入的残行
+                continue
+            if record["op"] == "add":
+                self._add(record["id"], record["len"], record["tf"], record["fields"])
+            else:
+                self.deleted_records += self._remove(record["ids"])
+        self._offset += end
+
+    def _add(self, chunk_id: int, length: int, tf: dict[str, int], fields: dict):
+        if chunk_id in self.lengths:
+            self._remove([chunk_id])
+        for term, count in tf.items():
+            self.postings.setdefault(term, {})[chunk_id] = count
+        self.lengths[chunk_id] = length
+        self.fields[chunk_id] = fields
+        self.total_length += length
+
+    def _remove(self, ids: list[int]) -> int:
+        removed = 0
+        for chunk_id in ids:
+            length = self.lengths.pop(chunk_id, None)
+            if length is None:
+                continue
+            fields = self.fields.pop(chunk_id)
+            for term in set(tokenize(fields.get("chunk_text") or "")):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.pop(chunk_id, None)
+                    if not posting:
+                        del self.postings[term]
+            self.total_length -= length
+            removed += 1
+        return removed
+
+    def _append(self, records: list[dict]):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+        with open(self.path, "ab") as f:
+            start = f.tell()
+            f.write(data)
+            end = f.tell()
+            inode = os.fstat(f.fileno()).st_ino
+        if start == self._offset and self._inode in (None, inode):
+            # 期间没有其他进程追加，本次记录已在内存中，无需重新读取
+            self._inode, self._offset = inode, end
+
+    def _compact(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for chunk_id, fields in self.fields.items():
+                tf = Counter(tokenize(fields.get("chunk_text") or ""))
+                f.write(json.dumps({
+                    "op": "add", "id": chunk_id, "len": self.lengths[chunk_id], "tf": tf, "fields": fields
+                }, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self.deleted_records = 0
+        stat = os.stat(self.path)
+        self._inode, self._offset = stat.st_ino, stat.st_size
+
+    def add(self, ids: list[int], rows: list[dict]):
+        """
+        索引新写入的分块。
+
+        :param ids: 向量库返回的分块 ID
+        :param rows: 分块字段，需包含 chunk_text
+        """
+        records = []
+        for chunk_id, row in zip(ids, rows):
+            tokens = tokenize(row.get("chunk_text") or "")
+            records.append({
+                "op": "add",
+                "id": int(chunk_id),
+                "len": len(tokens),
+                "tf": Counter(tokens),
+                "fields": {k: v for k, v in row.items() if k != "embedding"}
+            })
+        with self._lock:
+            self._refresh()
+            self._append(records)
+            for r in records:
+                self._add(r["id"], r["len"], r["tf"], r["fields"])
+
+    def match(self, filter: dict | None) -> list[int]:
+        with self._lock:
+            self._refresh()
+            return [chunk_id for chunk_id, fields in self.fields.items() if _matches(fields, filter)]
+
+    def delete(self, ids: list[int] | None = None, filter: dict | None = None):
+        """
+        按 ID 或字段条件删除分块。
+        """
+        with self._lock:
+            self._refresh()
+            ids = list(ids or [])
+            if filter:
+                ids += self.match(filter)
+            ids = [i for i in ids if i in self.lengths]
+            if not ids:
+                return
+            self._remove(ids)
+            self.deleted_records += len(ids)
+            if self.deleted_records > max(1000, len(self.lengths)):
+                self._compact()
+            else:
+                self._append([{"op": "del", "ids": ids}])
+
+    def drop(self):
+        with self._lock:
+            self._reset()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+    def search(self, text: str, top_k: int, filter: dict | None = None) -> list[dict]:
+        """
+        BM25 检索。
+
+        :return: [{"id", "score", "entity"}]，按得分降序
+        """
+        terms = Counter(tokenize(text))
+        with self._lock:
+            self._refresh()
+            n = len(self.lengths)
+            if n == 0 or not terms:
+                return []
+            avg_length = self.total_length / n
+            scores: dict[int, float] = {}
+            for term, qtf in terms.items():
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for chunk_id, tf in posting.items():
+                    norm = tf + self.k1 * (1 - self.b + self.b * self.lengths[chunk_id] / avg_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + qtf * idf * tf * (self.k1 + 1) / norm
+            if filter:
+                scores = {i: s for i, s in scores.items() if _matches(self.fields[i], filter)}
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+            return [{"id": i, "score": s, "entity": dict(self.fields[i])} for i, s in top]
+
+def _matches(fields: dict, filter: dict | None) -> bool:
+    for field, value in (filter or {}).items():
+        values = value if isinstance(value, (list, tuple, set)) else [value]
+        if fields.get(field) not in values:
+            return False
+    return True
+
+def rrf(rankings: list[list[dict]], k: int = 60) -> list[dict]:
+    """
+    倒数排名融合：每个候选得分为其在各列表中 1 / (k + 名次) 之和。
+
+    :param rankings: 多个按相关度降序的结果列表，元素需含 "id"
+    :return: 融合后的结果，按融合得分降序，元素附加 "score"
+    """
+    fused: dict = {}
+    for ranking in rankings:
+        for rank, hit in enumerate(ranking):
+            entry = fused.get(hit["id"])
+            if entry is None:
+                entry = fused[hit["id"]] = {**hit, "score": 0.0}
+            elif entry.get("distance") is None and hit.get("distance") is not None:
+                entry["distance"] = hit["distance"]
+            entry["score"] += 1.0 / (k + rank + 1)
+    return sorted(fused.values(), key=lambda hit: hit["score"], reverse=True)
+
+_indexes: dict[str, BM25Index] = {}
+_indexes_lock = threading.Lock()
+
+def get_bm25_index(scope: str, collection: str) -> BM25Index:
+    """
+    获取进程内共享的数据表 BM25 索引，按 metastore.meta_scope 形式的 "<后端>:<库名>" 隔离，
+    日志位于 RAG_BM25_PATH/<后端>/<库名>/<数据表>.jsonl。
+
+    未区分后端的旧日志 RAG_BM25_PATH/<库名>/<数据表>.jsonl 归入默认配置的后端，首次打开时移入新位置。
+    """
+    backend, db_name = scope.split(":", 1)
+    path = os.path.abspath(os.path.join(RAG["bm25_path"], backend, db_name, collection + ".jsonl"))
+    with _indexes_lock:
+        if path not in _indexes:
+            legacy_path = os.path.join(RAG["bm25_path"], db_name, collection + ".jsonl")
+            if backend == RAG["backend"] and not os.path.exists(path) and os.path.isfile(legacy_path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(legacy_path, path)
+            _indexes[path] = BM25Index(path)
+        return _indexes[path]
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        RAG["bm25_path"] = tmp
+        # 不同后端的同名数据库各自一份索引，分块 ID 相同也互不覆盖
+        local = get_bm25_index("local:db", "documents")
+        milvus = get_bm25_index("milvus:db", "documents")
+        local.add([0], [{"chunk_text": "toggle lamp", "doc_id": "a"}])
+        milvus.add([0], [{"chunk_text": "open door", "doc_id": "b"}])
+        assert local is not milvus
+        assert [h["entity"]["doc_id"] for h in local.search("lamp", 5)] == ["a"]
+
+        # 另一个进程对同一日志的追加、删除与重写在下次读写时载入
+        other = BM25Index(local.path)
+        other.add([1, 2], [{"chunk_text": "lamp switch", "doc_id": "c"}, {"chunk_text": "lamp color", "doc_id": "d"}])
+        assert {h["id"] for h in local.search("lamp", 5)} == {0, 1, 2}
+        other.delete(ids=[1])
+        assert {h["id"] for h in local.search("lamp", 5)} == {0, 2}
+        other._compact()
+        local.add([3], [{"chunk_text": "lamp timer", "doc_id": "e"}])
+        assert {h["id"] for h in local.search("lamp", 5)} == {0, 2, 3}
+        assert {h["id"] for h in other.search("lamp", 5)} == {0, 2, 3}
+        other.drop()
+        assert local.search("lamp", 5) == []
+    print("[OK] BM25 索引按后端隔离，并载入其他进程的变更")
@@ -0,0 +1,279 @@
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future
+from typing import Optional
+
+import numpy as np
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import RAG
+from utils import quantize
+from utils.chunk_split import iter_split
+from utils.ragdb import RAGDatabase, _doc_lock, chunk_hash, row_bytes
+from utils.vectorstore import DOC_FIELDS
+
+class BulkWriter:
+    """
+    大文档流式写入：边分块边向量化，向量化与写入重叠进行，分块按行数与字节数切成有界批次并行写入。
+
+    同时在途的向量化请求与写入批次数量固定，峰值内存与文档大小无关（每个分块只保留内容哈希用于增量对比）。
+    向量化与写入在 RAGDatabase 的共享线程池中进行。文档经 RAGDatabase._commit_document 在全部批次写入后
+    一次提交，整篇替换时旧分块此时才删除；写入失败时删除本次已写入的分块，原文档保持不变。
+
+    指定 offline_dir 时不写入向量库，而是按批次写出 Milvus 批量导入 (bulk import) 所需的 NumPy 列式文件：
+    offline_dir/<数据表>/<批次>/<字段>.npy，并在 offline_dir/<数据表>/manifest.jsonl 中逐行记录每个批次的文件，
+    schema.json 记录建表参数。导入后分块 ID 由 Milvus 分配，因此只登记文档元数据、不登记分块，
+    之后对同一文档的在线写入会按 doc_id 整篇替换。已登记的文档不能离线写出，否则导入后与旧分块重复，
+    需先删除该文档或改为在线写入。
+
+    :param database: 目标数据库
+    :param table: 数据表（共享布局下为文档集）
+    :param batch_rows: 单批最多行数
+    :param batch_bytes: 单批估算字节数上限
+    :param embed_concurrency: 同时进行的向量化请求数
+    :param flush_workers: 同时写入的批次数
+    :param offline_dir: 离线批量导入文件的输出目录，None 表示直接写入向量库
+    """
+    def __init__(
+            self,
+            database: RAGDatabase,
+            table: Optional[str] = None,
+            batch_rows: int = RAG["insert_batch_rows"],
+            batch_bytes: int = RAG["insert_batch_bytes"],
+            embed_concurrency: int = 4,
+            flush_workers: int = RAG["insert_workers"],
+            offline_dir: Optional[str] = None
+        ):
+        self.database = database
+        self.table = table
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.embed_concurrency = embed_concurrency
+        self.flush_workers = flush_workers
+        self.offline_dir = offline_dir
+        self._manifest_lock = threading.Lock()
+
+    def write(
+            self,
+            title: str,
+            content,
+            source: Optional[str] = None,
+            description: Optional[str] = None,
+            doc_id: Optional[str] = None
+        ) -> dict:
+        """
+        流式写入一个文档，语义与 RAGDatabase.insert_data 相同（增量更新）。
+
+        :param content: 文档正文，可以是字符串、字节、文件对象或 mmap，逐行读取
+        :return: {"added", "removed", "kept", "batches"}
+        """
+        db = self.database
+        doc_id = db._doc_id(title, self.table, doc_id)
+        with _doc_lock(db.name, doc_id):
+            target = db._prepare(title, source, description, self.table, doc_id)
+            if self.offline_dir:
+                if db.meta.get(doc_id) is not None:
+                    raise ValueError(
+                        f"document {doc_id} already exists; delete it or write it online instead of offline bulk import"
+                    )
+            else:
+                db._table_create(target["collection"])
+            state = _WriteState(target)
+            try:
+                self._stream(state, iter_split(content))
+            except BaseException:
+                self._rollback(state)
+                raise
+            self._finish(state)
+
+        existing = target["existing"]
+        stats = {
+            "added": len(state.added),
+            "removed": len(state.removed),
+            "kept": sum(1 for h in state.seen if h in existing),
+            "batches": state.batches
+        }
+        print(
+            f"[OK] 文档 {doc_id} 已{'写出' if self.offline_dir else '写入'} {target['collection']} 数据表："
+            f"新增 {stats['added']} 条，删除 {stats['removed']} 条，保留 {stats['kept']} 条，共 {stats['batches']} 批"
+        )
+        return stats
+
+    def _stream(self, state: "_WriteState", chunks):
+        embedder = self.database.embedder
+        pending: list[tuple[str, str]] = []
+        for chunk_text in chunks:
+            h = chunk_hash(chunk_text)
+            if h in state.seen:
+                continue
+            state.seen.add(h)
+            if h in state.target["existing"]:
+                continue
+            pending.append((h, chunk_text))
+            if len(pending) >= embedder.batch_size:
+                self._submit_embed(state, pending)
+                pending = []
+        if pending:
+            self._submit_embed(state, pending)
+        while state.embeds:
+            self._collect_embed(state)
+        if state.rows:
+            self._submit_flush(state)
+        while state.flushes:
+            self._collect_flush(state)
+
+    def _submit_embed(self, state: "_WriteState", items: list[tuple[str, str]]):
+        # 在途请求已满时先等待最早的请求，形成背压
+        while len(state.embeds) >= self.embed_concurrency:
+            self._collect_embed(state)
+        future = self.database._executor().submit(self.database.embedder.embed_batch, [text for _, text in items])
+        state.embeds.append((future, items))
+
+    def _collect_embed(self, state: "_WriteState"):
+        future, items = state.embeds.popleft()
+        info = state.target["info"]
+        for (h, text), embedding in zip(items, future.result()):
+            row = {
+                "chunk_text": text,
+                "embedding": embedding,
+                "doc_id": state.target["doc_id"],
+                "title": info["title"],
+                "source": info["source"] or "",
+                "doc_set": info["doc_set"]
+            }
+            cost = row_bytes(row)
+            if state.rows and (len(state.rows) >= self.batch_rows or state.size + cost > self.batch_bytes):
+                self._submit_flush(state)
+            state.rows.append(row)
+            state.hashes.append(h)
+            state.size += cost
+
+    def _submit_flush(self, state: "_WriteState"):
+        while len(state.flushes) >= self.flush_workers:
+            self._collect_flush(state)
+        rows, hashes = state.rows, state.hashes
+        state.rows, state.hashes, state.size = [], [], 0
+        if self.offline_dir:
+            future = self.database._executor().submit(self._write_files, state.target, rows)
+        else:
+            future = self.database._executor().submit(self.database._insert_batch, state.target["collection"], rows)
+        state.flushes.append((future, hashes))
+        state.batches += 1
+
+    def _collect_flush(self, state: "_WriteState"):
+        future, hashes = state.flushes.popleft()
+        ids = future.result()
+        state.added.update(zip(hashes, ids if ids is not None else [None] * len(hashes)))
+
+    def _rollback(self, state: "_WriteState"):
+        """
+        等待在途批次结束，并删除本次已写入的分块。
+        """
+        for future, _ in state.embeds:
+            future.cancel()
+        for future, hashes in state.flushes:
+            try:
+                state.added.update(zip(hashes, future.result() or []))
+            except Exception:
+                pass
+        if self.offline_dir:
+            return
+        try:
+            self.database._discard(state.target["collection"], [i for i in state.added.values() if i is not None])
+        except Exception as e:
+                print(f"[ERROR] 回滚 {state.target['doc_id']} 已写入的分块失败:", e)
+
+    def _finish(self, state: "_WriteState"):
+        target = state.target
+        existing = target["existing"]
+        stale = [h for h in existing if h not in state.seen]
+        state.removed = target["removed"] = target["stale"] + stale
+        target["removed_ids"] = [existing[h] for h in stale]
+        self.database._commit_document(target, {} if self.offline_dir else state.added)
+
+    def _write_files(self, target: dict, rows: list[dict]) -> None:
+        """
+        将一个批次写为 Milvus NumPy 批量导入格式：每个字段一个 .npy 文件，向量字段为二维数组。
+        """
+        collection = target["collection"]
+        root = os.path.join(self.offline_dir, collection)
+        batch = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        path = os.path.join(root, batch)
+        os.makedirs(path, exist_ok=True)
+        vector_type, binary = RAG["vector_type"], RAG["binary_prefilter"]
+        vectors = np.asarray([row["embedding"] for row in rows], dtype=np.float32)
+        columns = {"chunk_text": np.asarray([row["chunk_text"] for row in rows], dtype=str)}
+        if self.database.layout == "shared":
+            for field in DOC_FIELDS:
+                columns[field] = np.asarray([row[field] for row in rows], dtype=str)
+        else:
+            # 旧布局的 schema 没有文档字段，作为动态字段写入 $meta
+            columns["$meta"] = np.asarray([
+                json.dumps({field: row[field] for field in DOC_FIELDS}, ensure_ascii=False) for row in rows
+            ], dtype=str)
+        if vector_type == "float32":
+            columns["embedding"] = vectors
+        else:
+            normalized = quantize.normalize(vectors)
+            # 未安装 ml_dtypes 时没有 bfloat16 数组类型，Milvus 导入时会将 float32 转为 bfloat16
+            columns["embedding"] = normalized if vector_type == "bfloat16" else quantize.encode(normalized, vector_type)
+        if binary:
+            columns["binary_code"] = quantize.binary_codes(vectors)
+        files = []
+        for field, column in columns.items():
+            np.save(os.path.join(path, field + ".npy"), column)
+            files.append(os.path.join(collection, batch, field + ".npy"))
+        with self._manifest_lock:
+            schema_path = os.path.join(root, "schema.json")
+            if not os.path.exists(schema_path):
+                with open(schema_path, "w", encoding="utf-8") as f:
+                    json.dump({
+                        "collection": collection,
+                        "dim": vectors.shape[1],
+                        "vector_type": vector_type,
+                        "binary": binary,
+                        "partition_key": "doc_id" if self.database.layout == "shared" else None
+                    }, f, ensure_ascii=False, indent=2)
+            with open(os.path.join(root, "manifest.jsonl"), "a", encoding="utf-8") as f:
+                f.write(json.dumps({"doc_id": target["doc_id"], "rows": len(rows), "files": files}, ensure_ascii=False) + "\n")
+        return None
+
+class _WriteState:
+    __slots__ = ("target", "seen", "embeds", "rows", "hashes", "size", "flushes", "added", "removed", "batches")
+
+    def __init__(self, target: dict):
+        self.target = target
+        self.seen: set[str] = set()
+        self.embeds: deque[tuple[Future, list[tuple[str, str]]]] = deque()
+        self.rows: list[dict] = []
+        self.hashes: list[str] = []
+        self.size = 0
+        self.flushes: deque[tuple[Future, list[str]]] = deque()
+        self.added: dict[str, int | None] = {}
+        self.removed: list[str] = []
+        self.batches = 0
+
+if __name__ == "__main__":
+    import argparse
+    import tracemalloc
+
+    parser = argparse.ArgumentParser(description="流式写入单个大文档，或写出 Milvus 批量导入文件")
+    parser.add_argument("path", help="Markdown 文档路径")
+    parser.add_argument("--table", default=None, help="数据表 / 文档集名称")
+    parser.add_argument("--title", default=None, help="文档标题，默认取文件名")
+    parser.add_argument("--offline-dir", default=None, help="写出批量导入文件的目录，不写入向量库")
+    args = parser.parse_args()
+
+    title = args.title or os.path.splitext(os.path.basename(args.path))[0]
+    tracemalloc.start()
+    start = time.perf_counter()
+    writer = BulkWriter(RAGDatabase(), args.table, offline_dir=args.offline_dir)
+    with open(args.path, "r", encoding="utf-8") as f:
+        stats = writer.write(title, f, source=args.path)
+    _, peak = tracemalloc.get_traced_memory()
+    print(f"[OK] {stats}，用时 {time.perf_counter() - start:.2f} 秒，Python 峰值内存 {peak / 1024 / 1024:.1f} MB")
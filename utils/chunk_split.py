@@ -1,4 +1,135 @@
-from langchain_text_splitters import MarkdownHeaderTextSplitter, RecursiveCharacterTextSplitter
+import mmap
+from functools import lru_cache
+from typing import Iterable, Iterator
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+# 标题最多 6 级，与 MarkdownHeaderTextSplitter 的 headers_to_split_on 一致
+MAX_HEADER_LEVEL = 6
+CHUNK_OVERLAP = 30
+
+@lru_cache(maxsize=None)
+def _text_splitter(max_chunk_size: int) -> RecursiveCharacterTextSplitter:
+    """
+    按块大小复用的递归字符切分器，split_text 无状态，可跨线程共享。
+    """
+    return RecursiveCharacterTextSplitter(chunk_size=max_chunk_size, chunk_overlap=CHUNK_OVERLAP)
+
+def _lines(source: str | bytes | Iterable[str] | Iterable[bytes] | mmap.mmap) -> Iterator[str]:
+    """
+    逐行读取输入，行尾不含换行符；字节输入按 UTF-8 解码。
+
+    与 text.split("\\n") 的结果一致：输入以换行结尾时最后额外产生一个空行。
+    """
+    if isinstance(source, str):
+        yield from source.split("\n")
+        return
+    if isinstance(source, (bytes, bytearray)):
+        yield from source.decode("utf-8").split("\n")
+        return
+    if isinstance(source, mmap.mmap):
+        source = iter(source.readline, b"")
+    line = ""
+    for line in source:
+        if isinstance(line, (bytes, bytearray)):
+            line = line.decode("utf-8")
+        yield line[:-1] if line.endswith("\n") else line
+    if line == "" or line.endswith("\n"):
+        yield ""
+
+def _sections(lines: Iterable[str]) -> Iterator[tuple[tuple[tuple[int, str], ...], str]]:
+    """
+    按 Markdown 标题切分，逐段产出 ((标题级别, 标题), ...) 路径与正文，行为与
+    MarkdownHeaderTextSplitter(strip_headers=True) 逐行一致：
+    代码块内原样保留（去除首尾空白），空行分隔的段落以 "  \\n" 连接，
+    标题路径相同的相邻段落合并。
+    """
+    stack: list[tuple[int, str]] = []
+    headers: tuple[tuple[int, str], ...] = ()
+    current: list[str] = []
+    current_headers: tuple[tuple[int, str], ...] = ()
+    pending: list[str] = []
+    pending_headers: tuple[tuple[int, str], ...] | None = None
+    in_code_block = False
+    opening_fence = ""
+
+    def flush():
+        # 当前段落收尾，标题路径与上一段相同时合并，否则先产出上一段
+        nonlocal pending_headers
+        content = "\n".join(current)
+        current.clear()
+        if pending_headers == current_headers:
+            pending.append(content)
+            return None
+        section = (pending_headers, "  \n".join(pending)) if pending_headers is not None else None
+        pending.clear()
+        pending.append(content)
+        pending_headers = current_headers
+        return section
+
+    for line in lines:
+        stripped = line.strip()
+        if not stripped.isprintable():
+            stripped = "".join(filter(str.isprintable, stripped))
+        if not in_code_block:
+            if stripped.startswith("```") and stripped.count("```") == 1:
+                in_code_block = True
+                opening_fence = "```"
+            elif stripped.startswith("~~~"):
+                in_code_block = True
+                opening_fence = "~~~"
+        elif stripped.startswith(opening_fence):
+            in_code_block = False
+            opening_fence = ""
+
+        if in_code_block:
+            current.append(stripped)
+            continue
+
+        level = len(stripped) - len(stripped.lstrip("#"))
+        if 0 < level <= MAX_HEADER_LEVEL and (len(stripped) == level or stripped[level] == " "):
+            while stack and stack[-1][0] >= level:
+                stack.pop()
+            stack.append((level, stripped[level:].strip()))
+            if current:
+                section = flush()
+                if section is not None:
+                    yield section
+            headers = tuple(stack)
+        elif stripped:
+            current.append(stripped)
+        elif current:
+            section = flush()
+            if section is not None:
+                yield section
+        current_headers = headers
+
+    if current:
+        section = flush()
+        if section is not None:
+            yield section
+    if pending_headers is not None:
+        yield pending_headers, "  \n".join(pending)
+
+def iter_split(
+        source: str | bytes | Iterable[str] | Iterable[bytes] | mmap.mmap,
+        max_chunk_size: int = 500
+    ) -> Iterator[str]:
+    """
+    流式语义切分：逐行读取文本、文件对象（文本或二进制）或 mmap，按标题分段后
+    切成不超过 max_chunk_size 的片段，并逐个产出带标题路径前缀的片段。
+
+    结果与 semantic_split(完整文本) 完全一致，但无需一次性载入全文。
+    """
+    splitter = _text_splitter(max_chunk_size)
+    prefixes: dict[tuple[tuple[int, str], ...], str] = {}
+    for headers, content in _sections(_lines(source)):
+        prefix = prefixes.get(headers)
+        if prefix is None:
+            # 前缀的 # 数按路径深度而非标题级别，与原实现一致
+            prefix = prefixes[headers] = "".join("#" * (i + 1) + h for i, (_, h) in enumerate(headers)) + "\n"
+        for piece in splitter.split_text(content):
+            yield prefix + piece
 
 def semantic_split(text: str, max_chunk_size: int = 500) -> list[str]:
     """
@@ -6,41 +137,68 @@ def semantic_split(text: str, max_chunk_size: int = 500) -> list[str]:
     """
     if not text:
         return []
-
-    # 首先按标题进行初步切分
-    headers_to_split_on = [
-        ("#", "Header 1"),
-        ("##", "Header 2"),
-        ("###", "Header 3"),
-        ("####", "Header 4"),
-        ("#####", "Header 5"),
-        ("######", "Header 6")
-    ]
-    markdown_splitter = MarkdownHeaderTextSplitter(headers_to_split_on)
-    md_header_splits = markdown_splitter.split_text(text)
-    
-    chunk_overlap = 30
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=max_chunk_size, chunk_overlap=chunk_overlap)
-    splits = text_splitter.split_documents(md_header_splits)
-
-    chunks = []
-    for split in splits:
-        header = ""
-        for i, h in enumerate(split.metadata.items()):
-            header += "#"*(i+1) + h[1]
-        chunk = header + "\n" + split.page_content
-        chunks.append(chunk)
-
-    return chunks
+    return list(iter_split(text, max_chunk_size))
 
 if __name__ == "__main__":
+    import io
     import os
+    import tempfile
+    import time
+    from langchain_text_splitters import MarkdownHeaderTextSplitter
+
+    def reference_split(text: str, max_chunk_size: int = 500) -> list[str]:
+        # 原实现，作为等价性基准
+        if not text:
+            return []
+        headers_to_split_on = [("#" * i, f"Header {i}") for i in range(1, 7)]
+        md_header_splits = MarkdownHeaderTextSplitter(headers_to_split_on).split_text(text)
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=max_chunk_size, chunk_overlap=CHUNK_OVERLAP)
+        chunks = []
+        for split in text_splitter.split_documents(md_header_splits):
+            header = ""
+            for i, h in enumerate(split.metadata.items()):
+                header += "#"*(i+1) + h[1]
+            chunks.append(header + "\n" + split.page_content)
+        return chunks
+
     current_dir = os.path.dirname(os.path.abspath(__file__))
     data_dir = os.path.join(current_dir, "..", "data")
     with open(os.path.join(data_dir, "deeppath.md"), "r", encoding="utf-8") as f:
         text = f.read()
 
+    cases = [
+        text,
+        text.replace("\n", "\r\n"),
+        "前言，没有标题\n\n# A\n正文\n\n第二段\n## B\n```python\n# 不是标题\n\n  x = 1\n```\n# A\n同名标题\n",
+        "#不是标题\n####### 七级\n#\n## \n~~~\n~~~ 结束\n```inline``` 代码\n### C\n\x00\x07 控制字符\n",
+        "# 只有标题\n## 也只有标题\n",
+        "## \n二级空标题\n# \n一级空标题，与上一段标题文本相同但级别不同\n",
+        "# A\n```\n未闭合的代码块\n\n",
+        "\n\n\n",
+        "# 长文\n" + ("很长的一段话，" * 400 + "\n\n") * 3,
+    ]
+    for case in cases:
+        for size in (100, 500, 1000):
+            expected = reference_split(case, size)
+            assert semantic_split(case, size) == expected, (case[:40], size)
+            assert list(iter_split(io.StringIO(case, newline=""), size)) == expected
+            assert list(iter_split(io.BytesIO(case.encode("utf-8")), size)) == expected
+            if case:
+                with tempfile.TemporaryFile() as f:
+                    f.write(case.encode("utf-8"))
+                    f.flush()
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                        assert list(iter_split(mm, size)) == expected
+    print(f"[OK] 等价性检查通过：{len(cases)} 组输入 x 3 种块大小 x 4 种输入方式")
+
+    corpus = text * 50
+    rounds = 5
+    for name, fn in (("reference", reference_split), ("semantic_split", semantic_split)):
+        t = time.perf_counter()
+        for _ in range(rounds):
+            fn(corpus)
+        elapsed = (time.perf_counter() - t) / rounds
+        print(f"[OK] {name}: {len(corpus) / 1024:.0f} KB 用时 {elapsed * 1000:.1f} ms，{len(corpus) / 1024 / 1024 / elapsed:.2f} MB/s")
+
     chunks = semantic_split(text, max_chunk_size=500)
     print(f"Total chunks: {len(chunks)}")
-    for i, chunk in enumerate(chunks):
-        print(f"\n\nChunk {i+1}: {chunk}")
\ No newline at end of file
@@ -0,0 +1,338 @@
+import atexit
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import EMBEDDING
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+class _FileLock:
+    """
+    跨进程互斥锁（POSIX flock / Windows msvcrt.locking），保护缓存槽位分配与 mmap 扩容。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._fd = None
+
+    def __enter__(self):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT)
+        if os.name == "nt":
+            while True:
+                try:
+                    msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 最多重试 10 秒，超时后继续等待
+                    continue
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if os.name == "nt":
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None
+
+class EmbeddingCache:
+    """
+    基于内容寻址的磁盘向量缓存，可被多个进程同时使用。
+
+    每个模型一个目录：vectors.f32 为可 mmap 的 float32 矩阵，index.sqlite（WAL 模式）记录
+    文本哈希 -> 行号与最近访问时间。写入只提交本批新增的索引行；访问时间先记在内存中，
+    累计 touch_batch 条或调用 flush 时批量写回。超过 max_entries 时淘汰最久未使用的条目并复用其行。
+
+    槽位分配与扩容在跨进程文件锁内进行；复用槽位时先提交删除旧条目、再写向量、最后提交新条目，
+    读取方拷贝向量后重新核对索引，槽位已被改写的条目按未命中处理，不会返回错误的向量。
+    """
+    def __init__(
+            self,
+            model_name: str,
+            path: str = EMBEDDING["cache_dir"],
+            max_entries: int = EMBEDDING["cache_size"],
+            touch_batch: int = 1024
+        ):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.touch_batch = touch_batch
+        self.dir = os.path.join(path, model_name.replace("/", "__"))
+        self.vec_path = os.path.join(self.dir, "vectors.f32")
+        self.index_path = os.path.join(self.dir, "index.sqlite")
+        os.makedirs(self.dir, exist_ok=True)
+
+        self.dim = None
+        self.capacity = 0
+        self.vectors = None
+        self.hits = 0
+        self.misses = 0
+        # 待写回的访问时间 {哈希: 时间}
+        self._touched: dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._file_lock = _FileLock(os.path.join(self.dir, "alloc.lock"))
+
+        self.conn = sqlite3.connect(self.index_path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self._file_lock:
+            created = self.conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'entries'"
+            ).fetchone() is None
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL UNIQUE, accessed REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS info (name TEXT PRIMARY KEY, value INTEGER)")
+            self.conn.commit()
+            if created:
+                self._migrate(os.path.join(self.dir, "index.json"))
+        self._remap()
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _info(self) -> dict:
+        return dict(self.conn.execute("SELECT name, value FROM info").fetchall())
+
+    def _set_info(self, **values):
+        self.conn.executemany("INSERT OR REPLACE INTO info (name, value) VALUES (?, ?)", list(values.items()))
+
+    def _migrate(self, legacy_path: str):
+        """
+        导入旧版 index.json（LRU 顺序的 [哈希, 行号] 列表）。
+        """
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            entries = meta["entries"]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, slot, accessed) VALUES (?, ?, ?)",
+                    [(key, slot, float(i)) for i, (key, slot) in enumerate(entries)]
+                )
+                self._set_info(
+                    dim=meta["dim"], capacity=meta["capacity"],
+                    next_slot=max((slot for _, slot in entries), default=-1) + 1
+                )
+            print(f"[OK] 已从 {legacy_path} 导入 {len(entries)} 条向量缓存索引")
+        except Exception as e:
+            print(f"[ERROR] 导入 {legacy_path} 失败:", e)
+
+    def _remap(self):
+        """
+        按索引中的维度与容量重新映射向量文件；其他进程扩容后调用。
+        """
+        info = self._info()
+        self.dim = info.get("dim")
+        capacity = info.get("capacity", 0)
+        if self.dim and capacity and capacity != self.capacity:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self.vectors = np.memmap(self.vec_path, dtype=np.float32, mode="r+", shape=(capacity, self.dim))
+            self.capacity = capacity
+
+    def _grow(self, dim: int, needed: int):
+        """
+        按倍增扩容 mmap 文件，直到 max_entries。需持有文件锁。
+        """
+        if self.dim is None:
+            self.dim = dim
+        new_capacity = min(self.max_entries, max(1024, self.capacity * 2, needed))
+        if self.vectors is not None:
+            self.vectors.flush()
+            self.vectors = None
+        with open(self.vec_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        with self.conn:
+            self._set_info(dim=self.dim, capacity=new_capacity)
+        self.capacity = 0
+        self._remap()
+
+    def _lookup(self, keys: list[str]) -> dict[str, int]:
+        found = {}
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({', '.join('?' * len(part))})", part
+            )
+            found.update(rows)
+        return found
+
+    def get(self, text: str) -> list | None:
+        return self.get_many([text])[0]
+
+    def get_many(self, texts: list[str]) -> list[list | None]:
+        keys = [self.key(text) for text in texts]
+        results: list[list | None] = [None] * len(texts)
+        with self._lock:
+            slots = self._lookup(list(dict.fromkeys(keys)))
+            if slots and max(slots.values()) >= self.capacity:
+                self._remap()
+            copied = {key: self.vectors[slot].tolist() for key, slot in slots.items() if slot < self.capacity}
+            if copied:
+                # 拷贝期间槽位可能被其他进程复用，核对后才算命中
+                current = self._lookup(list(copied))
+                copied = {key: vec for key, vec in copied.items() if current.get(key) == slots[key]}
+            now = time.time()
+            for i, key in enumerate(keys):
+                vector = copied.get(key)
+                if vector is None:
+                    self.misses += 1
+                    continue
+                self.hits += 1
+                self._touched[key] = now
+                results[i] = vector
+            if len(self._touched) >= self.touch_batch:
+                self._write_touched()
+        return results
+
+    def put(self, text: str, vector: list):
+        self.put_many([text], [vector])
+
+    def put_many(self, texts: list[str], vectors: list[list]):
+        items = {}
+        for text, vector in zip(texts, vectors):
+            if self.dim is not None and len(vector) != self.dim:
+                continue
+            items.setdefault(self.key(text), vector)
+        if not items:
+            return
+        with self._lock, self._file_lock:
+            self._remap()
+            existing = self._lookup(list(items))
+            now = time.time()
+            for key in existing:
+                self._touched[key] = now
+            new = [key for key in items if key not in existing][:self.max_entries]
+            if not new:
+                return
+            info = self._info()
+            next_slot = info.get("next_slot", 0)
+            fresh = min(len(new), self.max_entries - next_slot)
+            if next_slot + fresh > self.capacity:
+                self._grow(len(items[new[0]]), next_slot + fresh)
+            slots = list(range(next_slot, next_slot + fresh))
+            if len(slots) < len(new):
+                # 已满：淘汰最久未使用的条目，先提交删除再改写其向量
+                self._write_touched()
+                evicted = self.conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY accessed LIMIT ?", (len(new) - len(slots),)
+                ).fetchall()
+                with self.conn:
+                    self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in evicted])
+                slots += [slot for _, slot in evicted]
+            new = new[:len(slots)]
+            for key, slot in zip(new, slots):
+                self.vectors[slot] = items[key]
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO entries (key, slot, accessed) VALUES (?, ?, ?)",
+                    [(key, slot, now) for key, slot in zip(new, slots)]
+                )
+                self._set_info(next_slot=next_slot + fresh)
+
+    def _write_touched(self):
+        if not self._touched:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE entries SET accessed = max(accessed, ?) WHERE key = ?",
+                [(t, key) for key, t in self._touched.items()]
+            )
+        self._touched.clear()
+
+    def flush(self):
+        """
+        将向量与待写回的访问时间落盘；新增条目在写入时已提交，进程退出时自动调用。
+        """
+        with self._lock:
+            if self.vectors is not None:
+                self.vectors.flush()
+            self._write_touched()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+            "max_entries": self.max_entries
+        }
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self.conn.close()
+
+_caches: dict[str, EmbeddingCache] = {}
+_caches_lock = threading.Lock()
+
+def get_embedding_cache(model_name: str) -> EmbeddingCache:
+    """
+    获取进程内共享的模型向量缓存，退出时自动落盘。
+    """
+    with _caches_lock:
+        cache = _caches.get(model_name)
+        if cache is None:
+            cache = EmbeddingCache(model_name)
+            atexit.register(cache.flush)
+            _caches[model_name] = cache
+        return cache
+
+if __name__ == "__main__":
+    import multiprocessing
+    import tempfile
+
+    def worker(path: str, offset: int, count: int):
+        cache = EmbeddingCache("test", path, max_entries=1500)
+        for start in range(0, count, 50):
+            texts = [f"text-{offset + i}" for i in range(start, start + 50)]
+            cache.put_many(texts, [[float(offset + i)] * 8 for i in range(start, start + 50)])
+            # 读回自己刚写入的条目：要么未命中（已被其他进程淘汰），要么必须是正确的向量
+            for text, vector in zip(texts, cache.get_many(texts)):
+                assert vector is None or vector[0] == float(text.split("-")[1]), (text, vector[0])
+        cache.close()
+
+    with tempfile.TemporaryDirectory() as path:
+        # 单条写入的耗时不随缓存规模增长
+        cache = EmbeddingCache("bench", path, max_entries=200000)
+        cache.put_many([f"warm-{i}" for i in range(100000)], np.zeros((100000, 1024), dtype=np.float32).tolist())
+        rounds = 100
+        start = time.perf_counter()
+        for i in range(rounds):
+            cache.put(f"query-{i}", [0.0] * 1024)
+        print(f"[OK] 10 万条缓存下单条写入用时 {(time.perf_counter() - start) / rounds * 1000:.2f} ms")
+        cache.close()
+
+        # 多进程同时写入并淘汰，任何进程都不会读到其他文本的向量
+        processes = [multiprocessing.Process(target=worker, args=(path, p * 10000, 1000)) for p in range(4)]
+        for p in processes:
+            p.start()
+        for p in processes:
+            p.join()
+        assert all(p.exitcode == 0 for p in processes)
+        cache = EmbeddingCache("test", path, max_entries=1500)
+        rows = cache.conn.execute("SELECT key, slot FROM entries").fetchall()
+        assert len(rows) == 1500 and len({slot for _, slot in rows}) == 1500
+        texts = [f"text-{p * 10000 + i}" for p in range(4) for i in range(1000)]
+        for text, vector in zip(texts, cache.get_many(texts)):
+            assert vector is None or vector[0] == float(text.split("-")[1])
+        print(f"[OK] 4 个进程并发写入 4000 条（容量 1500），槽位无冲突，命中 {cache.stats()['hits']} 条均正确")
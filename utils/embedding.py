@@ -4,29 +4,215 @@ import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from config import EMBEDDING
+from utils.embed_cache import EmbeddingCache, get_embedding_cache
+from utils.retry import is_retryable
+from utils import transport
+
+# 常用向量模型的输出维度，已知维度时无需发起探测请求
+MODEL_DIMS = {
+    "BAAI/bge-m3": 1024,
+    "BAAI/bge-large-zh-v1.5": 1024,
+    "BAAI/bge-large-en-v1.5": 1024,
+    "BAAI/bge-base-zh-v1.5": 768,
+    "BAAI/bge-base-en-v1.5": 768,
+    "BAAI/bge-small-zh-v1.5": 512,
+    "netease-youdao/bce-embedding-base_v1": 768,
+    "Qwen/Qwen3-Embedding-0.6B": 1024,
+    "Qwen/Qwen3-Embedding-4B": 2560,
+    "Qwen/Qwen3-Embedding-8B": 4096,
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}
+
+def model_dim(model_name: str) -> int | None:
+    """
+    不发请求确定模型的向量维度：优先取 EMBEDDING_DIM 配置，其次查 MODEL_DIMS，未知时返回 None。
+    """
+    return EMBEDDING["dim"] or MODEL_DIMS.get(model_name)
+
+def estimate_tokens(text: str) -> int:
+    """
+    粗略估算文本的 token 数：CJK 字符按 1 个 token 计，其余按 4 个字符 1 个 token 计。
+    """
+    cjk = sum(1 for ch in text if "⺀" <= ch <= "鿿" or "가" <= ch <= "힯")
+    return cjk + (len(text) - cjk + 3) // 4 + 1
 
 class EmbeddingModel:
-    def __init__(self):
+    def __init__(
+            self,
+            model_name: str = "BAAI/bge-m3",
+            batch_size: int = EMBEDDING["batch_size"],
+            max_batch_tokens: int = EMBEDDING["max_batch_tokens"],
+            max_retries: int = 2,
+            cache: EmbeddingCache | bool = EMBEDDING["cache"]
+        ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_retries = max_retries
+        if cache is True:
+            cache = get_embedding_cache(model_name)
+        self.cache: EmbeddingCache | None = cache or None
+
+        self._dim = model_dim(model_name)
+
         self.url = EMBEDDING["url"]
         self.header = {
                         "Authorization": f"Bearer {EMBEDDING['key']}",
                         "Content-Type": "application/json"
                     }
 
-    def embed(self, sentences: str) -> list:
+    @property
+    def dim(self) -> int:
+        """
+        向量维度：配置或模型表中没有时，由缓存中的向量或一次探测请求得到。
+        """
+        if self._dim is None:
+            if self.cache and self.cache.dim:
+                self._dim = self.cache.dim
+            else:
+                self._dim = len(self.embed("test"))
+        return self._dim
+
+    def _request(self, inputs: str | list[str]) -> list[dict]:
         payload = {
-            "model": "BAAI/bge-m3",
-            "input": sentences,
+            "model": self.model_name,
+            "input": inputs,
             "encoding_format": "float"
         }
-        response = requests.request("POST", self.url, json=payload, headers=self.header)
-        vec = response.json()
-        vec_list = vec["data"][0]["embedding"]
+        response = transport.post(self.url, json=payload, headers=self.header)
+        response.raise_for_status()
+        return response.json()["data"]
+
+    def embed(self, sentences: str) -> list:
+        if self.cache:
+            vec_list = self.cache.get(sentences)
+            if vec_list is not None:
+                return vec_list
+        vec_list = self._request(sentences)[0]["embedding"]
+        if self.cache:
+            self.cache.put(sentences, vec_list)
         return vec_list
 
+    def _pack(self, sentences: list[str]) -> list[list[int]]:
+        """
+        按条数与 token 预算将输入下标分组，每组对应一次请求。
+        """
+        batches = []
+        current, budget = [], 0
+        for i, text in enumerate(sentences):
+            tokens = estimate_tokens(text)
+            if current and (len(current) >= self.batch_size or budget + tokens > self.max_batch_tokens):
+                batches.append(current)
+                current, budget = [], 0
+            current.append(i)
+            budget += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _embed_group(self, texts: list[str]) -> list[list]:
+        """
+        对一组文本发起一次请求。连接错误、超时、429 与 5xx 属于服务故障，最多重试 max_retries 次，
+        仍失败则整批失败；其余 4xx 与条数不符等错误可能由个别输入（如超长）引起，对半拆分定位。
+        """
+        error = None
+        for _ in range(self.max_retries + 1):
+            try:
+                data = self._request(texts)
+                if len(data) != len(texts):
+                    raise ValueError(f"expected {len(texts)} embeddings, got {len(data)}")
+                # 按返回的 index 还原输入顺序
+                data = sorted(data, key=lambda d: d.get("index", 0))
+                return [d["embedding"] for d in data]
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                error = e
+                if not (isinstance(e, requests.exceptions.RequestException) and is_retryable(e)):
+                    break
+        else:
+            raise RuntimeError(f"Embedding service unavailable: {error}")
+        if len(texts) == 1:
+            raise RuntimeError(f"Embedding request failed: {error}")
+        mid = len(texts) // 2
+        return self._embed_group(texts[:mid]) + self._embed_group(texts[mid:])
+
+    def embed_batch(self, sentences: list[str]) -> list[list]:
+        """
+        批量向量化，按 batch_size 与 max_batch_tokens 打包请求，输出顺序与输入一致。
+        """
+        vectors = self.cache.get_many(sentences) if self.cache else [None] * len(sentences)
+        missing = [i for i, vec in enumerate(vectors) if vec is None]
+        for batch in self._pack([sentences[i] for i in missing]):
+            batch = [missing[j] for j in batch]
+            embeddings = self._embed_group([sentences[i] for i in batch])
+            for i, vec in zip(batch, embeddings):
+                vectors[i] = vec
+            if self.cache:
+                self.cache.put_many([sentences[i] for i in batch], embeddings)
+        return vectors
+
+def _check_failures():
+    """
+    服务故障 (5xx) 时整批只发 max_retries + 1 次请求；个别输入被拒 (400) 时对半拆分定位到该条。
+    """
+    import json
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    state = {"status": 200, "requests": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            inputs = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+            state["requests"] += 1
+            status = state["status"]
+            if status == 200 and any("超长" in text for text in inputs):
+                status = 400
+            body = json.dumps({"data": [{"index": i, "embedding": [1.0, 0.0]} for i in range(len(inputs))]})
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body.encode("utf-8"))
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        model = EmbeddingModel(batch_size=32, cache=False)
+        model.url = f"http://127.0.0.1:{server.server_port}/"
+        texts = [f"第 {i} 段" for i in range(32)]
+
+        state["status"] = 503
+        try:
+            model.embed_batch(texts)
+            raise AssertionError("expected RuntimeError")
+        except RuntimeError:
+            pass
+        assert state["requests"] == model.max_retries + 1, state
+
+        state.update(status=200, requests=0)
+        texts[5] = "超长输入"
+        try:
+            model.embed_batch(texts)
+            raise AssertionError("expected RuntimeError")
+        except RuntimeError as e:
+            assert "400" in str(e), e
+        # 32 -> 16 -> 8 -> 4 (成功) + 4 -> 2 -> 1 (成功) + 1，定位到该条即停止
+        assert state["requests"] == 8, state
+    finally:
+        server.shutdown()
+    print(f"[OK] 服务故障时整批 {model.max_retries + 1} 次请求后失败，个别输入被拒时拆分定位")
+
 if __name__ == "__main__":
+    _check_failures()
+
     sentences = "This is an example sentence"
     embedding_model = EmbeddingModel()
     embeddings = embedding_model.embed(sentences)
     print(len(embeddings))
-
+    batch = embedding_model.embed_batch([sentences, "另一个例子", "A third one"])
+    print([len(v) for v in batch])
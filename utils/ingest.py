@@ -0,0 +1,316 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from utils.chunk_split import semantic_split
+from utils.ragdb import RAGDatabase
+
+_DONE = object()
+
+def iter_markdown(root: str, pattern: str = ".md") -> Iterable[dict]:
+    """
+    遍历目录下的文档文件，生成待入库条目；文件名作为标题，相对路径作为来源与文档 ID。
+    """
+    for dirpath, _, filenames in sorted(os.walk(root)):
+        for filename in sorted(filenames):
+            if not filename.endswith(pattern):
+                continue
+            path = os.path.join(dirpath, filename)
+            relpath = os.path.relpath(path, root)
+            yield {
+                "path": path,
+                "title": os.path.splitext(filename)[0],
+                "source": relpath,
+                "doc_id": os.path.splitext(relpath)[0].replace(os.sep, "_").replace(" ", "_")
+            }
+
+class _Doc:
+    __slots__ = ("item", "key", "plan", "texts", "vectors", "pending")
+
+    def __init__(self, item: dict, key: str):
+        self.item = item
+        self.key = key
+        self.plan = None
+        self.texts: list[str] = []
+        self.vectors: list = []
+        self.pending = 0
+
+class IngestPipeline:
+    """
+    流式批量入库：读取 -> 分块（进程池）-> 向量化（跨文档合批，限制并发）-> 批量写入。
+
+    各阶段之间为有界队列，下游变慢时上游自动等待；每个文档写入完成后记入检查点，
+    中断后重新运行会跳过已完成的文档。文档按 RAGDatabase 的增量语义写入，未变化的分块不会重新向量化。
+
+    :param database: 目标数据库
+    :param table: 数据表（共享布局下为文档集）
+    :param split_workers: 分块进程数，0 表示在线程中分块
+    :param embed_concurrency: 同时进行的向量化请求数
+    :param queue_size: 阶段间队列长度
+    :param insert_batch: 单次写入的最大分块数
+    :param checkpoint: 检查点文件路径，None 表示不记录
+    :param report_every: 进度报告间隔秒数
+    """
+    def __init__(
+            self,
+            database: RAGDatabase,
+            table: Optional[str] = None,
+            split_workers: int = os.cpu_count() or 1,
+            embed_concurrency: int = 8,
+            queue_size: int = 64,
+            insert_batch: int = 512,
+            checkpoint: Optional[str] = None,
+            report_every: float = 5.0
+        ):
+        self.database = database
+        self.table = table
+        self.split_workers = split_workers
+        self.embed_concurrency = embed_concurrency
+        self.queue_size = queue_size
+        self.insert_batch = insert_batch
+        self.checkpoint = checkpoint
+        self.report_every = report_every
+        self.done: dict[str, str] = {}
+        self.stats = {
+            "files": 0, "skipped": 0, "failed": 0,
+            "chunks": 0, "added": 0, "removed": 0, "embed_requests": 0
+        }
+        if checkpoint and os.path.exists(checkpoint):
+            with open(checkpoint, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self.done[record["doc_id"]] = record["key"]
+
+    @staticmethod
+    def _key(item: dict) -> str:
+        """
+        文档版本标识：文件取修改时间与大小，直接给出的正文取内容哈希。
+        """
+        if "path" in item:
+            stat = os.stat(item["path"])
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+        return hashlib.sha256(item["content"].encode("utf-8")).hexdigest()
+
+    def _doc_id(self, item: dict) -> str:
+        return self.database._doc_id(item["title"], self.table, item.get("doc_id"))
+
+    def _mark(self, docs: list[_Doc]):
+        if not self.checkpoint:
+            return
+        os.makedirs(os.path.dirname(os.path.abspath(self.checkpoint)), exist_ok=True)
+        with open(self.checkpoint, "a", encoding="utf-8") as f:
+            for doc in docs:
+                f.write(json.dumps({"doc_id": doc.plan["doc_id"], "key": doc.key}, ensure_ascii=False) + "\n")
+
+    async def _read(self, items: Iterable[dict], out: asyncio.Queue):
+        for item in items:
+            try:
+                key = await asyncio.to_thread(self._key, item)
+                if self.done.get(self._doc_id(item)) == key:
+                    self.stats["skipped"] += 1
+                    continue
+                if "content" not in item:
+                    item = {**item, "content": await asyncio.to_thread(_read_text, item["path"])}
+            except Exception as e:
+                print(f"[ERROR] 读取 {item.get('path') or item.get('title')} 失败:", e)
+                self.stats["failed"] += 1
+                continue
+            await out.put(_Doc(item, key))
+        await out.put(_DONE)
+
+    async def _split(self, pool: ProcessPoolExecutor | None, inp: asyncio.Queue, out: asyncio.Queue):
+        loop = asyncio.get_running_loop()
+        limit = asyncio.Semaphore(max(1, self.split_workers) * 2)
+        tasks = set()
+
+        async def run(doc: _Doc):
+            try:
+                if pool is not None:
+                    chunks = await loop.run_in_executor(pool, semantic_split, doc.item["content"])
+                else:
+                    chunks = await asyncio.to_thread(semantic_split, doc.item["content"])
+                item = doc.item
+                doc.plan = await asyncio.to_thread(
+                    self.database._plan,
+                    item["title"], chunks, item.get("source"), item.get("description"), self.table, item.get("doc_id")
+                )
+                doc.item = None
+                doc.texts = [doc.plan["chunks"][h] for h in doc.plan["new"]]
+                doc.vectors = [None] * len(doc.texts)
+                doc.pending = len(doc.texts)
+                await out.put(doc)
+            except Exception as e:
+                print(f"[ERROR] 分块 {doc.item and doc.item.get('title')} 失败:", e)
+                self.stats["failed"] += 1
+            finally:
+                limit.release()
+
+        while (doc := await inp.get()) is not _DONE:
+            await limit.acquire()
+            task = asyncio.create_task(run(doc))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        await out.put(_DONE)
+
+    async def _embed(self, inp: asyncio.Queue, out: asyncio.Queue):
+        embedder = self.database.embedder
+        limit = asyncio.Semaphore(self.embed_concurrency)
+        tasks = set()
+        batch: list[tuple[_Doc, int]] = []
+
+        async def run(batch: list[tuple[_Doc, int]]):
+            try:
+                vectors = await asyncio.to_thread(embedder.embed_batch, [doc.texts[i] for doc, i in batch])
+                self.stats["embed_requests"] += 1
+                for (doc, i), vector in zip(batch, vectors):
+                    doc.vectors[i] = vector
+                    doc.pending -= 1
+                    if doc.pending == 0:
+                        await out.put(doc)
+            except Exception as e:
+                print("[ERROR] 向量化失败:", e)
+                failed = {id(doc): doc for doc, _ in batch if doc.pending > 0}
+                for doc in failed.values():
+                    # 标记为失败，其余批次完成时不再写入
+                    doc.pending = -1
+                self.stats["failed"] += len(failed)
+            finally:
+                limit.release()
+
+        async def launch(batch: list[tuple[_Doc, int]]):
+            await limit.acquire()
+            task = asyncio.create_task(run(batch))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        while (doc := await inp.get()) is not _DONE:
+            if not doc.texts:
+                await out.put(doc)
+                continue
+            batch.extend((doc, i) for i in range(len(doc.texts)))
+            while len(batch) >= embedder.batch_size:
+                await launch(batch[:embedder.batch_size])
+                batch = batch[embedder.batch_size:]
+            if batch and inp.empty():
+                # 上游暂时没有新文档，不等待凑满整批
+                await launch(batch)
+                batch = []
+        if batch:
+            await launch(batch)
+        if tasks:
+            await asyncio.gather(*tasks)
+        await out.put(_DONE)
+
+    async def _insert(self, inp: asyncio.Queue):
+        finished = False
+        while not finished:
+            docs, size = [], 0
+            doc = await inp.get()
+            while True:
+                if doc is _DONE:
+                    finished = True
+                    break
+                docs.append(doc)
+                size += len(doc.texts)
+                if size >= self.insert_batch or inp.empty():
+                    break
+                doc = inp.get_nowait()
+            if not docs:
+                continue
+            try:
+                await asyncio.to_thread(self.database._commit, [d.plan for d in docs], [d.vectors for d in docs])
+            except Exception as e:
+                print("[ERROR] 写入失败:", e)
+                self.stats["failed"] += len(docs)
+                continue
+            self._mark(docs)
+            self.stats["files"] += len(docs)
+            self.stats["chunks"] += sum(len(d.plan["chunks"]) for d in docs)
+            self.stats["added"] += sum(len(d.plan["new"]) for d in docs)
+            self.stats["removed"] += sum(len(d.plan["removed"]) for d in docs)
+
+    async def _report(self, start: float):
+        while True:
+            await asyncio.sleep(self.report_every)
+            print(self._progress(start))
+
+    def _progress(self, start: float) -> str:
+        elapsed = time.monotonic() - start
+        s = self.stats
+        return (
+            f"[OK] 已入库 {s['files']} 个文档（跳过 {s['skipped']}，失败 {s['failed']}），"
+            f"分块 {s['chunks']}（新增 {s['added']}，删除 {s['removed']}），"
+            f"{s['files'] / elapsed:.1f} 文档/秒，{s['added'] / elapsed:.1f} 分块/秒"
+        )
+
+    async def arun(self, items: Iterable[dict]) -> dict:
+        """
+        运行流水线。
+
+        :param items: 待入库条目，每项为 {"title", "content" 或 "path", "source", "description", "doc_id"}
+        :return: 统计信息
+        """
+        start = time.monotonic()
+        docs = asyncio.Queue(self.queue_size)
+        plans = asyncio.Queue(self.queue_size)
+        embedded = asyncio.Queue(self.queue_size)
+        pool = ProcessPoolExecutor(self.split_workers) if self.split_workers > 0 else None
+        reporter = asyncio.create_task(self._report(start)) if self.report_every else None
+        try:
+            await asyncio.gather(
+                self._read(items, docs),
+                self._split(pool, docs, plans),
+                self._embed(plans, embedded),
+                self._insert(embedded)
+            )
+        finally:
+            if reporter is not None:
+                reporter.cancel()
+            if pool is not None:
+                pool.shutdown()
+        print(self._progress(start))
+        elapsed = time.monotonic() - start
+        return {**self.stats, "elapsed": elapsed, "chunks_per_sec": self.stats["added"] / elapsed if elapsed else 0.0}
+
+    def run(self, items: Iterable[dict]) -> dict:
+        return asyncio.run(self.arun(items))
+
+def ingest_directory(root: str, database: Optional[RAGDatabase] = None, table: Optional[str] = None, **kwargs) -> dict:
+    """
+    将目录下的 Markdown 文档批量入库，检查点默认写在目录下的 .ingest_checkpoint.jsonl。
+    """
+    kwargs.setdefault("checkpoint", os.path.join(root, ".ingest_checkpoint.jsonl"))
+    pipeline = IngestPipeline(database or RAGDatabase(), table, **kwargs)
+    return pipeline.run(iter_markdown(root))
+
+def _read_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量导入 Markdown 文档到 RAG 数据库")
+    parser.add_argument("root", help="文档目录")
+    parser.add_argument("--table", default=None, help="数据表 / 文档集名称")
+    parser.add_argument("--split-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--embed-concurrency", type=int, default=8)
+    parser.add_argument("--checkpoint", default=None)
+    args = parser.parse_args()
+    print(ingest_directory(
+        args.root,
+        table=args.table,
+        split_workers=args.split_workers,
+        embed_concurrency=args.embed_concurrency,
+        **({"checkpoint": args.checkpoint} if args.checkpoint else {})
+    ))
@@ -0,0 +1,90 @@
+import json
+from typing import Any
+
+class JSONArrayStream:
+    """
+    增量 JSON 解析器：逐块喂入模型输出，指定 key 下数组的每个元素一旦完整即解析返回。
+
+    只做括号/字符串状态扫描，不构建完整语法树；数组之前的多余文本会被忽略。
+    """
+    def __init__(self, key: str = "tools"):
+        self.key = key
+        self.buffer = ""
+        self.pos = 0
+        self.stack: list[str] = []
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_string = None
+        self.pending_key = None
+        self.target_depth = None
+        self.elem_start = None
+        self.done = False
+
+    def feed(self, text: str) -> list[Any]:
+        """
+        追加一段文本，返回本次新完成的数组元素。
+        """
+        self.buffer += text
+        items = []
+        while self.pos < len(self.buffer) and not self.done:
+            ch = self.buffer[self.pos]
+            i = self.pos
+            self.pos += 1
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    self.last_string = self.buffer[self.string_start:i]
+                continue
+
+            at_target = self.target_depth is not None and len(self.stack) == self.target_depth
+            if at_target and self.elem_start is None and ch not in " \t\r\n,]":
+                self.elem_start = i
+
+            if ch == '"':
+                self.in_string = True
+                self.string_start = i + 1
+            elif ch == ":":
+                self.pending_key = self.last_string
+            elif ch in "{[":
+                self.stack.append(ch)
+                if ch == "[" and self.target_depth is None and self.pending_key == self.key:
+                    self.target_depth = len(self.stack)
+                self.pending_key = None
+            elif ch in "}]":
+                if self.stack:
+                    self.stack.pop()
+                if at_target and ch == "]":
+                    item = self._take(i)
+                    if item is not None:
+                        items.append(item)
+                    self.done = True
+            elif ch == "," and at_target:
+                item = self._take(i)
+                if item is not None:
+                    items.append(item)
+                self.pending_key = None
+            elif ch == ",":
+                self.pending_key = None
+        return items
+
+    def _take(self, end: int) -> Any:
+        if self.elem_start is None:
+            return None
+        raw = self.buffer[self.elem_start:end].strip()
+        self.elem_start = None
+        try:
+            return json.loads(raw)
+        except json.JSONDecodeError:
+            return None
+
+if __name__ == "__main__":
+    text = '思考结束 {"tools": [{"name": "a", "dev_tasks": "x, [y]"}, {"name": "b\\"}", "dev_tasks": "z"}]}'
+    parser = JSONArrayStream("tools")
+    for i in range(0, len(text), 7):
+        for item in parser.feed(text[i:i + 7]):
+            print(item)
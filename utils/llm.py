@@ -1,8 +1,212 @@
+import json
+import time
+import asyncio
+import httpx
 import requests
 import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
 from config import LLM
+from utils import transport
+from utils.llm_cache import LLMCache, get_llm_cache
+from utils.retry import RetryPolicy, LatencyTracker, is_retryable, retry_after_header
+from utils.scheduler import LLMScheduler, get_scheduler, PRIORITY_NORMAL
+from utils.embedding import estimate_tokens
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED, TimeoutError as FutureTimeout
+
+# 同步对冲请求使用的共享线程池
+_hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+
+class StreamStats:
+    """
+    流式生成的时延统计：首 token 时延 (ttft) 与解码速度 (tokens/s)。
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.end = None
+        self.chunks = 0
+        self.usage_tokens = None
+        self.total_tokens = None
+
+    def record(self):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.chunks += 1
+
+    def finish(self):
+        if self.end is None:
+            self.end = time.perf_counter()
+
+    @property
+    def tokens(self) -> int:
+        # 服务端返回 usage 时以其为准，否则按增量块数估算
+        return self.usage_tokens if self.usage_tokens is not None else self.chunks
+
+    @property
+    def ttft(self) -> float | None:
+        if self.first_token is None:
+            return None
+        return self.first_token - self.start
+
+    @property
+    def tokens_per_sec(self) -> float | None:
+        if self.first_token is None:
+            return None
+        elapsed = (self.end or time.perf_counter()) - self.first_token
+        return self.tokens / elapsed if elapsed > 0 else None
+
+    def as_dict(self) -> dict:
+        return {
+            "ttft": self.ttft,
+            "tokens": self.tokens,
+            "tokens_per_sec": self.tokens_per_sec,
+            "elapsed": (self.end or time.perf_counter()) - self.start
+        }
+
+class _StreamBase:
+    def __init__(self, client: "LLMClient", payload: dict, priority: int | None = None):
+        self.client = client
+        self.payload = payload
+        self.priority = priority
+        self.stats = StreamStats()
+        self.reasoning = ""
+        self.answer = ""
+        self.error = None
+        self.cancelled = False
+        self.done = False
+
+    def _handle(self, line: str) -> dict | None:
+        """
+        解析一行 SSE，返回 {"reasoning": ..., "answer": ...} 增量；无内容时返回 None。
+        """
+        if not line or not line.startswith("data:"):
+            return None
+        data = line[5:].strip()
+        if data == "[DONE]":
+            self.done = True
+            return None
+        chunk = json.loads(data)
+        if chunk.get("usage"):
+            self.stats.usage_tokens = chunk["usage"].get("completion_tokens")
+            self.stats.total_tokens = chunk["usage"].get("total_tokens")
+        if not chunk.get("choices"):
+            return None
+        delta = chunk["choices"][0].get("delta") or {}
+        event = {
+            "reasoning": delta.get("reasoning_content"),
+            "answer": delta.get("content")
+        }
+        if not event["reasoning"] and not event["answer"]:
+            return None
+        self.stats.record()
+        self.reasoning += event["reasoning"] or ""
+        self.answer += event["answer"] or ""
+        return event
+
+    def _used(self) -> int:
+        """
+        本次调用的实际 token 用量（提示词 + 输出），与非流式的 total_tokens 口径一致；
+        服务端未返回 usage 时以提示词估算加已接收的输出计数代替。
+        """
+        if self.stats.total_tokens is not None:
+            return self.stats.total_tokens
+        return self.client._prompt_tokens(self.payload) + self.stats.tokens
+
+    def result(self) -> dict:
+        """
+        与 dialogue 相同格式的累计结果，出错时 answer 为 None。
+        """
+        if self.error is not None:
+            return {"reasoning": None, "answer": None}
+        return {"reasoning": self.reasoning or None, "answer": self.answer}
+
+class LLMStream(_StreamBase):
+    """
+    同步流式结果，迭代得到增量；可在其他线程调用 cancel() 中止生成。
+    """
+    def __init__(self, client: "LLMClient", payload: dict, priority: int | None = None):
+        super().__init__(client, payload, priority)
+        self._resp = None
+
+    def __iter__(self):
+        policy = self.client.retry
+        try:
+            for attempt in range(policy.max_attempts):
+                try:
+                    with self.client._slot(self.payload, self.priority) as ticket:
+                        self._resp = transport.stream("POST", self.client.url, json=self.payload, headers=self.client.header, timeout=self.client.timeout)
+                        self.client._check(self._resp)
+                        # SSE 固定为 UTF-8；text/event-stream 未声明 charset 时 requests 会按 ISO-8859-1 解码
+                        for line in self._resp.iter_lines():
+                            if self.cancelled:
+                                break
+                            event = self._handle(line.decode("utf-8"))
+                            if event:
+                                yield event
+                            if self.done:
+                                break
+                        if ticket is not None:
+                            ticket.used = self._used()
+                    return
+                except Exception as e:
+                    # cancel() 会从其他线程关闭连接，此时读取端抛出的任何异常都视为正常结束
+                    if self.cancelled:
+                        return
+                    if not isinstance(e, (requests.exceptions.RequestException, ValueError)):
+                        raise
+                    # 只在尚未产出任何增量时重试，避免重复输出
+                    if self.stats.first_token is not None or attempt + 1 >= policy.max_attempts or not is_retryable(e):
+                        self.error = e
+                        return
+                    time.sleep(policy.backoff(attempt, e))
+                finally:
+                    if self._resp is not None:
+                        self._resp.close()
+        finally:
+            self.stats.finish()
+
+    def cancel(self):
+        self.cancelled = True
+        if self._resp is not None:
+            self._resp.close()
+
+class AsyncLLMStream(_StreamBase):
+    """
+    异步流式结果，async for 迭代；cancel() 或取消所在任务都会关闭连接。
+    """
+    async def __aiter__(self):
+        policy = self.client.retry
+        try:
+            for attempt in range(policy.max_attempts):
+                try:
+                    async with self.client._aslot(self.payload, self.priority) as ticket:
+                        async with transport.astream("POST", self.client.url, json=self.payload, headers=self.client.header, timeout=self.client.timeout) as resp:
+                            self.client._check(resp)
+                            async for line in resp.aiter_lines():
+                                if self.cancelled:
+                                    break
+                                event = self._handle(line)
+                                if event:
+                                    yield event
+                                if self.done:
+                                    break
+                        if ticket is not None:
+                            ticket.used = self._used()
+                    return
+                except (httpx.HTTPError, ValueError) as e:
+                    if self.cancelled:
+                        return
+                    if self.stats.first_token is not None or attempt + 1 >= policy.max_attempts or not is_retryable(e):
+                        self.error = e
+                        return
+                    await asyncio.sleep(policy.backoff(attempt, e))
+        finally:
+            self.stats.finish()
+
+    def cancel(self):
+        self.cancelled = True
 
 class LLMClient:
     def __init__(
@@ -10,10 +214,23 @@ class LLMClient:
             model_name: str = "Qwen/Qwen3-8B",
             timeout: int = 30,
             url: str = LLM["url"],
-            key: str = LLM["key"]
+            key: str = LLM["key"],
+            cache: LLMCache | bool = LLM["cache"],
+            retry: RetryPolicy | None = None,
+            scheduler: LLMScheduler | bool = LLM["scheduler"],
+            priority: int = PRIORITY_NORMAL
         ):
         self.model_name = model_name
         self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.latency = LatencyTracker()
+        if scheduler is True:
+            scheduler = get_scheduler()
+        self.scheduler: LLMScheduler | None = scheduler or None
+        self.priority = priority
+        if cache is True:
+            cache = get_llm_cache()
+        self.cache: LLMCache | None = cache or None
 
         self.url = url
         self.header = {
@@ -21,24 +238,250 @@ class LLMClient:
             "Content-Type": "application/json"
         }
 
-    def dialogue(self, messages, **params) -> dict:
+    def _payload(self, messages, params: dict) -> dict:
         params.pop('stream', None)
-        payload = {
+        return {
             "model": self.model_name,
             "messages": messages,
             "stream": False,
             **params
         }
-        try:
-            resp = requests.post(self.url, json=payload, headers=self.header, timeout=self.timeout)
-            resp.raise_for_status()
+
+    def _stream_payload(self, messages, params: dict) -> dict:
+        payload = self._payload(messages, params)
+        payload["stream"] = True
+        payload.setdefault("stream_options", {"include_usage": True})
+        return payload
+
+    @staticmethod
+    def _parse(response: dict) -> dict:
+        return {
+            "reasoning": response["choices"][0]["message"].get("reasoning_content"),
+            "answer": response["choices"][0]["message"].get("content")
+        }
+
+    def _cache_get(self, payload: dict) -> tuple[str | None, dict | None]:
+        if not self.cache:
+            return None, None
+        key = self.cache.key(payload)
+        return key, self.cache.get(key) if key else None
+
+    def _cache_put(self, key: str | None, result: dict):
+        if key and result["answer"] is not None:
+            self.cache.put(key, result)
+
+    @staticmethod
+    def _prompt_tokens(payload: dict) -> int:
+        return sum(estimate_tokens(m.get("content") or "") for m in payload.get("messages", []))
+
+    @classmethod
+    def _estimate(cls, payload: dict) -> int:
+        """
+        预估一次请求的 token 用量（提示词 + 输出上限），用于 tpm 限流。
+        """
+        return cls._prompt_tokens(payload) + payload.get("max_tokens", 1024)
+
+    def _slot(self, payload: dict, priority: int | None, end: float | None = None):
+        """
+        调度许可；给出截止时刻 end 时排队等待也计入截止时间，超时抛出 TimeoutError。
+        """
+        if not self.scheduler:
+            return nullcontext()
+        timeout = None if end is None else max(0.0, end - time.monotonic())
+        return self.scheduler.slot(self._estimate(payload), self.priority if priority is None else priority, timeout=timeout)
+
+    def _aslot(self, payload: dict, priority: int | None):
+        if not self.scheduler:
+            return nullcontext()
+        return self.scheduler.aslot(self._estimate(payload), self.priority if priority is None else priority)
+
+    def _check(self, resp):
+        """
+        检查响应状态；429 时通知调度器暂停派发。
+        """
+        if resp.status_code == 429 and self.scheduler:
+            self.scheduler.throttle(retry_after_header(resp) or 1.0)
+        resp.raise_for_status()
+
+    @staticmethod
+    def _used(response: dict) -> int | None:
+        return (response.get("usage") or {}).get("total_tokens")
+
+    def _hedge_delay(self) -> float:
+        observed = self.latency.quantile(self.retry.hedge_quantile)
+        return max(self.retry.hedge_min_delay, observed or 0)
+
+    def _attempt_timeout(self, end: float | None) -> float:
+        if end is None:
+            return self.timeout
+        return max(0.1, min(self.timeout, end - time.monotonic()))
+
+    def _request(self, payload: dict, timeout: float) -> dict:
+        start = time.perf_counter()
+        resp = transport.post(self.url, json=payload, headers=self.header, timeout=timeout)
+        self._check(resp)
+        response = resp.json()
+        self.latency.record(time.perf_counter() - start)
+        return response
+
+    def _attempt(self, payload: dict, timeout: float, priority: int | None = None, end: float | None = None) -> dict:
+        with self._slot(payload, priority, end) as ticket:
+            # 排队等待占用了部分截止时间，HTTP 超时按剩余时间重新截断
+            response = self._request(payload, timeout if end is None else min(timeout, self._attempt_timeout(end)))
+            result = self._parse(response)
+            if ticket is not None:
+                ticket.used = self._used(response)
+        return result
+
+    def _bounded_attempt(self, payload: dict, priority: int | None, end: float) -> dict:
+        """
+        带截止时间的同步请求：调度许可由调用线程持有，请求在线程池中执行。
+        requests 的 timeout 只限制单次读取，超过截止时间即放弃等待并归还许可，请求结果被丢弃。
+        """
+        with self._slot(payload, priority, end) as ticket:
+            future = _hedge_pool.submit(self._request, payload, self._attempt_timeout(end))
+            try:
+                response = future.result(timeout=max(0.0, end - time.monotonic()))
+            except FutureTimeout:
+                raise requests.exceptions.Timeout("LLM deadline exceeded") from None
+            result = self._parse(response)
+            if ticket is not None:
+                ticket.used = self._used(response)
+        return result
+
+    def _hedged(self, payload: dict, timeout: float, priority: int | None = None, end: float | None = None) -> dict:
+        """
+        先发一个请求，超过对冲延迟仍未返回则再发一个，取先成功者。
+        同步模式下落后的请求无法中止，只是结果被丢弃。
+        """
+        futures = [_hedge_pool.submit(self._attempt, payload, timeout, priority, end)]
+        done, _ = wait(futures, timeout=self._hedge_delay())
+        if not done:
+            futures.append(_hedge_pool.submit(self._attempt, payload, timeout, priority, end))
+        pending, error = set(futures), None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=None if end is None else max(0.0, end - time.monotonic()),
+                return_when=FIRST_COMPLETED
+            )
+            if not done:
+                raise requests.exceptions.Timeout("LLM deadline exceeded")
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def _call(self, payload: dict, deadline: float | None, priority: int | None = None) -> dict:
+        policy = self.retry
+        deadline = deadline if deadline is not None else policy.deadline
+        end = time.monotonic() + deadline if deadline else None
+        for attempt in range(policy.max_attempts):
+            timeout = self._attempt_timeout(end)
+            try:
+                if policy.hedge:
+                    return self._hedged(payload, timeout, priority, end)
+                if end is None:
+                    return self._attempt(payload, timeout, priority)
+                return self._bounded_attempt(payload, priority, end)
+            except Exception as e:
+                if not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                    raise
+                delay = policy.backoff(attempt, e)
+                if end is not None and time.monotonic() + delay >= end:
+                    raise
+                time.sleep(delay)
+
+    async def _aattempt(self, payload: dict, timeout: float, priority: int | None = None) -> dict:
+        async with self._aslot(payload, priority) as ticket:
+            start = time.perf_counter()
+            resp = await transport.apost(self.url, json=payload, headers=self.header, timeout=timeout)
+            self._check(resp)
             response = resp.json()
-            return {
-                "reasoning": response["choices"][0]["message"].get("reasoning_content"),
-                "answer": response["choices"][0]["message"].get("content")
-            }
-        except requests.exceptions.RequestException as e:
+            result = self._parse(response)
+            self.latency.record(time.perf_counter() - start)
+            if ticket is not None:
+                ticket.used = self._used(response)
+        return result
+
+    async def _ahedged(self, payload: dict, timeout: float, priority: int | None = None) -> dict:
+        tasks = [asyncio.create_task(self._aattempt(payload, timeout, priority))]
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self._hedge_delay())
+            if not done:
+                tasks.append(asyncio.create_task(self._aattempt(payload, timeout, priority)))
+            pending, error = set(tasks), None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _acall(self, payload: dict, deadline: float | None, priority: int | None = None) -> dict:
+        policy = self.retry
+        deadline = deadline if deadline is not None else policy.deadline
+        end = time.monotonic() + deadline if deadline else None
+        for attempt in range(policy.max_attempts):
+            timeout = self._attempt_timeout(end)
+            try:
+                call = self._ahedged(payload, timeout, priority) if policy.hedge else self._aattempt(payload, timeout, priority)
+                if end is None:
+                    return await call
+                return await asyncio.wait_for(call, max(0.1, end - time.monotonic()))
+            except Exception as e:
+                if not is_retryable(e) or attempt + 1 >= policy.max_attempts:
+                    raise
+                delay = policy.backoff(attempt, e)
+                if end is not None and time.monotonic() + delay >= end:
+                    raise
+                await asyncio.sleep(delay)
+
+    def dialogue(self, messages, deadline: float | None = None, priority: int | None = None, **params) -> dict:
+        """
+        非流式对话。失败时按 retry 策略退避重试，deadline 为本次调用的总截止秒数，
+        priority 覆盖客户端默认的调度优先级。
+        """
+        payload = self._payload(messages, params)
+        key, cached = self._cache_get(payload)
+        if cached is not None:
+            return cached
+        try:
+            result = self._call(payload, deadline, priority)
+        except (requests.exceptions.RequestException, TimeoutError, ValueError, KeyError) as e:
+            return {"reasoning": None, "answer": None}
+        self._cache_put(key, result)
+        return result
+
+    async def adialogue(self, messages, deadline: float | None = None, priority: int | None = None, **params) -> dict:
+        """
+        dialogue 的异步版本，基于共享的 httpx.AsyncClient，不阻塞事件循环。
+        """
+        payload = self._payload(messages, params)
+        key, cached = self._cache_get(payload)
+        if cached is not None:
+            return cached
+        try:
+            result = await self._acall(payload, deadline, priority)
+        except (httpx.HTTPError, asyncio.TimeoutError, ValueError, KeyError) as e:
             return {"reasoning": None, "answer": None}
+        self._cache_put(key, result)
+        return result
+
+    def stream(self, messages, priority: int | None = None, **params) -> LLMStream:
+        """
+        流式对话，迭代返回 {"reasoning": ..., "answer": ...} 增量，stats 记录 ttft 与 tokens/s。
+        """
+        return LLMStream(self, self._stream_payload(messages, params), priority)
+
+    def astream(self, messages, priority: int | None = None, **params) -> AsyncLLMStream:
+        return AsyncLLMStream(self, self._stream_payload(messages, params), priority)
 
     def chat(self, prompt: str, role: str = "user", **params) -> dict:
         """
@@ -49,6 +492,10 @@ class LLMClient:
         messages = [{"role": role, "content": prompt}]
         return self.dialogue(messages, **params)
 
+    async def achat(self, prompt: str, role: str = "user", **params) -> dict:
+        messages = [{"role": role, "content": prompt}]
+        return await self.adialogue(messages, **params)
+
     def close(self):
         pass
     
@@ -56,8 +503,161 @@ class LLMClient:
         self.close()
 
 
+def _check_stream_decoding():
+    """
+    本地 SSE 服务返回不带 charset 的 text/event-stream，同步与异步流式接口都应正确解码中文增量。
+    """
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    deltas = ["你好，", "我是", "代码助手。", "🙂 emoji"]
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for delta in deltas:
+                chunk = {"choices": [{"delta": {"content": delta}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = LLMClient(url=f"http://127.0.0.1:{server.server_port}/", key="test", cache=False, scheduler=False)
+        messages = [{"role": "user", "content": "你好"}]
+        stream = client.stream(messages)
+        assert [event["answer"] for event in stream] == deltas, stream.answer
+
+        async def collect():
+            return [event["answer"] async for event in client.astream(messages)]
+        assert asyncio.run(collect()) == deltas
+    finally:
+        server.shutdown()
+    print("[OK] 未声明 charset 的 SSE 流式中文解码正确")
+
+def _check_stream_usage():
+    """
+    流式调用归还调度许可时按 total_tokens 校正 tpm 桶；服务端不返回 usage 时按提示词估算 + 输出块数计。
+    """
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    deltas = ["你好，", "我是", "代码助手。"]
+    usage = {"prompt_tokens": 40, "completion_tokens": 10, "total_tokens": 50}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.end_headers()
+            for delta in deltas:
+                chunk = {"choices": [{"delta": {"content": delta}}]}
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+            if payload.get("stream_options", {}).get("include_usage"):
+                self.wfile.write(f"data: {json.dumps({'choices': [], 'usage': usage})}\n\n".encode("utf-8"))
+            self.wfile.write(b"data: [DONE]\n\n")
+
+    class RecordingScheduler(LLMScheduler):
+        def __init__(self):
+            super().__init__(rpm=0, tpm=0, max_concurrent=1)
+            self.used = []
+
+        def release(self, ticket):
+            self.used.append(ticket.used)
+            super().release(ticket)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        scheduler = RecordingScheduler()
+        client = LLMClient(url=f"http://127.0.0.1:{server.server_port}/", key="test", cache=False, scheduler=scheduler)
+        messages = [{"role": "user", "content": "你好"}]
+        list(client.stream(messages))
+
+        async def collect():
+            return [event async for event in client.astream(messages)]
+        asyncio.run(collect())
+        assert scheduler.used == [50, 50], scheduler.used
+
+        scheduler.used.clear()
+        list(client.stream(messages, stream_options={"include_usage": False}))
+        assert scheduler.used == [client._prompt_tokens({"messages": messages}) + len(deltas)], scheduler.used
+        assert scheduler.stats()["active"] == 0
+    finally:
+        server.shutdown()
+    print(f"[OK] 流式调用按 total_tokens 校正 tpm：{usage['total_tokens']}")
+
+def _check_deadline():
+    """
+    deadline 覆盖调度排队与整个请求：调度名额被占满或服务端逐字节慢速返回时，都在截止时间内放弃，
+    放弃时立即归还调度名额。
+    """
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class SlowHandler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            body = json.dumps({"choices": [{"message": {"content": "慢"}}]}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            # 每次读取都在单次读取超时内返回，但总时长远超截止时间
+            for i in range(len(body)):
+                time.sleep(0.2)
+                self.wfile.write(body[i:i + 1])
+                self.wfile.flush()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        url = f"http://127.0.0.1:{server.server_port}/"
+        scheduler = LLMScheduler(rpm=0, tpm=0, max_concurrent=1)
+        client = LLMClient(url=url, key="test", cache=False, scheduler=scheduler, retry=RetryPolicy(max_attempts=3))
+        held = scheduler.acquire(1)
+        start = time.monotonic()
+        assert client.dialogue([{"role": "user", "content": "你好"}], deadline=0.5)["answer"] is None
+        queued = time.monotonic() - start
+        assert queued < 1.0 and scheduler.stats()["queued"] == 0, (queued, scheduler.stats())
+        scheduler.release(held)
+
+        start = time.monotonic()
+        assert client.dialogue([{"role": "user", "content": "你好"}], deadline=0.5)["answer"] is None
+        slow = time.monotonic() - start
+        assert slow < 1.0, slow
+        # 放弃的请求仍在后台读取，但调度许可已归还
+        assert scheduler.stats()["active"] == 0, scheduler.stats()
+        assert scheduler.acquire(1, timeout=0.1) is not None
+    finally:
+        server.shutdown()
+    print(f"[OK] deadline 0.5 秒：排队等待 {queued:.2f} 秒后放弃，慢速应答 {slow:.2f} 秒后放弃")
+
 if __name__ == "__main__":
+    _check_stream_decoding()
+    _check_stream_usage()
+    _check_deadline()
+
     llm_model = LLMClient()
     print("LLM model server started successfully.")
     result = llm_model.chat("你好！你是谁？")
     print(result["answer"])
+
+    stream = llm_model.stream([{"role": "user", "content": "你好！你是谁？"}])
+    for delta in stream:
+        print(delta["answer"] or "", end="", flush=True)
+    print("\n", stream.stats.as_dict())
@@ -0,0 +1,128 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import LLM
+
+# 不影响生成结果的请求参数，不参与缓存键
+_VOLATILE_PARAMS = {"stream", "stream_options", "user"}
+
+class LLMCache:
+    """
+    LLM 应答的磁盘缓存（SQLite），键为 模型 + 规范化消息 + 采样参数。
+
+    条目超过 ttl 秒失效，超过 max_entries 时淘汰最久未访问的条目。
+    bypass_sampled 为 True 时，显式设置了非零 temperature 的请求不走缓存。
+    """
+    def __init__(
+            self,
+            path: str = LLM["cache_path"],
+            ttl: float = LLM["cache_ttl"],
+            max_entries: int = LLM["cache_size"],
+            bypass_sampled: bool = True
+        ):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.bypass_sampled = bypass_sampled
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self.conn.commit()
+
+    @staticmethod
+    def normalize(payload: dict) -> dict:
+        messages = [
+            {**m, "content": m["content"].strip() if isinstance(m.get("content"), str) else m.get("content")}
+            for m in payload.get("messages", [])
+        ]
+        params = {k: v for k, v in payload.items() if k not in _VOLATILE_PARAMS and k != "messages"}
+        return {"messages": messages, **params}
+
+    def key(self, payload: dict) -> str | None:
+        """
+        计算请求的缓存键；不可缓存时返回 None。
+        """
+        if self.bypass_sampled and (payload.get("temperature") or 0) > 0:
+            self.bypassed += 1
+            return None
+        raw = json.dumps(self.normalize(payload), sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> dict | None:
+        now = time.time()
+        with self._lock:
+            row = self.conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self.conn.commit()
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), now, now)
+            )
+            self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self.conn.execute(
+                "DELETE FROM responses WHERE key IN ("
+                "SELECT key FROM responses ORDER BY accessed LIMIT max(0, (SELECT COUNT(*) FROM responses) - ?))",
+                (self.max_entries,)
+            )
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM responses")
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        with self._lock:
+            size = self.conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "bypassed": self.bypassed,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": size,
+            "max_entries": self.max_entries
+        }
+
+    def close(self):
+        self.conn.close()
+
+_cache: LLMCache | None = None
+_cache_lock = threading.Lock()
+
+def get_llm_cache() -> LLMCache:
+    """
+    获取进程内共享的 LLM 应答缓存。
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = LLMCache()
+        return _cache
@@ -0,0 +1,295 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import RAG
+
+# 文档元数据字段
+FIELDS = ("title", "source", "description", "doc_set")
+# 未区分数据库的旧记录与 original.json 归入默认配置的数据库
+LEGACY_SCOPE = f"{RAG['backend']}:{RAG['db_name']}"
+
+def meta_scope(backend: str, db_name: str) -> str:
+    """
+    元数据的隔离范围：同一元数据文件中，不同后端、不同数据库的文档与分块记录互不可见。
+    """
+    return f"{backend}:{db_name}"
+
+class MetaStore:
+    """
+    文档元数据存储（SQLite，WAL 模式），按 (scope, doc_id) 索引，替代整文件读写的 original.json。
+
+    写入在单个事务内完成，读取带进程内 LRU 缓存，检索结果关联元数据只需按 doc_id 查 k 次。
+    首次创建数据库时，自动导入同目录下已有的 original.json。
+    chunks 表记录每个文档的分块内容哈希与向量库中的分块 ID，用于增量更新。
+    多个数据库共用一个文件，各实例只读写自己 scope 下的记录。
+
+    :param path: 数据库文件路径
+    :param scope: 隔离范围，见 meta_scope
+    :param cache_size: 读缓存条目上限
+    """
+    def __init__(self, path: str = RAG["meta_path"], scope: str = LEGACY_SCOPE, cache_size: int = 4096):
+        self.path = path
+        self.scope = scope
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, dict | None] = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # 建表与旧表升级在同一个写事务内完成，避免多个进程同时升级
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            created = self._columns("documents") == []
+            if not created and "scope" not in self._columns("documents"):
+                self._upgrade()
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                "scope TEXT NOT NULL, doc_id TEXT NOT NULL, title TEXT, source TEXT, description TEXT, doc_set TEXT, "
+                "updated REAL NOT NULL, PRIMARY KEY (scope, doc_id))"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS documents_doc_set ON documents (scope, doc_set)")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS chunks ("
+                "scope TEXT NOT NULL, doc_id TEXT NOT NULL, hash TEXT NOT NULL, chunk_id INTEGER NOT NULL, "
+                "PRIMARY KEY (scope, doc_id, hash))"
+            )
+            if created:
+                self._migrate(os.path.join(os.path.dirname(os.path.abspath(path)), "original.json"))
+            self.conn.commit()
+        except BaseException:
+            self.conn.rollback()
+            raise
+
+    def _columns(self, table: str) -> list[str]:
+        return [row[1] for row in self.conn.execute(f"PRAGMA table_info({table})")]
+
+    def _upgrade(self):
+        """
+        旧表只按 doc_id 索引，升级为按 (scope, doc_id) 索引，已有记录归入 LEGACY_SCOPE。
+        """
+        self.conn.execute("DROP INDEX IF EXISTS documents_doc_set")
+        for table in ("documents", "chunks"):
+            self.conn.execute(f"ALTER TABLE {table} RENAME TO {table}_legacy")
+        self.conn.execute(
+            "CREATE TABLE documents ("
+            "scope TEXT NOT NULL, doc_id TEXT NOT NULL, title TEXT, source TEXT, description TEXT, doc_set TEXT, "
+            "updated REAL NOT NULL, PRIMARY KEY (scope, doc_id))"
+        )
+        self.conn.execute(
+            "CREATE TABLE chunks ("
+            "scope TEXT NOT NULL, doc_id TEXT NOT NULL, hash TEXT NOT NULL, chunk_id INTEGER NOT NULL, "
+            "PRIMARY KEY (scope, doc_id, hash))"
+        )
+        self.conn.execute(
+            f"INSERT INTO documents SELECT ?, doc_id, {', '.join(FIELDS)}, updated FROM documents_legacy",
+            (LEGACY_SCOPE,)
+        )
+        self.conn.execute("INSERT INTO chunks SELECT ?, doc_id, hash, chunk_id FROM chunks_legacy", (LEGACY_SCOPE,))
+        self.conn.execute("DROP TABLE documents_legacy")
+        self.conn.execute("DROP TABLE chunks_legacy")
+        print(f"[OK] 元数据已按数据库隔离，已有记录归入 {LEGACY_SCOPE}")
+
+    def _migrate(self, legacy_path: str):
+        if not os.path.exists(legacy_path):
+            return
+        try:
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                original_data = json.load(f)
+            # 旧格式以数据表名为键，每个数据表即一个文档
+            self._write_documents(LEGACY_SCOPE, {
+                doc_id: {**info, "doc_set": info.get("doc_set") or doc_id}
+                for doc_id, info in original_data.items()
+            })
+            print(f"[OK] 已从 {legacy_path} 导入 {len(original_data)} 条文档信息")
+        except Exception as e:
+            print(f"[ERROR] 导入 {legacy_path} 失败:", e)
+
+    def _remember(self, doc_id: str, info: dict | None):
+        self._cache[doc_id] = info
+        self._cache.move_to_end(doc_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    @staticmethod
+    def _row(row) -> dict:
+        return dict(zip(FIELDS, row))
+
+    def get(self, doc_id: str) -> dict | None:
+        return self.get_many([doc_id]).get(doc_id)
+
+    def get_many(self, doc_ids: list[str]) -> dict[str, dict]:
+        """
+        批量按 doc_id 查询，未命中缓存的部分一次查库。
+
+        :return: {doc_id: 元数据}，不存在的文档不出现在结果中
+        """
+        found, missing = {}, []
+        with self._lock:
+            for doc_id in dict.fromkeys(doc_ids):
+                if doc_id in self._cache:
+                    self._cache.move_to_end(doc_id)
+                    if self._cache[doc_id] is not None:
+                        found[doc_id] = self._cache[doc_id]
+                else:
+                    missing.append(doc_id)
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                rows = self.conn.execute(
+                    f"SELECT doc_id, {', '.join(FIELDS)} FROM documents "
+                    f"WHERE scope = ? AND doc_id IN ({', '.join('?' * len(part))})",
+                    (self.scope, *part)
+                ).fetchall()
+                loaded = {row[0]: self._row(row[1:]) for row in rows}
+                for doc_id in part:
+                    self._remember(doc_id, loaded.get(doc_id))
+                found.update(loaded)
+        return found
+
+    def upsert(self, doc_id: str, info: dict):
+        self.upsert_many({doc_id: info})
+
+    def _write_documents(self, scope: str, docs: dict[str, dict]):
+        now = time.time()
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO documents (scope, doc_id, {', '.join(FIELDS)}, updated) "
+            f"VALUES (?, ?, {', '.join('?' * len(FIELDS))}, ?)",
+            [(scope, doc_id, *(info.get(f) for f in FIELDS), now) for doc_id, info in docs.items()]
+        )
+
+    def upsert_many(self, docs: dict[str, dict]):
+        """
+        在一个事务内写入或覆盖多个文档的元数据。
+        """
+        with self._lock:
+            with self.conn:
+                self._write_documents(self.scope, docs)
+            for doc_id, info in docs.items():
+                self._remember(doc_id, {f: info.get(f) for f in FIELDS})
+
+    def get_chunks(self, doc_id: str) -> dict[str, int]:
+        """
+        文档已入库分块的 {内容哈希: 分块 ID}。
+        """
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT hash, chunk_id FROM chunks WHERE scope = ? AND doc_id = ?", (self.scope, doc_id)
+            )
+            return {row[0]: row[1] for row in rows}
+
+    def update_document(self, doc_id: str, info: dict, added: dict[str, int], removed: list[str]):
+        """
+        在一个事务内写入文档元数据并增删分块记录。
+
+        :param added: 新增分块 {内容哈希: 分块 ID}
+        :param removed: 已删除分块的内容哈希
+        """
+        with self._lock:
+            with self.conn:
+                self._write_documents(self.scope, {doc_id: info})
+                self.conn.executemany(
+                    "DELETE FROM chunks WHERE scope = ? AND doc_id = ? AND hash = ?",
+                    [(self.scope, doc_id, h) for h in removed]
+                )
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO chunks (scope, doc_id, hash, chunk_id) VALUES (?, ?, ?, ?)",
+                    [(self.scope, doc_id, h, int(i)) for h, i in added.items()]
+                )
+            self._remember(doc_id, {f: info.get(f) for f in FIELDS})
+
+    def delete(self, doc_ids: list[str]):
+        with self._lock:
+            with self.conn:
+                self.conn.executemany("DELETE FROM documents WHERE scope = ? AND doc_id = ?", [(self.scope, d) for d in doc_ids])
+                self.conn.executemany("DELETE FROM chunks WHERE scope = ? AND doc_id = ?", [(self.scope, d) for d in doc_ids])
+            for doc_id in doc_ids:
+                self._remember(doc_id, None)
+
+    def delete_set(self, doc_set: str) -> list[str]:
+        """
+        删除文档集内的全部文档，返回被删除的 doc_id。
+        """
+        with self._lock:
+            with self.conn:
+                doc_ids = [row[0] for row in self.conn.execute(
+                    "SELECT doc_id FROM documents WHERE scope = ? AND doc_set = ?", (self.scope, doc_set)
+                )]
+                self.conn.execute("DELETE FROM documents WHERE scope = ? AND doc_set = ?", (self.scope, doc_set))
+                self.conn.executemany("DELETE FROM chunks WHERE scope = ? AND doc_id = ?", [(self.scope, d) for d in doc_ids])
+            for doc_id in doc_ids:
+                self._remember(doc_id, None)
+        return doc_ids
+
+    def list_documents(self, doc_set: str | None = None) -> list[str]:
+        with self._lock:
+            if doc_set is None:
+                rows = self.conn.execute("SELECT doc_id FROM documents WHERE scope = ? ORDER BY doc_id", (self.scope,))
+            else:
+                rows = self.conn.execute(
+                    "SELECT doc_id FROM documents WHERE scope = ? AND doc_set = ? ORDER BY doc_id", (self.scope, doc_set)
+                )
+            return [row[0] for row in rows]
+
+    def list_sets(self) -> list[str]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT doc_set FROM documents WHERE scope = ? AND doc_set IS NOT NULL ORDER BY doc_set",
+                (self.scope,)
+            )
+            return [row[0] for row in rows]
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+_stores: dict[tuple[str, str], MetaStore] = {}
+_stores_lock = threading.Lock()
+
+def get_meta_store(path: str = RAG["meta_path"], scope: str = LEGACY_SCOPE) -> MetaStore:
+    """
+    获取进程内共享的元数据存储，同一路径与 scope 只打开一次，并发写入经同一把锁串行化。
+    """
+    key = (os.path.abspath(path), scope)
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = MetaStore(key[0], scope)
+        return _stores[key]
+
+if __name__ == "__main__":
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp:
+        # 旧表按 doc_id 索引，打开时升级，已有记录归入 LEGACY_SCOPE
+        path = os.path.join(tmp, "metadata.sqlite")
+        conn = sqlite3.connect(path)
+        conn.execute(
+            "CREATE TABLE documents ("
+            "doc_id TEXT PRIMARY KEY, title TEXT, source TEXT, description TEXT, doc_set TEXT, updated REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE chunks ("
+            "doc_id TEXT NOT NULL, hash TEXT NOT NULL, chunk_id INTEGER NOT NULL, PRIMARY KEY (doc_id, hash))"
+        )
+        conn.execute("INSERT INTO documents VALUES ('doc', 'Doc', NULL, NULL, 'set', 0)")
+        conn.execute("INSERT INTO chunks VALUES ('doc', 'h1', 1)")
+        conn.commit()
+        conn.close()
+        legacy = MetaStore(path)
+        assert legacy.get("doc")["title"] == "Doc" and legacy.get_chunks("doc") == {"h1": 1}
+
+        # 不同数据库的文档与分块记录互不可见
+        other = MetaStore(path, meta_scope("local", "other"))
+        assert other.get("doc") is None and other.get_chunks("doc") == {}
+        other.update_document("doc", {"title": "Other", "doc_set": "set"}, {"h2": 7}, [])
+        assert legacy.get_chunks("doc") == {"h1": 1} and other.get_chunks("doc") == {"h2": 7}
+        assert other.delete_set("set") == ["doc"]
+        assert legacy.list_documents("set") == ["doc"] and other.list_sets() == []
+        legacy.close()
+        other.close()
+    print("[OK] 元数据按数据库隔离")
@@ -0,0 +1,188 @@
+import numpy as np
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+
+# 向量存储精度：名称 -> (存储 dtype, 本地文件后缀)
+# bfloat16 没有 NumPy 原生类型，按 float32 的高 16 位存为 uint16
+VECTOR_TYPES = {
+    "float32": (np.float32, "f32"),
+    "float16": (np.float16, "f16"),
+    "bfloat16": (np.uint16, "bf16"),
+    "int8": (np.int8, "i8"),
+}
+
+# 分块解码时每块的行数，控制检索时的临时内存
+BLOCK_ROWS = 65536
+
+def check_type(vector_type: str) -> str:
+    if vector_type not in VECTOR_TYPES:
+        raise ValueError(f"Unknown vector type: {vector_type}")
+    return vector_type
+
+def storage_dtype(vector_type: str) -> np.dtype:
+    return np.dtype(VECTOR_TYPES[check_type(vector_type)][0])
+
+def normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / (np.linalg.norm(vectors, axis=-1, keepdims=True) + 1e-12)
+
+def encode(vectors, vector_type: str) -> np.ndarray:
+    """
+    将 float32 向量编码为存储精度。
+
+    int8 按每行最大绝对值缩放到 [-127, 127]；余弦相似度与缩放无关，因此无需保存缩放系数。
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    check_type(vector_type)
+    if vector_type == "float32":
+        return vectors
+    if vector_type == "float16":
+        return vectors.astype(np.float16)
+    if vector_type == "bfloat16":
+        # 就近舍入到偶数
+        bits = vectors.view(np.uint32)
+        return ((bits + 0x7FFF + ((bits >> 16) & 1)) >> 16).astype(np.uint16)
+    scale = np.abs(vectors).max(axis=-1, keepdims=True) / 127 + 1e-12
+    return np.clip(np.rint(vectors / scale), -127, 127).astype(np.int8)
+
+def decode(codes: np.ndarray, vector_type: str) -> np.ndarray:
+    """
+    还原为 float32 数组以便计算相似度；精度与存储精度相同，并非原始 float32 向量。
+    """
+    codes = np.asarray(codes)
+    if vector_type == "bfloat16":
+        vectors = (codes.astype(np.uint32) << 16).view(np.float32)
+    else:
+        vectors = codes.astype(np.float32)
+    if vector_type == "int8":
+        vectors = normalize(vectors)
+    return vectors
+
+def binary_codes(vectors) -> np.ndarray:
+    """
+    符号位二值码，每 8 维打包为 1 字节，用于汉明距离粗排。
+    """
+    return np.packbits(np.asarray(vectors) > 0, axis=-1)
+
+def hamming(query_codes: np.ndarray, codes: np.ndarray) -> np.ndarray:
+    """
+    查询二值码与候选二值码的汉明距离矩阵 (查询数, 候选数)。
+    """
+    distances = np.empty((len(query_codes), len(codes)), dtype=np.int32)
+    rows = max(1024, BLOCK_ROWS // max(1, len(query_codes)))
+    for start in range(0, len(codes), rows):
+        block = np.asarray(codes[start:start + rows])
+        distances[:, start:start + len(block)] = np.bitwise_count(
+            query_codes[:, None, :] ^ block[None, :, :]
+        ).sum(axis=-1, dtype=np.int32)
+    return distances
+
+def scores(queries: np.ndarray, matrix: np.ndarray, vector_type: str) -> np.ndarray:
+    """
+    单位查询向量与存储向量的余弦相似度 (查询数, 候选数)，分块解码后以 float32 计算。
+    """
+    if vector_type == "float32":
+        return queries @ np.asarray(matrix).T
+    out = np.empty((len(queries), len(matrix)), dtype=np.float32)
+    for start in range(0, len(matrix), BLOCK_ROWS):
+        block = decode(matrix[start:start + BLOCK_ROWS], vector_type)
+        out[:, start:start + len(block)] = queries @ block.T
+    return out
+
+def bytes_per_vector(dim: int, vector_type: str, binary: bool = False) -> int:
+    return dim * storage_dtype(vector_type).itemsize + ((dim + 7) // 8 if binary else 0)
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    每行得分最高的 k 个下标，按得分降序。
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((len(scores), 0), dtype=np.int64)
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1)
+
+def search(
+        queries: np.ndarray,
+        matrix: np.ndarray,
+        vector_type: str,
+        k: int,
+        codes: np.ndarray | None = None,
+        rescore_factor: int = 4,
+        subset: np.ndarray | None = None,
+        exclude: np.ndarray | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+    """
+    在量化向量上检索。给出二值码时先按汉明距离取 k * rescore_factor 个候选，
+    再以候选解码后的存储向量精排；否则直接计算全部行解码后的相似度。
+
+    :param queries: 单位查询向量 (查询数, 维度)，float32
+    :param subset: 只在这些行中检索，返回的下标相对于 subset
+    :param exclude: 不参与检索的行（不与 subset 同时使用），得分为 -inf
+    :return: (下标, 得分)，形状均为 (查询数, k)
+    """
+    if codes is None:
+        all_scores = scores(queries, matrix if subset is None else matrix[subset], vector_type)
+        if exclude is not None and len(exclude):
+            all_scores[:, exclude] = -np.inf
+        top = top_k(all_scores, k)
+        return top, np.take_along_axis(all_scores, top, axis=1)
+    distances = hamming(binary_codes(queries), codes if subset is None else codes[subset]).astype(np.float32)
+    if exclude is not None and len(exclude):
+        distances[:, exclude] = np.inf
+    fetch = min(k * rescore_factor, distances.shape[1])
+    candidates = top_k(-distances, fetch)
+    indices = np.empty((len(queries), min(k, fetch)), dtype=np.int64)
+    values = np.empty(indices.shape, dtype=np.float32)
+    for q, cand in enumerate(candidates):
+        # 按行号顺序读取，对 mmap 更友好
+        cand = np.sort(cand)
+        exact = decode(matrix[cand if subset is None else subset[cand]], vector_type) @ queries[q]
+        exact[~np.isfinite(distances[q, cand])] = -np.inf
+        best = top_k(exact[None, :], k)[0]
+        indices[q] = cand[best]
+        values[q] = exact[best]
+    return indices, values
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from utils.chunk_split import semantic_split
+    from utils.embedding import EmbeddingModel
+
+    # 召回率-内存基准：以项目自己的文档为语料，float32 精确检索结果为标准答案
+    parser = argparse.ArgumentParser(description="量化存储的召回率与内存对比")
+    parser.add_argument("root", nargs="?", default=os.path.join(currunt_dir, "..", "data"), help="Markdown 文档目录")
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=4)
+    args = parser.parse_args()
+
+    chunks = []
+    for dirpath, _, filenames in os.walk(args.root):
+        for filename in sorted(filenames):
+            if filename.endswith(".md"):
+                with open(os.path.join(dirpath, filename), "r", encoding="utf-8") as f:
+                    chunks.extend(semantic_split(f.read()))
+    vectors = normalize(EmbeddingModel().embed_batch(chunks))
+    # 每 10 个分块取 1 个作为查询，其余作为语料
+    is_query = np.arange(len(vectors)) % 10 == 0
+    queries, corpus = vectors[is_query], vectors[~is_query]
+    dim = corpus.shape[1]
+    k = min(args.top_k, len(corpus))
+    truth, _ = search(queries, corpus, "float32", k)
+    print(f"[OK] 语料 {len(corpus)} 条，查询 {len(queries)} 条，维度 {dim}，top_k {k}")
+
+    print(f"{'精度':<10}{'二值粗排':<10}{'字节/向量':>10}{'内存占比':>10}{'召回率':>10}{'耗时 ms':>10}")
+    for vector_type in VECTOR_TYPES:
+        matrix = encode(corpus, vector_type)
+        for binary in (False, True):
+            codes = binary_codes(corpus) if binary else None
+            start = time.perf_counter()
+            found, _ = search(queries, matrix, vector_type, k, codes, args.rescore_factor)
+            elapsed = (time.perf_counter() - start) * 1000
+            recall = np.mean([len(set(f) & set(t)) / k for f, t in zip(found, truth)])
+            size = bytes_per_vector(dim, vector_type, binary)
+            print(f"{vector_type:<10}{str(binary):<10}{size:>10}{size / (dim * 4):>10.1%}{recall:>10.3f}{elapsed:>10.1f}")
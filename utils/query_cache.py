@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import RAG
+
+class _Entry:
+    __slots__ = ("scope", "text", "vector", "results", "created")
+
+    def __init__(self, scope: tuple, text: str, vector: np.ndarray | None, results: list, created: float):
+        self.scope = scope
+        self.text = text
+        self.vector = vector
+        self.results = results
+        self.created = created
+
+class SemanticQueryCache:
+    """
+    检索结果的语义缓存：同一检索范围内，新查询向量与已缓存查询的余弦相似度
+    不低于 threshold 时直接返回缓存结果，不再检索向量库。
+
+    检索范围 scope 为 (数据库, 数据表元组, 其余检索参数...)，数据库为 metastore.meta_scope 形式的 "<后端>:<库名>"，数据表有写入或删除时
+    按表失效；条目超过 ttl 秒过期，超过 max_entries 时淘汰最久未使用的条目。
+    每次失效递增数据表的版本号，检索前用 generation 取得版本号并在 put 时传回，
+    检索期间发生过写入的结果不会写入缓存。
+
+    :param threshold: 命中所需的最低余弦相似度
+    :param ttl: 条目有效秒数
+    :param max_entries: 条目上限
+    """
+    def __init__(
+            self,
+            threshold: float = RAG["query_cache_threshold"],
+            ttl: float = RAG["query_cache_ttl"],
+            max_entries: int = RAG["query_cache_size"]
+        ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[int, _Entry] = OrderedDict()
+        self._scopes: dict[tuple, dict[int, None]] = {}
+        self._exact: dict[tuple, int] = {}
+        self._generations: dict[tuple[str, str], int] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _copy(results: list) -> list:
+        return [dict(hit) for hit in results]
+
+    def _drop(self, entry_id: int):
+        entry = self._entries.pop(entry_id)
+        ids = self._scopes.get(entry.scope)
+        if ids is not None:
+            ids.pop(entry_id, None)
+            if not ids:
+                del self._scopes[entry.scope]
+        if self._exact.get((entry.scope, entry.text)) == entry_id:
+            del self._exact[(entry.scope, entry.text)]
+
+    def _fresh(self, entry_id: int, now: float) -> bool:
+        if now - self._entries[entry_id].created > self.ttl:
+            self._drop(entry_id)
+            return False
+        return True
+
+    def get(self, scope: tuple, text: str, vector: list[float] | None = None) -> list | None:
+        """
+        先按查询文本精确匹配；给出查询向量时再按余弦相似度匹配。
+
+        :return: 缓存的检索结果副本，未命中返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry_id = self._exact.get((scope, text))
+            if entry_id is not None and self._fresh(entry_id, now):
+                self._entries.move_to_end(entry_id)
+                self.exact_hits += 1
+                return self._copy(self._entries[entry_id].results)
+            if vector is None:
+                return None
+            # _fresh 会删除过期条目，先复制再遍历
+            ids = [i for i in list(self._scopes.get(scope, {})) if self._fresh(i, now) and self._entries[i].vector is not None]
+            if not ids:
+                return None
+            query = np.asarray(vector, dtype=np.float32)
+            query /= np.linalg.norm(query) + 1e-12
+            scores = np.stack([self._entries[i].vector for i in ids]) @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                return None
+            self._entries.move_to_end(ids[best])
+            self.semantic_hits += 1
+            return self._copy(self._entries[ids[best]].results)
+
+    def _generation(self, scope: tuple) -> tuple:
+        return tuple(self._generations.get((scope[0], collection), 0) for collection in scope[1])
+
+    def generation(self, scope: tuple) -> tuple:
+        """
+        检索范围内各数据表的当前版本号，应在检索前读取并传给 put。
+        """
+        with self._lock:
+            return self._generation(scope)
+
+    def put(
+            self,
+            scope: tuple,
+            text: str,
+            vector: list[float] | None,
+            results: list,
+            generation: tuple | None = None
+        ):
+        """
+        :param generation: 检索前由 generation 取得的版本号，与当前不一致说明检索期间
+                           数据表有写入，结果可能已过期，不写入缓存
+        """
+        if vector is not None:
+            vector = np.asarray(vector, dtype=np.float32)
+            vector = vector / (np.linalg.norm(vector) + 1e-12)
+        with self._lock:
+            self.misses += 1
+            if generation is not None and generation != self._generation(scope):
+                return
+            old = self._exact.get((scope, text))
+            if old is not None:
+                self._drop(old)
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = _Entry(scope, text, vector, self._copy(results), time.monotonic())
+            self._scopes.setdefault(scope, {})[entry_id] = None
+            self._exact[(scope, text)] = entry_id
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, db_name: str, collection: str):
+        """
+        使涉及该数据表的所有缓存失效。
+
+        :param db_name: 数据库，与 scope 的第一项相同
+        """
+        with self._lock:
+            key = (db_name, collection)
+            self._generations[key] = self._generations.get(key, 0) + 1
+            for scope in [s for s in self._scopes if s[0] == db_name and collection in s[1]]:
+                for entry_id in list(self._scopes.get(scope, {})):
+                    self._drop(entry_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self._exact.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            total = hits + self.misses
+            return {
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": hits / total if total else 0.0,
+                "size": len(self._entries),
+                "max_entries": self.max_entries
+            }
+
+_cache: SemanticQueryCache | None = None
+_cache_lock = threading.Lock()
+
+def get_query_cache() -> SemanticQueryCache:
+    """
+    获取进程内共享的检索结果缓存，同一进程内的 RAGDatabase 实例写入时相互失效。
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticQueryCache()
+        return _cache
+
+if __name__ == "__main__":
+    # 检索期间数据表被写入：检索前取得的版本号已过期，结果不应写入缓存
+    cache = SemanticQueryCache(threshold=0.9, ttl=60, max_entries=8)
+    scope = ("db", ("t",), "5")
+    generation = cache.generation(scope)
+    cache.invalidate("db", "t")
+    cache.put(scope, "q", [1.0, 0.0], [{"chunk": "old"}], generation)
+    assert cache.get(scope, "q") is None
+    cache.put(scope, "q", [1.0, 0.0], [{"chunk": "new"}], cache.generation(scope))
+    assert cache.get(scope, "q") == [{"chunk": "new"}]
+    # 其他数据表的写入不影响
+    generation = cache.generation(scope)
+    cache.invalidate("db", "other")
+    cache.put(scope, "p", None, [], generation)
+    assert cache.get(scope, "p") == []
+    print("[OK] 检索期间有写入时不缓存过期结果")
+
+    # 条目过期后再次检索：过期条目在遍历中被删除，不应报错
+    cache = SemanticQueryCache(threshold=0.9, ttl=0.05, max_entries=8)
+    cache.put(scope, "q", [1.0, 0.0], [{"chunk": "a"}])
+    cache.put(scope, "r", [0.0, 1.0], [{"chunk": "b"}])
+    time.sleep(0.1)
+    assert cache.get(scope, "s", [1.0, 0.1]) is None and cache.stats()["size"] == 0
+    print("[OK] 过期条目不影响语义检索")
@@ -1,13 +1,22 @@
-import json
 import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
-DATA_PATH = os.path.join(currunt_dir, "..", "data")
-from utils import EmbeddingModel, semantic_split
+from config import RAG
+from utils.embedding import EmbeddingModel, model_dim
+from utils.vectorstore import VectorStore, make_store
+from utils.metastore import MetaStore, get_meta_store, meta_scope
+from utils.bm25 import BM25Index, get_bm25_index, rrf
+from utils.query_cache import SemanticQueryCache, get_query_cache
+from utils.rerank import mmr as mmr_select
 
+import hashlib
+import heapq
+import json
+import threading
+from contextlib import ExitStack
+import numpy as np
 from typing import Optional
-# from concurrent.futures import ThreadPoolExecutor
-from pymilvus import MilvusClient, DataType
+from concurrent.futures import ThreadPoolExecutor
 
 def create_milvus(
         url: str = "http://localhost:19530",
@@ -20,6 +29,7 @@ def create_milvus(
     :param name: 数据库名称
     :return: 如果数据库已存在或创建成功，返回 True；否则返回 False
     """
+    from pymilvus import MilvusClient
     try:
         client = MilvusClient(
             url,
@@ -45,6 +55,7 @@ def create_milvus(
 def list_databases(
     url: str = "http://localhost:19530"
     ) -> list:
+    from pymilvus import MilvusClient
     try:
         client = MilvusClient(
             url,
@@ -63,6 +74,7 @@ def delete_database(
         url: str = "http://localhost:19530",
         name: str = "CodexAidBooks"
     ) -> bool:
+    from pymilvus import MilvusClient
     try:
         client = MilvusClient(
             url,
@@ -88,47 +100,151 @@ def delete_database(
         print(f"[ERROR] 删除数据库 {name} 失败:", e)
         return False
 
+_doc_locks: dict[tuple[str, str], threading.Lock] = {}
+_doc_locks_guard = threading.Lock()
+
+def _doc_lock(db_name: str, doc_id: str) -> threading.Lock:
+    """
+    同一文档的写入在进程内串行执行。
+    """
+    with _doc_locks_guard:
+        return _doc_locks.setdefault((db_name, doc_id), threading.Lock())
+
+def chunk_hash(chunk_text: str) -> str:
+    return hashlib.sha256(chunk_text.encode("utf-8")).hexdigest()
+
+def row_bytes(row: dict) -> int:
+    """
+    估算一行数据在写入请求中的字节数：文本字段按 UTF-8 长度，向量按每维 4 字节。
+    """
+    size = 64
+    for key, value in row.items():
+        if key == "embedding":
+            size += 4 * len(value)
+        elif isinstance(value, str):
+            size += len(value.encode("utf-8"))
+    return size
+
+def split_rows(rows: list[dict], max_rows: int, max_bytes: int):
+    """
+    按行数与估算字节数上限切分写入批次，单行超过上限时独占一批。
+    """
+    batch, size = [], 0
+    for row in rows:
+        cost = row_bytes(row)
+        if batch and (len(batch) >= max_rows or size + cost > max_bytes):
+            yield batch
+            batch, size = [], 0
+        batch.append(row)
+        size += cost
+    if batch:
+        yield batch
+
 class RAGDatabase:
     def __init__(
             self, 
-            url: str = "http://localhost:19530",
-            name: str = "CodexAidBooks"
+            url: str = RAG["milvus_url"],
+            name: str = RAG["db_name"],
+            backend: str | VectorStore = RAG["backend"],
+            layout: str = RAG["layout"],
+            meta: MetaStore | None = None,
+            cache: SemanticQueryCache | bool = RAG["query_cache"]
         ):
         """
         初始化 RAGDatabase 类的实例。
 
         :param url: 数据库的 URL 地址
         :param name: 数据库名称
+        :param backend: 存储后端，"milvus"、"local" 或 VectorStore 实例
+        :param layout: 存储布局，"shared" 所有文档共用一个按 doc_id 分区的数据表，
+                       table 参数表示文档集；"table" 每个文档一个数据表
+        :param meta: 文档元数据存储，默认使用进程内共享的 MetaStore，按后端与数据库名隔离
+        :param cache: 检索结果语义缓存，True 使用进程内共享的缓存，False 关闭
         """
+        if layout not in ("shared", "table"):
+            raise ValueError(f"Unknown RAG layout: {layout}")
         self.name = name
-        self.embedder = EmbeddingModel()
-        self.dim = len(self.embedder.embed("test"))
-
-        if not create_milvus(
-            url=url,
-            name=name
-        ):
-            raise Exception(f"[ERROR] 启动 Milvus 数据库 {name} 失败")
-        
-        self.client = MilvusClient(
-            uri=url,
-            token="root:Milvus"
-        )
-        self.client.use_database(
-            db_name=name
-        )
+        self.layout = layout
+        self.collection = RAG["collection"]
+        # 元数据、检索缓存与 BM25 索引按后端与数据库名隔离
+        self.scope = meta_scope(backend if isinstance(backend, str) else type(backend).__name__, name)
+        self.meta = meta or get_meta_store(scope=self.scope)
+        if cache is True:
+            cache = get_query_cache()
+        self.cache: SemanticQueryCache | None = cache or None
+        self._pool: ThreadPoolExecutor | None = None
+        self._pool_lock = threading.Lock()
+        # 存储后端、向量模型与维度均在首次使用时初始化，构造本身不发起任何网络请求
+        self._url = url
+        self._backend = backend
+        self._store: VectorStore | None = backend if isinstance(backend, VectorStore) else None
+        self._embedder: EmbeddingModel | None = None
+        self._dim: int | None = None
+        self._init_lock = threading.Lock()
 
     def __del__(self):
-        self.client.close()
+        if getattr(self, "_pool", None) is not None:
+            self._pool.shutdown(wait=False)
+        if self.__dict__.get("_store") is not None:
+            self._store.close()
+
+    @property
+    def store(self) -> VectorStore:
+        if self._store is None:
+            with self._init_lock:
+                if self._store is None:
+                    self._store = make_store(self._backend, self._url, self.name)
+        return self._store
+
+    @property
+    def embedder(self) -> EmbeddingModel:
+        if self._embedder is None:
+            with self._init_lock:
+                if self._embedder is None:
+                    self._embedder = EmbeddingModel()
+        return self._embedder
+
+    @property
+    def dim(self) -> int:
+        """
+        向量维度：依次取配置或模型表、已有数据表的 schema，都没有时才发一次探测请求。
+        """
+        if self._dim is None:
+            dim = model_dim(self.embedder.model_name)
+            if dim is None:
+                collections = [self.collection] if self.layout == "shared" else self.store.list_collections()
+                if collections:
+                    dim = self.store.dimension(collections[0])
+            self._dim = dim or self.embedder.dim
+        return self._dim
+
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="ragdb")
+            return self._pool
+
+    def _lexical(self, collection: str) -> BM25Index:
+        return get_bm25_index(self.scope, collection)
+
+    def _invalidate(self, collection: str):
+        if self.cache:
+            self.cache.invalidate(self.scope, collection)
+
+    def _scope(self, collections: list[str], *params) -> tuple:
+        return (self.scope, tuple(collections), *(json.dumps(p, sort_keys=True, ensure_ascii=False) for p in params))
 
     def list_collection(self) -> list:
         """
-        列出当前数据库中的所有数据表。
+        列出当前数据库中的所有数据表；共享布局下列出所有文档集。
 
         :return: 数据表名称列表
         """
         try:
-            databases = self.client.list_collections()
+            if self.layout == "shared":
+                databases = self.meta.list_sets()
+            else:
+                databases = self.store.list_collections()
             print("[OK] 当前数据表列表：")
             for db in databases:
                 print(f"  - {db}")
@@ -139,143 +255,768 @@ class RAGDatabase:
     
     def delete_collection(self, table: str) -> None:
         """
-        删除指定的数据表。
+        删除指定的数据表；共享布局下删除该文档集中的全部文档。
 
         :param table: 要删除的数据表名称
         """
         try:
-            if not self.client.has_collection(table):
-                print(f"[OK] 数据表 {table} 不存在")
-                return
-            self.client.drop_collection(
-                collection_name=table
-            )
-            with open(os.path.join(DATA_PATH, "original.json"), "r", encoding="utf-8") as f:
-                original_data = json.load(f)
-            if table in original_data:
-                del original_data[table]
-            with open(os.path.join(DATA_PATH, "original.json"), "w", encoding="utf-8") as f:
-                json.dump(original_data, f, ensure_ascii=False, indent=4)
+            if self.layout == "shared":
+                if not self.store.has_collection(self.collection):
+                    print(f"[OK] 数据表 {table} 不存在")
+                    return
+                self.store.delete(self.collection, filter={"doc_set": table})
+                self._lexical(self.collection).delete(filter={"doc_set": table})
+                self._invalidate(self.collection)
+            else:
+                if not self.store.has_collection(table):
+                    print(f"[OK] 数据表 {table} 不存在")
+                    return
+                self.store.drop_collection(table)
+                self._lexical(table).drop()
+                self._invalidate(table)
+            self.meta.delete_set(table)
             print(f"[OK] 数据表 {table} 已删除")
         except Exception as e:
             print("[ERROR] 删除数据库失败:", e)
 
-    def _table_create(self, table: str) -> None:
+    def delete_document(self, doc_id: str) -> None:
+        """
+        删除单个文档的全部分块。
+
+        :param doc_id: 文档 ID
+        """
+        try:
+            if self.layout == "shared":
+                if self.store.has_collection(self.collection):
+                    self.store.delete(self.collection, filter={"doc_id": doc_id})
+                    self._lexical(self.collection).delete(filter={"doc_id": doc_id})
+                    self._invalidate(self.collection)
+            elif self.store.has_collection(doc_id):
+                self.store.drop_collection(doc_id)
+                self._lexical(doc_id).drop()
+                self._invalidate(doc_id)
+            self.meta.delete([doc_id])
+            print(f"[OK] 文档 {doc_id} 已删除")
+        except Exception as e:
+            print(f"[ERROR] 删除文档 {doc_id} 失败:", e)
+
+    def _table_create(self, table: str, dim: Optional[int] = None) -> None:
         """
         创建RAG数据表
+
+        :param dim: 向量维度，默认取 self.dim；导入快照时由快照给出，避免探测向量模型
         """
         # 分块表
-        if not self.client.has_collection(table):
+        if not self.store.has_collection(table):
             print(f"[OK] 创建数据表 {table}")
-            schema = MilvusClient.create_schema(
-                auto_id=True,
-                enable_dynamic_field=True,
-            )
-            schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
-            schema.add_field(field_name="chunk_text", datatype=DataType.VARCHAR, max_length=2048)
-            schema.add_field(field_name="embedding", datatype=DataType.FLOAT_VECTOR, dim=self.dim)
-
-            index_params = self.client.prepare_index_params()
-            index_params.add_index(
-                field_name="id",
-                index_type="AUTOINDEX"
-            )
-
-            index_params.add_index(
-                field_name="embedding", 
-                index_type="AUTOINDEX",
-                metric_type="COSINE"
-            )
-
-            self.client.create_collection(
-                collection_name=table,
-                schema=schema,
-                index_params=index_params
+            self.store.create_collection(
+                table,
+                dim or self.dim,
+                partition_key="doc_id" if self.layout == "shared" else None,
+                vector_type=RAG["vector_type"],
+                binary=RAG["binary_prefilter"]
             )
         else:
             print(f"[OK] 数据表 {table} 已存在")
 
-        res = self.client.get_load_state(
-            collection_name=table
-        )
-        print(f"[OK] Vector index {res}.")
-
     def insert_data(
             self, 
             title: str, 
             content: str, 
             source: Optional[str] = None, 
             description: Optional[str] = None,
-            table: str = None
-        ):
-        if not table:
-            table = title.replace(" ", "_").replace("/", "_")
-        self._table_create(table)
+            table: str = None,
+            doc_id: Optional[str] = None
+        ) -> dict:
+        """
+        分块、向量化并写入一个文档；文档已存在时按分块内容哈希增量更新：
+        只向量化并写入新增分块，删除已不存在的分块，未变化的分块保持不动。
+        分块经 BulkWriter 流式向量化并按大小分批写入，大文档不会产生超大的写入请求。
+
+        :param title: 文档标题
+        :param content: 文档正文
+        :param source: 文档来源
+        :param description: 文档描述
+        :param table: 旧布局下为数据表名；共享布局下为文档集名称，默认 "default"
+        :param doc_id: 文档 ID，默认由 table（旧布局）或标题生成
+        :return: {"added": 新增分块数, "removed": 删除分块数, "kept": 保留分块数}
+        """
+        from utils.bulk_writer import BulkWriter
+        stats = BulkWriter(self, table).write(title, content, source, description, doc_id)
+        return {k: stats[k] for k in ("added", "removed", "kept")}
+
+    def export_snapshot(self, path: str, table: Optional[str] = None, **kwargs) -> dict:
+        """
+        导出数据表的分块文本、向量与文档元数据为快照目录，见 utils.snapshot.export_snapshot。
+
+        :param path: 快照目录
+        :param table: 只导出该数据表（共享布局下为文档集），None 表示全部
+        :return: 快照 manifest
+        """
+        from utils.snapshot import export_snapshot
+        return export_snapshot(self, path, table, **kwargs)
+
+    def import_snapshot(self, path: str, verify: bool = True) -> dict:
+        """
+        校验并导入快照，直接写入快照中的向量，不调用向量模型。见 utils.snapshot.import_snapshot。
+
+        :param path: 快照目录
+        :param verify: 写入前校验全部文件的 sha256
+        :return: {"documents", "chunks", "parts"}
+        """
+        from utils.snapshot import import_snapshot
+        return import_snapshot(self, path, verify)
+
+    def _doc_id(self, title: str, table: Optional[str], doc_id: Optional[str]) -> str:
+        if doc_id:
+            return doc_id
+        if self.layout == "table" and table:
+            return table
+        return title.replace(" ", "_").replace("/", "_")
+
+    def _prepare(
+            self,
+            title: str,
+            source: Optional[str],
+            description: Optional[str],
+            table: Optional[str],
+            doc_id: Optional[str]
+        ) -> dict:
+        """
+        确定文档的目标数据表、元数据与可增量复用的已入库分块（不修改任何数据）。
+
+        :return: {"doc_id", "collection", "info", "existing": {哈希: 分块 ID}, "replace": 需整篇清除的旧数据表,
+                  "stale": 整篇替换时需清除记录的旧分块哈希}
+        """
+        doc_id = self._doc_id(title, table, doc_id)
+        if self.layout == "shared":
+            doc_set = table or "default"
+            collection = self.collection
+        else:
+            collection = table or doc_id
+            doc_set = collection
         table_inf = {
             "title": title,
             "source": source,
-            "description": description
+            "description": description,
+            "doc_set": doc_set
         }
-        chunks = semantic_split(content)
+        existing, replace, stale = self._stored(doc_id, table_inf)
+        return {
+            "doc_id": doc_id,
+            "collection": collection,
+            "info": table_inf,
+            "existing": existing,
+            "replace": replace,
+            "stale": stale
+        }
+
+    def _stored(self, doc_id: str, info: dict) -> tuple[dict[str, int], Optional[str], list[str]]:
+        """
+        读取文档当前已入库的分块记录。
+
+        :return: (可复用的分块 {哈希: 分块 ID}, 需整篇清除的旧数据表, 整篇替换时需清除记录的旧分块哈希)
+        """
+        existing = self.meta.get_chunks(doc_id)
+        old_info = self.meta.get(doc_id)
+        replace, stale = None, []
+        if old_info is not None and (not existing or any(
+                (old_info.get(f) or None) != (info.get(f) or None) for f in ("title", "source", "doc_set"))):
+            # 分块上冗余存储的字段变化，或旧数据没有分块记录：整篇替换
+            replace = old_info.get("doc_set") if self.layout == "table" else self.collection
+            stale, existing = list(existing), {}
+        return existing, replace, stale
+
+    @staticmethod
+    def _diff(plan: dict, existing: dict[str, int], stale: list[str]):
+        """
+        按已入库分块填入计划的 "new"、"removed"、"removed_ids"。
+        """
+        removed = stale + [h for h in existing if h not in plan["chunks"]]
+        plan["new"] = [h for h in plan["chunks"] if h not in existing]
+        plan["removed"] = removed
+        plan["removed_ids"] = [existing[h] for h in removed if h in existing]
+
+    def _plan(
+            self,
+            title: str,
+            chunks: list[str],
+            source: Optional[str],
+            description: Optional[str],
+            table: Optional[str],
+            doc_id: Optional[str]
+        ) -> dict:
+        """
+        对比已入库分块，得出文档的增量写入计划（不修改任何数据）。
 
+        :return: {"doc_id", "collection", "info", "chunks": {哈希: 文本}, "new": 待写入哈希,
+                  "removed": 待删除哈希, "removed_ids": 待删除分块 ID, "replace": 需整篇清除的旧数据表}
+        """
+        plan = self._prepare(title, source, description, table, doc_id)
+        existing = plan.pop("existing")
+        stale = plan.pop("stale")
+        # 同一文档内重复的分块只保留一份
+        plan["chunks"] = {}
+        for chunk_text in chunks:
+            plan["chunks"].setdefault(chunk_hash(chunk_text), chunk_text)
+        self._diff(plan, existing, stale)
+        return plan
+
+    def _commit(self, plans: list[dict], embeddings: list[list[list[float]]]):
+        """
+        执行写入计划：同一数据表的新增分块合并为一次写入，再逐文档提交元数据并删除过期分块。
+
+        计划在持有文档写锁后按最新的分块记录重新核对，生成计划之后其他写入已提交的分块不会重复写入，
+        "new"、"removed" 等字段更新为实际执行的内容。同一文档的多个计划依次提交。
+
+        :param plans: _plan 返回的写入计划
+        :param embeddings: 与每个计划的 "new" 一一对应的向量
+        """
+        rounds: list[dict[str, tuple[dict, list]]] = []
+        for plan, vectors in zip(plans, embeddings):
+            for group in rounds:
+                if plan["doc_id"] not in group:
+                    group[plan["doc_id"]] = (plan, vectors)
+                    break
+            else:
+                rounds.append({plan["doc_id"]: (plan, vectors)})
+        for group in rounds:
+            with ExitStack() as stack:
+                for doc_id in sorted(group):
+                    stack.enter_context(_doc_lock(self.name, doc_id))
+                self._commit_locked(*zip(*[self._recheck(plan, vectors) for plan, vectors in group.values()]))
 
-        # def embed_chunk(chunk_text):
-        #     return {
-        #         "chunk_text": chunk_text,
-        #         "embedding": self.embedder.embed(chunk_text)
-        #     }
-        # with ThreadPoolExecutor() as executor:
-        #     milvus_data = list(executor.map(embed_chunk, chunks))
+    def _recheck(self, plan: dict, vectors: list[list[float]]) -> tuple[dict, list[list[float]]]:
+        """
+        按当前分块记录重新核对计划，返回计划与新的 "new" 对应的向量；
+        生成计划后被其他写入删除的分块在此补做向量化。
+        """
+        embedded = dict(zip(plan["new"], vectors))
+        existing, plan["replace"], stale = self._stored(plan["doc_id"], plan["info"])
+        self._diff(plan, existing, stale)
+        missing = [h for h in plan["new"] if h not in embedded]
+        if missing:
+            embedded.update(zip(missing, self.embedder.embed_batch([plan["chunks"][h] for h in missing])))
+        return plan, [embedded[h] for h in plan["new"]]
 
+    def _commit_locked(self, plans: list[dict], embeddings: list[list[list[float]]]):
+        collections = dict.fromkeys(plan["collection"] for plan in plans)
+        for collection in collections:
+            self._table_create(collection)
 
-        milvus_data = [
-            {
-                "chunk_text": chunk_text,
-                "embedding": self.embedder.embed(chunk_text)
+        for collection in collections:
+            group = [(plan, vectors) for plan, vectors in zip(plans, embeddings) if plan["collection"] == collection]
+            rows = [
+                {
+                    "chunk_text": plan["chunks"][h],
+                    "embedding": embedding,
+                    "doc_id": plan["doc_id"],
+                    "title": plan["info"]["title"],
+                    "source": plan["info"]["source"] or "",
+                    "doc_set": plan["info"]["doc_set"]
+                }
+                for plan, vectors in group
+                for h, embedding in zip(plan["new"], vectors)
+            ]
+            ids = self._insert(collection, rows)
+            offset = 0
+            for plan, _ in group:
+                added = dict(zip(plan["new"], ids[offset:offset + len(plan["new"])]))
+                offset += len(plan["new"])
+                self._commit_document(plan, added)
+
+    def _commit_document(self, plan: dict, added: dict[str, int]):
+        """
+        新增分块全部写入后提交一个文档：登记元数据与分块记录，删除过期分块；
+        整篇替换时最后才清除旧数据，写入失败不会丢失原文档。
+
+        :param plan: 含 "doc_id"、"collection"、"info"、"removed"、"removed_ids"、"replace" 的写入计划
+        :param added: 本次写入的分块 {哈希: 分块 ID}
+        """
+        collection = plan["collection"]
+        self.meta.update_document(plan["doc_id"], plan["info"], added, plan["removed"])
+        self._discard(collection, plan["removed_ids"])
+        if plan["replace"]:
+            # 分块 ID 只在同一数据表内唯一，旧数据在其他数据表时整篇清除
+            keep = added.values() if plan["replace"] == collection else ()
+            self._clear_document(plan["replace"], plan["doc_id"], keep=keep)
+        self._invalidate(collection)
+
+    def _clear_document(self, collection: str, doc_id: str, keep=()):
+        """
+        按 doc_id 清除文档在数据表中的全部分块，keep 中的分块 ID 除外。
+        旧版数据表的分块不带 doc_id，与 _resolve 一致视为属于以数据表名为 doc_id 的文档。
+        """
+        if not self.store.has_collection(collection):
+            return
+        keep = set(keep)
+        if self.layout == "table" and collection == doc_id:
+            self._discard(collection, [
+                row["id"] for rows, _ in self.store.scan(collection)
+                for row in rows if (row.get("doc_id") or collection) == doc_id and row["id"] not in keep
+            ])
+        elif keep:
+            self._discard(collection, [
+                row["id"] for rows, _ in self.store.scan(collection, filter={"doc_id": doc_id})
+                for row in rows if row["id"] not in keep
+            ])
+        else:
+            self.store.delete(collection, filter={"doc_id": doc_id})
+            self._lexical(collection).delete(filter={"doc_id": doc_id})
+        self._invalidate(collection)
+
+    def _insert_batch(self, collection: str, rows: list[dict]) -> list[int]:
+        """
+        写入一个批次并加入 BM25 索引。
+        """
+        ids = self.store.insert(collection, rows) if rows else []
+        self._lexical(collection).add(ids, rows)
+        return ids
+
+    def _discard(self, collection: str, ids) -> None:
+        """
+        按分块 ID 从向量库与 BM25 索引中删除，用于回滚与删除过期分块。
+        """
+        ids = list(ids)
+        if ids:
+            self.store.delete(collection, ids=ids)
+            self._lexical(collection).delete(ids=ids)
+
+    def _insert(
+            self,
+            collection: str,
+            rows: list[dict],
+            batch_rows: int = RAG["insert_batch_rows"],
+            batch_bytes: int = RAG["insert_batch_bytes"]
+        ) -> list[int]:
+        """
+        按行数与字节数上限切分后并行写入，并加入 BM25 索引；返回与 rows 一一对应的分块 ID。
+
+        任一批次失败时删除已写入的批次后抛出异常。
+        """
+        batches = list(split_rows(rows, batch_rows, batch_bytes))
+        if len(batches) <= 1:
+            return self._insert_batch(collection, rows)
+        futures = [self._executor().submit(self._insert_batch, collection, batch) for batch in batches]
+        done, error = [], None
+        for future in futures:
+            try:
+                done.append(future.result())
+            except Exception as e:
+                error = error or e
+        if error is not None:
+            self._discard(collection, [i for ids in done for i in ids])
+            raise error
+        return [i for batch_ids in done for i in batch_ids]
+
+    def query(
+            self,
+            table: Optional[str],
+            text: str,
+            top_k: int = 5,
+            filters: Optional[dict] = None,
+            mode: str = RAG["query_mode"],
+            mmr: bool = RAG["mmr"],
+            fetch_k: Optional[int] = None,
+            mmr_lambda: float = RAG["mmr_lambda"]
+        ):
+        """
+        语义检索。
+
+        :param table: 旧布局下为要检索的数据表；共享布局下为文档集，None 表示检索全部文档
+        :param text: 查询文本
+        :param top_k: 返回条数
+        :param filters: 元数据过滤条件，如 {"source": "xxx"}、{"title": ["a", "b"]}，
+                        可用字段为 doc_id、title、source、doc_set
+        :param mode: "vector" 向量检索；"lexical" BM25 关键词检索；
+                     "hybrid" 两路候选按倒数排名融合 (RRF)，适合 API 名等精确词查询
+        :param mmr: 是否做最大边际相关 (MMR) 重排，去掉相邻分块之类的近似重复结果
+        :param fetch_k: MMR 的候选数，默认 top_k * RAG_MMR_FETCH_FACTOR
+        :param mmr_lambda: MMR 相关度权重，1 只看相关度，0 只看多样性
+        :return: [{"chunk", "doc_id", "title", "source", "description", "similarity", "score"}]，
+                 similarity 为余弦相似度（仅由关键词命中时为 None），score 为排序依据
+        """
+        collection, filters = self._target(table, filters)
+        if not self.store.has_collection(collection):
+            return []
+
+        fetch_k = self._fetch_k(top_k, mmr, fetch_k)
+        scope = self._scope([collection], top_k, filters, mode, *self._mmr_scope(mmr, fetch_k, mmr_lambda))
+        cached = self.cache.get(scope, text) if self.cache else None
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(scope) if self.cache else None
+        qvecs = [self.embedder.embed(text)] if mode != "lexical" else None
+        if self.cache and qvecs:
+            cached = self.cache.get(scope, text, qvecs[0])
+            if cached is not None:
+                return cached
+        groups = self._retrieve(collection, [text], qvecs, fetch_k, filters, mode, vectors=mmr)
+        if mmr:
+            groups = self._diversify(groups, qvecs, top_k, mmr_lambda)
+        results = self._resolve(groups)[0]
+        if self.cache:
+            self.cache.put(scope, text, qvecs[0] if qvecs else None, results, generation)
+        return results
+
+    def query_batch(
+            self,
+            table: Optional[str],
+            texts: list[str],
+            top_k: int = 5,
+            filters: Optional[dict] = None,
+            mode: str = RAG["query_mode"],
+            mmr: bool = RAG["mmr"],
+            fetch_k: Optional[int] = None,
+            mmr_lambda: float = RAG["mmr_lambda"]
+        ) -> list[list[dict]]:
+        """
+        批量语义检索：所有查询一次向量化、一次多向量检索、一次元数据查询。
+
+        :param table: 同 query
+        :param texts: 查询文本列表
+        :param top_k: 每个查询的返回条数
+        :param filters: 元数据过滤条件，同 query
+        :param mode: 检索模式，同 query
+        :param mmr: MMR 重排参数 mmr、fetch_k、mmr_lambda 同 query
+        :return: 与 texts 一一对应的检索结果列表
+        """
+        if not texts:
+            return []
+        collection, filters = self._target(table, filters)
+        if not self.store.has_collection(collection):
+            return [[] for _ in texts]
+
+        fetch_k = self._fetch_k(top_k, mmr, fetch_k)
+
+        def search(indices: list[int]) -> list[list[dict]]:
+            vectors = [qvecs[i] for i in indices] if qvecs else None
+            groups = self._retrieve(collection, [texts[i] for i in indices], vectors, fetch_k, filters, mode, vectors=mmr)
+            if mmr:
+                groups = self._diversify(groups, vectors, top_k, mmr_lambda)
+            return self._resolve(groups)
+
+        qvecs = self.embedder.embed_batch(texts) if mode != "lexical" else None
+        if not self.cache:
+            return search(list(range(len(texts))))
+
+        # 只检索未命中缓存的查询
+        scope = self._scope([collection], top_k, filters, mode, *self._mmr_scope(mmr, fetch_k, mmr_lambda))
+        generation = self.cache.generation(scope)
+        results = [self.cache.get(scope, text, qvecs[i] if qvecs else None) for i, text in enumerate(texts)]
+        missing = [i for i, r in enumerate(results) if r is None]
+        if missing:
+            found = search(missing)
+            for i, hits in zip(missing, found):
+                results[i] = hits
+                self.cache.put(scope, texts[i], qvecs[i] if qvecs else None, hits, generation)
+        return results
+
+    def query_many_tables(
+            self,
+            tables: Optional[list[str]],
+            text: str,
+            top_k: int = 5,
+            min_similarity: Optional[float] = None,
+            filters: Optional[dict] = None,
+            mode: str = RAG["query_mode"],
+            mmr: bool = RAG["mmr"],
+            fetch_k: Optional[int] = None,
+            mmr_lambda: float = RAG["mmr_lambda"]
+        ):
+        """
+        跨多个数据表检索：查询只向量化一次，各数据表并发检索后按得分合并为全局 top_k。
+        开启 MMR 时合并为全局 fetch_k 个候选后再重排。
+
+        :param tables: 要检索的数据表（共享布局下为文档集），None 表示全部
+        :param text: 查询文本
+        :param top_k: 返回条数
+        :param min_similarity: 余弦相似度下限，低于该值的结果被丢弃（仅由关键词命中的结果保留）
+        :param filters: 元数据过滤条件，同 query
+        :param mode: 检索模式，同 query
+        :param mmr: MMR 重排参数 mmr、fetch_k、mmr_lambda 同 query
+        :return: 同 query，按得分降序；开启 MMR 时按 MMR 选择顺序
+        """
+        filters = dict(filters or {})
+        if self.layout == "shared":
+            # 共享布局下所有文档在同一数据表中，一次检索即可覆盖
+            if tables is not None:
+                filters["doc_set"] = list(tables)
+            collections = [self.collection] if self.store.has_collection(self.collection) else []
+        else:
+            existing = self.store.list_collections()
+            collections = existing if tables is None else [t for t in tables if t in existing]
+        if not collections:
+            return []
+
+        fetch_k = self._fetch_k(top_k, mmr, fetch_k)
+        scope = self._scope(collections, top_k, filters, mode, min_similarity, *self._mmr_scope(mmr, fetch_k, mmr_lambda))
+        cached = self.cache.get(scope, text) if self.cache else None
+        if cached is not None:
+            return cached
+        generation = self.cache.generation(scope) if self.cache else None
+        qvecs = [self.embedder.embed(text)] if mode != "lexical" else None
+        if self.cache and qvecs:
+            cached = self.cache.get(scope, text, qvecs[0])
+            if cached is not None:
+                return cached
+        complete = True
+        if len(collections) == 1:
+            hits = self._retrieve(collections[0], [text], qvecs, fetch_k, filters, mode, vectors=mmr)[0]
+        else:
+            futures = {
+                collection: self._executor().submit(
+                    self._retrieve, collection, [text], qvecs, fetch_k, filters, mode, vectors=mmr
+                )
+                for collection in collections
             }
-            for chunk_text in chunks
+            hits = []
+            for collection, future in futures.items():
+                try:
+                    hits.extend(future.result()[0])
+                except Exception as e:
+                    print(f"[ERROR] 检索数据表 {collection} 失败:", e)
+                    complete = False
+        if min_similarity is not None:
+            hits = [h for h in hits if h[1]["distance"] is None or h[1]["distance"] >= min_similarity]
+        groups = [heapq.nlargest(fetch_k, hits, key=lambda h: h[1].get("score", h[1]["distance"]))]
+        if mmr:
+            groups = self._diversify(groups, qvecs, top_k, mmr_lambda)
+        results = self._resolve(groups)[0]
+        if self.cache and complete:
+            self.cache.put(scope, text, qvecs[0] if qvecs else None, results, generation)
+        return results
+
+    def query_all(
+            self,
+            text: str,
+            top_k: int = 5,
+            min_similarity: Optional[float] = None,
+            filters: Optional[dict] = None,
+            mode: str = RAG["query_mode"],
+            mmr: bool = RAG["mmr"],
+            fetch_k: Optional[int] = None,
+            mmr_lambda: float = RAG["mmr_lambda"]
+        ):
+        """
+        检索全部数据表，见 query_many_tables。
+        """
+        return self.query_many_tables(None, text, top_k, min_similarity, filters, mode, mmr, fetch_k, mmr_lambda)
+
+    def _target(self, table: Optional[str], filters: Optional[dict]) -> tuple[str, dict]:
+        """
+        按存储布局确定要检索的数据表与过滤条件。
+        """
+        filters = dict(filters or {})
+        if self.layout == "shared":
+            if table:
+                filters["doc_set"] = table
+            return self.collection, filters
+        if not table:
+            raise ValueError("table layout requires a table to query")
+        return table, filters
+
+    def _search(
+            self,
+            collection: str,
+            qvecs: list[list[float]],
+            top_k: int,
+            filters: dict,
+            vectors: bool = False
+        ) -> list[list[tuple[str, dict]]]:
+        res = self.store.search(
+            collection,
+            qvecs,
+            top_k,
+            output_fields=["chunk_text", "doc_id", "title", "source"],
+            filter=filters or None,
+            return_vectors=vectors
+        )
+        return [[(collection, hit) for hit in hits] for hits in res]
+
+    def _retrieve(
+            self,
+            collection: str,
+            texts: list[str],
+            qvecs: Optional[list[list[float]]],
+            top_k: int,
+            filters: dict,
+            mode: str,
+            vectors: bool = False
+        ) -> list[list[tuple[str, dict]]]:
+        """
+        按检索模式获取候选；混合模式下两路各取 4 * top_k 个候选做 RRF 融合。
+        vectors 为 True 时向量检索的候选附带 "vector"。
+        """
+        if mode == "vector":
+            return self._search(collection, qvecs, top_k, filters, vectors)
+        if mode not in ("lexical", "hybrid"):
+            raise ValueError(f"Unknown query mode: {mode}")
+        fetch_k = top_k if mode == "lexical" else top_k * 4
+        index = self._lexical(collection)
+        # 仅由关键词命中的候选没有余弦相似度
+        lexical = [[{**hit, "distance": None} for hit in index.search(text, fetch_k, filters or None)] for text in texts]
+        if mode == "lexical":
+            return [[(collection, hit) for hit in hits] for hits in lexical]
+        dense = self._search(collection, qvecs, fetch_k, filters, vectors)
+        return [
+            [(collection, hit) for hit in rrf([[h for _, h in d], l])[:top_k]]
+            for d, l in zip(dense, lexical)
         ]
 
-        self.client.insert(collection_name=table, data=milvus_data)
-        print(f"[OK] 已插入 {len(milvus_data)} 条数据到 {table} 数据表")
-
-        original_data = {}
-        if os.path.exists(os.path.join(DATA_PATH, "original.json")):
-            with open(os.path.join(DATA_PATH, "original.json"), "r", encoding="utf-8") as f:
-                original_data = json.load(f)
-        original_data[table] = table_inf
-        with open(os.path.join(DATA_PATH, "original.json"), "w", encoding="utf-8") as f:
-            json.dump(original_data, f, ensure_ascii=False, indent=4)
-        print(f"[OK] 已更新表信息")
-
-    def query(self, table: str, text: str, top_k: int = 5):
-        qvec = self.embedder.embed(text)
-
-        res = self.client.search(
-            collection_name=table,
-            data=[qvec],
-            anns_field="embedding",
-            search_params={"metric_type": "COSINE"},
-            limit=top_k,
-            output_fields=["chunk_text"]
-        )[0]
-        with open(os.path.join(DATA_PATH, "original.json"), "r", encoding="utf-8") as f:
-            original_data = json.load(f)
-            table_info = original_data.get(table, {})
+    @staticmethod
+    def _fetch_k(top_k: int, mmr: bool, fetch_k: Optional[int]) -> int:
+        if not mmr:
+            return top_k
+        return max(top_k, fetch_k or top_k * RAG["mmr_fetch_factor"])
+
+    @staticmethod
+    def _mmr_scope(mmr: bool, fetch_k: int, mmr_lambda: float) -> tuple:
+        # 不开启 MMR 时缓存范围与原来一致
+        return (["mmr", fetch_k, mmr_lambda],) if mmr else ()
+
+    def _diversify(
+            self,
+            groups: list[list[tuple[str, dict]]],
+            qvecs: Optional[list[list[float]]],
+            top_k: int,
+            mmr_lambda: float
+        ) -> list[list[tuple[str, dict]]]:
+        """
+        MMR 重排：每组候选中选出 top_k 个既相关又互不重复的结果。
+
+        有查询向量时以余弦相似度为相关度，否则（关键词检索）以归一化的检索得分为相关度。
+        只由关键词命中、没有附带向量的候选，按 ID 从向量库批量取回向量。
+        """
+        missing: dict[str, set] = {}
+        for hits in groups:
+            for collection, hit in hits:
+                if hit.get("vector") is None:
+                    missing.setdefault(collection, set()).add(hit["id"])
+        fetched = {collection: self.store.get_vectors(collection, list(ids)) for collection, ids in missing.items()}
+
+        results = []
+        for q, hits in enumerate(groups):
+            hits = [
+                (collection, hit) for collection, hit in hits
+                if hit.get("vector") is not None or hit["id"] in fetched.get(collection, {})
+            ]
+            if len(hits) <= 1:
+                results.append(hits)
+                continue
+            vectors = np.stack([
+                hit["vector"] if hit.get("vector") is not None else fetched[collection][hit["id"]]
+                for collection, hit in hits
+            ])
+            if qvecs is not None:
+                order = mmr_select(vectors, top_k, mmr_lambda, query=np.asarray(qvecs[q], dtype=np.float32))
+            else:
+                scores = np.asarray([hit.get("score", hit["distance"]) for _, hit in hits], dtype=np.float32)
+                order = mmr_select(vectors, top_k, mmr_lambda, relevance=scores / (scores.max() or 1.0))
+            results.append([hits[i] for i in order])
+        return results
+
+    def _resolve(self, groups: list[list[tuple[str, dict]]]) -> list[list[dict]]:
+        """
+        为每组检索结果关联文档元数据，所有组共用一次元数据查询。
+        """
+        doc_ids = [[hit["entity"].get("doc_id") or collection for collection, hit in hits] for hits in groups]
+        original_data = self.meta.get_many([doc_id for ids in doc_ids for doc_id in ids])
         results = []
-        for hit in res:
-            results.append({
-                "chunk": hit["entity"]["chunk_text"],
-                "title": table_info.get("title"),
-                "source": table_info.get("source", "Unknown Source"),
-                "description": table_info.get("description", "Unknown Description"),
-                "similarity": hit["distance"]
-            })
+        for hits, ids in zip(groups, doc_ids):
+            group = []
+            for (_, hit), doc_id in zip(hits, ids):
+                entity = hit["entity"]
+                table_info = original_data.get(doc_id, {})
+                group.append({
+                    "chunk": entity["chunk_text"],
+                    "doc_id": doc_id,
+                    "title": table_info.get("title") or entity.get("title"),
+                    "source": table_info.get("source") or entity.get("source") or "Unknown Source",
+                    "description": table_info.get("description", "Unknown Description"),
+                    "similarity": hit["distance"],
+                    "score": hit.get("score", hit["distance"])
+                })
+            results.append(group)
         return results
     
+
+def _check_legacy_layout():
+    """
+    默认布局打开旧版（每个文档一个数据表、元数据在 original.json、分块不带 doc_id）的数据库：
+    检索得到旧文档，重新入库整篇替换旧分块，不留下孤立数据。
+    """
+    import tempfile
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+    from utils.metastore import LEGACY_SCOPE
+    from utils.vectorstore import LocalStore
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            inputs = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["input"]
+            inputs = [inputs] if isinstance(inputs, str) else inputs
+            data = [
+                {"index": i, "embedding": [b + 1.0 for b in hashlib.sha256(text.encode("utf-8")).digest()[:8]]}
+                for i, text in enumerate(inputs)
+            ]
+            body = json.dumps({"data": data}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            RAG["bm25_path"] = os.path.join(tmp, "bm25")
+            with open(os.path.join(tmp, "original.json"), "w", encoding="utf-8") as f:
+                json.dump({"Legacy_Doc": {"title": "Legacy Doc", "source": "legacy.md", "description": "旧版文档"}}, f)
+            embedder = EmbeddingModel(cache=False)
+            embedder.url = f"http://127.0.0.1:{server.server_port}/"
+            chunks = ["旧版数据表中的第一段内容", "旧版数据表中的第二段内容"]
+            store = LocalStore(os.path.join(tmp, "store"))
+            store.create_collection("Legacy_Doc", 8)
+            store.insert("Legacy_Doc", [
+                {"chunk_text": chunk, "embedding": vector}
+                for chunk, vector in zip(chunks, embedder.embed_batch(chunks))
+            ])
+
+            rag = RAGDatabase(backend=store, meta=MetaStore(os.path.join(tmp, "metadata.sqlite"), LEGACY_SCOPE), cache=False)
+            rag._embedder = embedder
+            hits = rag.query("Legacy_Doc", chunks[0], top_k=2, mode="vector")
+            assert [h["chunk"] for h in hits][:1] == chunks[:1], hits
+            assert hits[0]["doc_id"] == "Legacy_Doc" and hits[0]["source"] == "legacy.md", hits[0]
+            assert [h["chunk"] for h in rag.query_all(chunks[1], top_k=1, mode="vector")] == chunks[1:]
+
+            rag.insert_data("Legacy Doc", "重新入库后的内容", source="legacy.md", table="Legacy_Doc")
+            assert store.list_collections() == ["Legacy_Doc"]
+            hits = rag.query("Legacy_Doc", chunks[0], top_k=5, mode="vector")
+            assert [h["chunk"].strip() for h in hits] == ["重新入库后的内容"], hits
+            store.close()
+    finally:
+        server.shutdown()
+    print("[OK] 默认布局可检索旧版数据表，重新入库整篇替换旧分块")
     
 if __name__ == "__main__":
-    create_milvus()
+    import time
+    _check_legacy_layout()
+    # 启动耗时基准：构造时不连接向量库、不请求向量模型，也不导入 pymilvus
+    rounds = 100
+    start = time.perf_counter()
+    for _ in range(rounds):
+        rag = RAGDatabase()
+    elapsed = (time.perf_counter() - start) / rounds
+    assert rag._store is None and rag._embedder is None and rag._dim is None
+    assert "pymilvus" not in sys.modules
+    assert elapsed < 0.01, f"RAGDatabase 构造用时 {elapsed * 1000:.2f} ms"
+    print(f"[OK] RAGDatabase 构造用时 {elapsed * 1000:.3f} ms")
+    print(f"[OK] 向量维度 {rag.dim}")
     # rag = RAGDatabase(database="test_rag", dim=1024)
     # rag.insert_data(
     #     content="This is a test document for RAG database.",
@@ -310,24 +1051,7 @@ if __name__ == "__main__":
     # print(OCEANBASE_CONFIG)
 
 
-    # import time
-    # t1 = time.time()
-    # rag = RAGDatabase("legal_data_2", 1024)
-    # t2 = time.time()
-    # print(f"RAGDatabase 初始化耗时: {t2 - t1:.2f}秒")
-
-    # create rag
-    # from data.chunk_split import extract_title_and_description
-    # md_folder = "E:/AI/Chat/Qwen3/data/markdown"
-    # for filename in os.listdir(md_folder):
-
-    #     with open(os.path.join(md_folder, filename), "r", encoding="utf-8") as f:
-    #         full_text = f.read()
-    #     title, des, body = extract_title_and_description(full_text)
-    #     rag.insert_data(body, os.path.splitext(filename)[0], os.path.splitext(filename)[0], des)
-    #     t_temp = time.time()
-    #     print(f"RAGDatabase 此轮耗时: {t_temp - t2:.2f}秒")
-    # t3 = time.time()
-    # print(f"RAGDatabase 总耗时: {t3 - t2:.2f}秒")
-    
+    # 批量入库见 utils/ingest.py：
+    # python utils/ingest.py <文档目录> --table <文档集>
+
     # rag.insert("新测试！", source="https://example.com", sub_id="p1")
@@ -0,0 +1,103 @@
+import asyncio
+import random
+import threading
+from collections import deque
+
+import httpx
+import requests
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import LLM
+
+class RetryPolicy:
+    """
+    LLM 调用的重试、截止时间与对冲策略。
+
+    :param max_attempts: 单次调用最多尝试次数（含首次）
+    :param base_delay: 指数退避的初始等待秒数，实际等待为 [0, base_delay * 2^n] 的随机值
+    :param max_delay: 单次退避等待上限
+    :param deadline: 整次调用（含重试）的截止秒数，None 表示不限
+    :param hedge: 是否启用对冲请求
+    :param hedge_quantile: 对冲延迟取历史时延的分位数
+    :param hedge_min_delay: 对冲延迟下限，样本不足时也以此为准
+    """
+    def __init__(
+            self,
+            max_attempts: int = LLM["max_attempts"],
+            base_delay: float = 0.5,
+            max_delay: float = 8.0,
+            deadline: float | None = LLM["deadline"],
+            hedge: bool = LLM["hedge"],
+            hedge_quantile: float = 0.95,
+            hedge_min_delay: float = 2.0
+        ):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+
+    def backoff(self, attempt: int, error: Exception | None = None) -> float:
+        """
+        第 attempt 次失败后的等待秒数（full jitter），服务端给出 Retry-After 时取二者较大值。
+        """
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        return max(delay, retry_after(error) or 0)
+
+class LatencyTracker:
+    """
+    记录最近成功请求的时延，用于估算对冲延迟。
+    """
+    def __init__(self, size: int = 200, min_samples: int = 10):
+        self.samples = deque(maxlen=size)
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+
+    def record(self, latency: float):
+        with self._lock:
+            self.samples.append(latency)
+
+    def quantile(self, q: float) -> float | None:
+        with self._lock:
+            if len(self.samples) < self.min_samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _status(error: Exception) -> int | None:
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+def retry_after(error: Exception | None) -> float | None:
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    return retry_after_header(response)
+
+def retry_after_header(response) -> float | None:
+    value = response.headers.get("Retry-After")
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+def is_retryable(error: Exception) -> bool:
+    """
+    限流 (429)、服务端错误 (5xx)、连接/超时错误与畸形应答可重试，其余 4xx 不重试。
+    """
+    if isinstance(error, (requests.exceptions.HTTPError, httpx.HTTPStatusError)):
+        status = _status(error)
+        return status is not None and (status == 429 or status >= 500)
+    return isinstance(error, (
+        requests.exceptions.ConnectionError,
+        requests.exceptions.Timeout,
+        requests.exceptions.ChunkedEncodingError,
+        httpx.TransportError,
+        asyncio.TimeoutError,
+        ValueError,
+        KeyError
+    ))
@@ -0,0 +1,274 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager, asynccontextmanager
+from contextvars import ContextVar
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import LLM
+
+# 优先级，数值越小越先调度
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+
+# 当前作业标识，同一作业的请求在同优先级内与其他作业轮转公平排队
+current_job: ContextVar[str] = ContextVar("current_job", default="default")
+
+class TokenBucket:
+    """
+    按分钟速率匀速补充的令牌桶，rate_per_minute <= 0 表示不限。
+    """
+    def __init__(self, rate_per_minute: float):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(rate_per_minute)
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.rate <= 0
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if self.unlimited:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount: float):
+        if not self.unlimited:
+            self.level -= min(amount, self.capacity)
+
+    def give(self, amount: float):
+        if not self.unlimited:
+            self.level = min(self.capacity, self.level + amount)
+
+class Ticket:
+    """
+    一次调度许可；调用结束后把实际 token 用量写入 used 以校正 tpm 桶。
+    """
+    def __init__(self, tokens: int, priority: int, job: str):
+        self.tokens = tokens
+        self.priority = priority
+        self.job = job
+        self.used: int | None = None
+        self.granted = False
+        self.event = None
+        self.future = None
+        self.loop = None
+        self.enqueued = time.monotonic()
+
+class LLMScheduler:
+    """
+    进程级 LLM 调用调度器：rpm/tpm 双令牌桶 + 并发上限 + 优先级 + 作业间轮转公平队列。
+
+    同一优先级内按作业轮转出队，避免单个大作业的大量请求饿死其他作业；
+    收到 429 时调用 throttle() 暂停全部派发。
+    """
+    def __init__(
+            self,
+            rpm: float = LLM["rpm"],
+            tpm: float = LLM["tpm"],
+            max_concurrent: int = LLM["max_concurrent"]
+        ):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self.paused_until = 0.0
+        self.granted = 0
+        self.throttled = 0
+        self.waited = 0.0
+        self._queues: dict[int, OrderedDict[str, deque[Ticket]]] = {}
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._timer_at = 0.0
+
+    def _peek(self) -> Ticket | None:
+        for priority in sorted(self._queues):
+            jobs = self._queues[priority]
+            if jobs:
+                return next(iter(jobs.values()))[0]
+        return None
+
+    def _pop(self, ticket: Ticket):
+        jobs = self._queues[ticket.priority]
+        queue = jobs.pop(ticket.job)
+        queue.popleft()
+        if queue:
+            # 该作业重新排到队尾，实现轮转
+            jobs[ticket.job] = queue
+
+    def _remove(self, ticket: Ticket):
+        jobs = self._queues.get(ticket.priority, {})
+        queue = jobs.get(ticket.job)
+        if queue and ticket in queue:
+            queue.remove(ticket)
+            if not queue:
+                del jobs[ticket.job]
+
+    def _schedule_timer(self, delay: float):
+        at = time.monotonic() + delay
+        if self._timer is not None and self._timer_at <= at:
+            return
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer_at = at
+        self._timer = threading.Timer(delay, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            self._dispatch()
+
+    def _dispatch(self):
+        """
+        在持锁状态下尽可能多地派发许可；额度不足时定时重试。
+        """
+        while True:
+            ticket = self._peek()
+            if ticket is None or 0 < self.max_concurrent <= self.active:
+                return
+            now = time.monotonic()
+            wait = max(
+                self.paused_until - now,
+                self.requests.wait_time(1, now),
+                self.tokens.wait_time(ticket.tokens, now)
+            )
+            if wait > 0:
+                self._schedule_timer(wait)
+                return
+            self._pop(ticket)
+            self.requests.take(1)
+            self.tokens.take(ticket.tokens)
+            self.active += 1
+            self.granted += 1
+            self.waited += now - ticket.enqueued
+            ticket.granted = True
+            if ticket.event is not None:
+                ticket.event.set()
+            else:
+                ticket.loop.call_soon_threadsafe(self._wake, ticket.future)
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def _enqueue(self, ticket: Ticket):
+        jobs = self._queues.setdefault(ticket.priority, OrderedDict())
+        jobs.setdefault(ticket.job, deque()).append(ticket)
+        self._dispatch()
+
+    def acquire(
+            self,
+            tokens: int,
+            priority: int = PRIORITY_NORMAL,
+            job: str | None = None,
+            timeout: float | None = None
+        ) -> Ticket:
+        """
+        排队等待许可；timeout 秒内未获得许可时退出队列并抛出 TimeoutError。
+        """
+        ticket = Ticket(tokens, priority, job or current_job.get())
+        ticket.event = threading.Event()
+        with self._lock:
+            self._enqueue(ticket)
+        if not ticket.event.wait(timeout):
+            with self._lock:
+                # 超时与派发可能同时发生，已获得许可时照常返回
+                if not ticket.granted:
+                    self._remove(ticket)
+                    raise TimeoutError(f"LLM scheduler queue wait exceeded {timeout:.1f}s")
+        return ticket
+
+    async def aacquire(self, tokens: int, priority: int = PRIORITY_NORMAL, job: str | None = None) -> Ticket:
+        ticket = Ticket(tokens, priority, job or current_job.get())
+        ticket.loop = asyncio.get_running_loop()
+        ticket.future = ticket.loop.create_future()
+        with self._lock:
+            self._enqueue(ticket)
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = ticket.granted
+                if not granted:
+                    self._remove(ticket)
+            if granted:
+                self.release(ticket)
+            raise
+        return ticket
+
+    def release(self, ticket: Ticket):
+        """
+        归还并发名额，并按实际用量校正 tpm 桶。
+        """
+        with self._lock:
+            if ticket.used is not None:
+                diff = ticket.used - ticket.tokens
+                if diff > 0:
+                    self.tokens.take(diff)
+                else:
+                    self.tokens.give(-diff)
+            self.active -= 1
+            self._dispatch()
+
+    def throttle(self, seconds: float):
+        """
+        服务端限流 (429) 时暂停派发 seconds 秒。
+        """
+        with self._lock:
+            self.throttled += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, tokens: int, priority: int = PRIORITY_NORMAL, job: str | None = None, timeout: float | None = None):
+        ticket = self.acquire(tokens, priority, job, timeout)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    @asynccontextmanager
+    async def aslot(self, tokens: int, priority: int = PRIORITY_NORMAL, job: str | None = None):
+        ticket = await self.aacquire(tokens, priority, job)
+        try:
+            yield ticket
+        finally:
+            self.release(ticket)
+
+    def stats(self) -> dict:
+        with self._lock:
+            queued = sum(len(q) for jobs in self._queues.values() for q in jobs.values())
+            return {
+                "active": self.active,
+                "queued": queued,
+                "granted": self.granted,
+                "throttled": self.throttled,
+                "avg_wait": self.waited / self.granted if self.granted else 0.0
+            }
+
+_scheduler: LLMScheduler | None = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """
+    获取进程内共享的调度器。
+    """
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
@@ -0,0 +1,303 @@
+import hashlib
+import json
+import time
+from contextlib import ExitStack
+from typing import Optional
+
+import numpy as np
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import RAG
+from utils import quantize
+from utils.metastore import FIELDS
+from utils.ragdb import RAGDatabase, _doc_lock, chunk_hash
+
+SNAPSHOT_FORMAT = "codexaid-rag-snapshot"
+SNAPSHOT_VERSION = 1
+MANIFEST = "manifest.json"
+DOCUMENTS = "documents.json"
+
+def file_sha256(path: str, block_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _pack_texts(texts: list[str]) -> tuple[np.ndarray, np.ndarray]:
+    """
+    变长文本按列存储：UTF-8 字节拼接为一个 uint8 数组，另存 len + 1 个偏移量。
+    """
+    encoded = [text.encode("utf-8") for text in texts]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(b) for b in encoded], out=offsets[1:])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+def _unpack_texts(data: np.ndarray, offsets: np.ndarray) -> list[str]:
+    raw = data.tobytes()
+    return [raw[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(len(offsets) - 1)]
+
+def export_snapshot(
+        database: RAGDatabase,
+        path: str,
+        table: Optional[str] = None,
+        vector_type: str = RAG["vector_type"],
+        part_rows: int = 65536,
+        compress: bool = True
+    ) -> dict:
+    """
+    将数据表导出为快照目录，用于新节点免向量化启动：
+
+    - part-<序号>.npz：列式分块数据，embedding 为按 vector_type 编码的单位向量，
+      text / text_offsets 为 UTF-8 拼接的分块文本，doc 为分块所属文档在 documents.json 中的序号；
+    - documents.json：original.json 格式的文档元数据 {doc_id: {title, source, description, doc_set}}；
+    - manifest.json：格式版本、维度、向量精度、行数与每个文件的 sha256，最后写入，存在即表示导出完整。
+
+    :param database: 源数据库
+    :param path: 快照目录
+    :param table: 只导出该数据表（共享布局下为文档集），None 表示全部
+    :param vector_type: 快照中的向量精度，见 utils.quantize.VECTOR_TYPES
+    :param part_rows: 单个分片文件的最大行数，导出时内存只保留一个分片
+    :param compress: 分片是否压缩（文本压缩效果明显，向量基本不可压缩）
+    :return: manifest 内容
+    """
+    quantize.check_type(vector_type)
+    os.makedirs(path, exist_ok=True)
+    store = database.store
+    if database.layout == "shared":
+        sources = [(database.collection, {"doc_set": table} if table else None)]
+        doc_ids = database.meta.list_documents(table)
+    else:
+        sources = [(name, None) for name in ([table] if table else store.list_collections())]
+        doc_ids = [
+            doc_id for doc_id, info in database.meta.get_many(database.meta.list_documents()).items()
+            if not table or info.get("doc_set") == table
+        ]
+    sources = [(name, filter) for name, filter in sources if store.has_collection(name)]
+
+    documents: dict[str, dict] = database.meta.get_many(doc_ids)
+    index = {doc_id: i for i, doc_id in enumerate(documents)}
+    parts, dim, total = [], None, 0
+    texts, docs, vectors, size = [], [], [], 0
+
+    def flush():
+        nonlocal texts, docs, vectors, size
+        name = f"part-{len(parts):05d}.npz"
+        text, offsets = _pack_texts(texts)
+        save = np.savez_compressed if compress else np.savez
+        save(
+            os.path.join(path, name),
+            embedding=quantize.encode(np.concatenate(vectors), vector_type),
+            text=text,
+            text_offsets=offsets,
+            doc=np.asarray(docs, dtype=np.int32)
+        )
+        parts.append({"file": name, "rows": len(texts), "sha256": file_sha256(os.path.join(path, name))})
+        texts, docs, vectors, size = [], [], [], 0
+
+    for name, filter in sources:
+        for rows, block in store.scan(name, batch_size=min(part_rows, 4096), filter=filter):
+            dim = dim or block.shape[1]
+            for row in rows:
+                doc_id = row.get("doc_id") or name
+                if doc_id not in index:
+                    # 元数据缺失的文档，按分块上冗余存储的字段补齐
+                    index[doc_id] = len(documents)
+                    documents[doc_id] = {
+                        "title": row.get("title") or doc_id,
+                        "source": row.get("source") or None,
+                        "description": None,
+                        "doc_set": row.get("doc_set") or (name if database.layout == "table" else "default")
+                    }
+                texts.append(row["chunk_text"])
+                docs.append(index[doc_id])
+            vectors.append(block)
+            size += len(rows)
+            total += len(rows)
+            if size >= part_rows:
+                flush()
+    if size:
+        flush()
+
+    with open(os.path.join(path, DOCUMENTS), "w", encoding="utf-8") as f:
+        json.dump({doc_id: {k: info.get(k) for k in FIELDS} for doc_id, info in documents.items()}, f, ensure_ascii=False)
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "version": SNAPSHOT_VERSION,
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "source": {"db_name": database.name, "layout": database.layout, "table": table},
+        "dim": dim or database.dim,
+        "vector_type": vector_type,
+        "rows": total,
+        "documents": {"file": DOCUMENTS, "count": len(documents), "sha256": file_sha256(os.path.join(path, DOCUMENTS))},
+        "parts": parts
+    }
+    tmp_path = os.path.join(path, MANIFEST + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(path, MANIFEST))
+    print(f"[OK] 已导出 {len(documents)} 个文档、{total} 个分块到 {path}，共 {len(parts)} 个分片")
+    return manifest
+
+def verify_snapshot(path: str) -> dict:
+    """
+    校验快照格式与全部文件的 sha256，返回 manifest；任一文件缺失或不一致时抛出 ValueError。
+    """
+    manifest_path = os.path.join(path, MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise ValueError(f"{path} 不是完整的快照：缺少 {MANIFEST}")
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT or manifest.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"不支持的快照格式: {manifest.get('format')} v{manifest.get('version')}")
+    quantize.check_type(manifest["vector_type"])
+    for entry in [manifest["documents"], *manifest["parts"]]:
+        file_path = os.path.join(path, entry["file"])
+        if not os.path.exists(file_path):
+            raise ValueError(f"快照文件缺失: {entry['file']}")
+        if file_sha256(file_path) != entry["sha256"]:
+            raise ValueError(f"快照文件校验失败: {entry['file']}")
+    return manifest
+
+def _target_ids(database: RAGDatabase, manifest: dict, documents: dict[str, dict]) -> list[str]:
+    """
+    快照中文档在目标数据库中的 doc_id，与 documents.json 的顺序一致。
+
+    doc_id 的生成规则取决于布局（旧布局为数据表名，共享布局默认由标题生成），跨布局导入时
+    按目标布局重新生成，之后对同一文档的 insert_data 才能增量更新而不是重复写入。
+    多个文档对应同一 doc_id 时无法迁移，抛出 ValueError。
+    """
+    doc_ids = list(documents)
+    if manifest["source"].get("layout") == database.layout:
+        return doc_ids
+    mapped: dict[str, str] = {}
+    for doc_id in doc_ids:
+        info = documents[doc_id]
+        target_id = database._doc_id(info.get("title") or doc_id, info.get("doc_set"), None)
+        if target_id in mapped:
+            raise ValueError(
+                f"文档 {mapped[target_id]} 与 {doc_id} 在 {database.layout} 布局下对应同一 doc_id {target_id}，无法跨布局导入"
+            )
+        mapped[target_id] = doc_id
+    return list(mapped)
+
+def import_snapshot(database: RAGDatabase, path: str, verify: bool = True) -> dict:
+    """
+    从快照恢复数据：直接写入快照中的向量，不调用向量模型。
+
+    快照中的文档若已存在则整篇替换；目标数据表按当前数据库的布局确定（共享布局写入共享数据表，
+    旧布局写入以文档集命名的数据表），因此两种布局之间也可以互相迁移，doc_id 按目标布局重新生成。
+    分块按 RAGDatabase._insert 分批并行写入并加入 BM25 索引，同时登记分块哈希，之后的 insert_data 可增量更新。
+    全部分块写入后才经 RAGDatabase._commit_document 逐文档提交并删除旧分块；
+    任一批次失败时删除本次已写入的分块，原有数据与元数据保持不变。
+
+    :param database: 目标数据库
+    :param path: 快照目录
+    :param verify: 写入前校验全部文件的 sha256
+    :return: {"documents", "chunks", "parts"}
+    """
+    if verify:
+        manifest = verify_snapshot(path)
+    else:
+        with open(os.path.join(path, MANIFEST), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    with open(os.path.join(path, DOCUMENTS), "r", encoding="utf-8") as f:
+        snapshot_docs: dict[str, dict] = json.load(f)
+    doc_ids = _target_ids(database, manifest, snapshot_docs)
+    documents = dict(zip(doc_ids, snapshot_docs.values()))
+    dim, vector_type = manifest["dim"], manifest["vector_type"]
+
+    def target(info: dict) -> str:
+        return database.collection if database.layout == "shared" else info["doc_set"]
+
+    collections = dict.fromkeys(target(info) for info in documents.values())
+    for collection in collections:
+        existing = database.store.dimension(collection)
+        if existing is not None and existing != dim:
+            raise ValueError(f"数据表 {collection} 的向量维度为 {existing}，快照为 {dim}")
+    for collection in collections:
+        database._table_create(collection, dim)
+
+    with ExitStack() as stack:
+        for doc_id in sorted(doc_ids):
+            stack.enter_context(_doc_lock(database.name, doc_id))
+        added: dict[str, dict[str, int]] = {doc_id: {} for doc_id in doc_ids}
+        written: dict[str, list[int]] = {}
+        try:
+            for part in manifest["parts"]:
+                with np.load(os.path.join(path, part["file"])) as data:
+                    vectors = quantize.decode(data["embedding"], vector_type)
+                    texts = _unpack_texts(data["text"], data["text_offsets"])
+                    docs = data["doc"]
+                groups: dict[str, list[int]] = {}
+                for i, d in enumerate(docs):
+                    groups.setdefault(target(documents[doc_ids[d]]), []).append(i)
+                for collection, rows_idx in groups.items():
+                    rows = []
+                    for i in rows_idx:
+                        doc_id = doc_ids[docs[i]]
+                        info = documents[doc_id]
+                        rows.append({
+                            "chunk_text": texts[i],
+                            "embedding": vectors[i],
+                            "doc_id": doc_id,
+                            "title": info["title"],
+                            "source": info["source"] or "",
+                            "doc_set": info["doc_set"]
+                        })
+                    ids = database._insert(collection, rows)
+                    written.setdefault(collection, []).extend(ids)
+                    for row, chunk_id in zip(rows, ids):
+                        added[row["doc_id"]].setdefault(chunk_hash(row["chunk_text"]), chunk_id)
+        except BaseException:
+            for collection, ids in written.items():
+                try:
+                    database._discard(collection, ids)
+                except Exception as e:
+                    print(f"[ERROR] 回滚数据表 {collection} 已写入的分块失败:", e)
+            raise
+
+        for doc_id in doc_ids:
+            # 已存在的文档整篇替换：有分块记录的按 ID 删除旧分块，没有记录的按 doc_id 清除本次写入以外的分块
+            existing, replace, stale = database._stored(doc_id, documents[doc_id])
+            database._commit_document({
+                "doc_id": doc_id,
+                "collection": target(documents[doc_id]),
+                "info": documents[doc_id],
+                "removed": stale + list(existing),
+                "removed_ids": list(existing.values()),
+                "replace": replace
+            }, added[doc_id])
+    stats = {"documents": len(doc_ids), "chunks": sum(len(ids) for ids in written.values()), "parts": len(manifest["parts"])}
+    print(f"[OK] 已从 {path} 导入 {stats['documents']} 个文档、{stats['chunks']} 个分块")
+    return stats
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="导出 / 导入 RAG 数据表快照，新节点无需重新向量化")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_cmd = commands.add_parser("export", help="导出快照")
+    export_cmd.add_argument("path", help="快照目录")
+    export_cmd.add_argument("--table", default=None, help="只导出该数据表 / 文档集")
+    export_cmd.add_argument("--vector-type", default=RAG["vector_type"], choices=list(quantize.VECTOR_TYPES))
+    export_cmd.add_argument("--part-rows", type=int, default=65536)
+    export_cmd.add_argument("--no-compress", action="store_true")
+    import_cmd = commands.add_parser("import", help="导入快照")
+    import_cmd.add_argument("path", help="快照目录")
+    import_cmd.add_argument("--no-verify", action="store_true", help="跳过 sha256 校验")
+    verify_cmd = commands.add_parser("verify", help="只校验快照")
+    verify_cmd.add_argument("path", help="快照目录")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.command == "export":
+        export_snapshot(RAGDatabase(), args.path, args.table, args.vector_type, args.part_rows, not args.no_compress)
+    elif args.command == "import":
+        import_snapshot(RAGDatabase(), args.path, verify=not args.no_verify)
+    else:
+        manifest = verify_snapshot(args.path)
+        print(f"[OK] 快照校验通过：{manifest['documents']['count']} 个文档、{manifest['rows']} 个分块")
+    print(f"[OK] 用时 {time.perf_counter() - start:.2f} 秒")
@@ -1,17 +1,19 @@
 ## FastAPI request call tool
-import requests
 import time
 import os, sys
 currunt_dir = os.path.dirname(__file__)
 sys.path.append(os.path.join(currunt_dir, ".."))
-from config import TOOLPORT
+from config import TOOLPORT, TOOL_TIMEOUT
+from utils import transport
 url = "http://127.0.0.1:" + str(TOOLPORT)
+# 未配置 TOOL_TIMEOUT 时不设超时，不套用 transport 的默认超时
+timeout = TOOL_TIMEOUT or (None, None)
 
 def call_tool(tool_name: str = None, tool_args: dict = None):
     if tool_name is None:
         try:
             t1 = time.time()
-            resp = requests.get(f"{url}/get_tool")
+            resp = transport.get(f"{url}/get_tool", timeout=timeout)
             result = resp.json()
             t2 = time.time()
             return {
@@ -24,9 +26,10 @@ def call_tool(tool_name: str = None, tool_args: dict = None):
     else:
         try:
             t1 = time.time()
-            resp = requests.post(
+            resp = transport.post(
                 f"{url}/call_tool/{tool_name}",
-                json=tool_args
+                json=tool_args,
+                timeout=timeout
             )
             result = resp.json()
             if result["status"]:
@@ -0,0 +1,109 @@
+import asyncio
+import threading
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import HTTP
+
+_session: requests.Session | None = None
+_session_lock = threading.Lock()
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _timeout(timeout: float | tuple | None) -> tuple:
+    """
+    统一超时为 (connect, read)，只给一个数时视为读超时。
+    """
+    if timeout is None:
+        return (HTTP["connect_timeout"], HTTP["read_timeout"])
+    if isinstance(timeout, tuple):
+        return timeout
+    return (HTTP["connect_timeout"], timeout)
+
+def get_session() -> requests.Session:
+    """
+    获取进程内共享的 keep-alive Session，按 host 维护连接池。
+
+    pool_connections 为缓存的 host 连接池个数，pool_maxsize 为每个 host 的最大连接数。
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP["pool_connections"],
+                pool_maxsize=HTTP["pool_maxsize"],
+                pool_block=HTTP["pool_block"],
+                max_retries=0
+            )
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _session = session
+        return _session
+
+def request(method: str, url: str, timeout: float | tuple | None = None, **kwargs) -> requests.Response:
+    return get_session().request(method, url, timeout=_timeout(timeout), **kwargs)
+
+def get(url: str, timeout: float | tuple | None = None, **kwargs) -> requests.Response:
+    return request("GET", url, timeout=timeout, **kwargs)
+
+def post(url: str, timeout: float | tuple | None = None, **kwargs) -> requests.Response:
+    return request("POST", url, timeout=timeout, **kwargs)
+
+def stream(method: str, url: str, timeout: float | tuple | None = None, **kwargs) -> requests.Response:
+    """
+    流式请求，响应体按需读取，调用方负责 close。
+    """
+    return request(method, url, timeout=timeout, stream=True, **kwargs)
+
+def close():
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None
+
+def get_async_client() -> httpx.AsyncClient:
+    """
+    获取当前事件循环共享的 httpx.AsyncClient，连接池参数与同步 Session 一致。
+
+    httpx 的连接绑定事件循环，因此每个循环各持有一个客户端。
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP["pool_connections"] * HTTP["pool_maxsize"],
+                max_keepalive_connections=HTTP["pool_maxsize"]
+            ),
+            timeout=httpx.Timeout(HTTP["read_timeout"], connect=HTTP["connect_timeout"])
+        )
+        _async_clients[loop] = client
+    return client
+
+async def arequest(method: str, url: str, timeout: float | tuple | None = None, **kwargs) -> httpx.Response:
+    connect, read = _timeout(timeout)
+    return await get_async_client().request(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+
+async def aget(url: str, timeout: float | tuple | None = None, **kwargs) -> httpx.Response:
+    return await arequest("GET", url, timeout=timeout, **kwargs)
+
+async def apost(url: str, timeout: float | tuple | None = None, **kwargs) -> httpx.Response:
+    return await arequest("POST", url, timeout=timeout, **kwargs)
+
+def astream(method: str, url: str, timeout: float | tuple | None = None, **kwargs):
+    """
+    异步流式请求，返回 async with 使用的上下文管理器。
+    """
+    connect, read = _timeout(timeout)
+    return get_async_client().stream(method, url, timeout=httpx.Timeout(read, connect=connect), **kwargs)
+
+async def aclose():
+    client = _async_clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
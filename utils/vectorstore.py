@@ -0,0 +1,862 @@
+import atexit
+import json
+import re
+import shutil
+import threading
+from typing import Iterator
+import numpy as np
+import os, sys
+currunt_dir = os.path.dirname(__file__)
+sys.path.append(os.path.join(currunt_dir, ".."))
+from config import RAG
+from utils import quantize
+
+class VectorStore:
+    """
+    RAGDatabase 的存储后端接口。
+
+    每行数据是 {"chunk_text": str, "embedding": list[float], ...}，检索结果沿用 Milvus 的格式：
+    每个查询向量对应一个 [{"id": ..., "distance": ..., "entity": {...}}] 列表，distance 为余弦相似度；
+    return_vectors 为 True 时每条结果另含 "vector"（float32 单位向量）。
+
+    filter 为标量字段过滤条件 {字段: 值}，值为列表时表示取其中任一值，多个字段之间为与关系。
+
+    建表时 vector_type 指定向量存储精度（见 utils.quantize.VECTOR_TYPES），不保留 float32 原始向量，
+    相似度均按存储精度的向量计算。binary 为 True 时额外存储符号位二值码，检索先按汉明距离粗排取
+    rescore_factor 倍候选，再以存储的向量精排后返回。
+    """
+    def has_collection(self, name: str) -> bool:
+        raise NotImplementedError
+
+    def create_collection(
+            self,
+            name: str,
+            dim: int,
+            partition_key: str | None = None,
+            vector_type: str = "float32",
+            binary: bool = False
+        ) -> None:
+        raise NotImplementedError
+
+    def dimension(self, name: str) -> int | None:
+        """
+        已有数据表的向量维度，数据表不存在时返回 None。
+        """
+        raise NotImplementedError
+
+    def list_collections(self) -> list[str]:
+        raise NotImplementedError
+
+    def drop_collection(self, name: str) -> None:
+        raise NotImplementedError
+
+    def insert(self, name: str, rows: list[dict]) -> list[int]:
+        raise NotImplementedError
+
+    def search(
+            self,
+            name: str,
+            vectors: list[list[float]],
+            top_k: int,
+            output_fields: list[str] | None = None,
+            filter: dict | None = None,
+            return_vectors: bool = False
+        ) -> list[list[dict]]:
+        raise NotImplementedError
+
+    def get_vectors(self, name: str, ids: list[int]) -> dict[int, np.ndarray]:
+        """
+        按 ID 取回分块向量（float32 单位向量），不存在的 ID 不出现在结果中。
+        """
+        raise NotImplementedError
+
+    def scan(self, name: str, batch_size: int = 1024, filter: dict | None = None) -> Iterator[tuple[list[dict], np.ndarray]]:
+        """
+        分批遍历数据表中的全部分块，每批产出 (标量字段行（含 "id"）, float32 单位向量)，用于导出快照。
+        """
+        raise NotImplementedError
+
+    def delete(self, name: str, ids: list[int] | None = None, filter: dict | None = None) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+# 共享数据表中随分块存储的文档字段
+DOC_FIELDS = {"doc_id": 256, "title": 512, "source": 1024, "doc_set": 256}
+
+def milvus_filter(filter: dict | None) -> str:
+    """
+    将 {字段: 值} 过滤条件转换为 Milvus 布尔表达式。
+    """
+    parts = []
+    for field, value in (filter or {}).items():
+        if isinstance(value, (list, tuple, set)):
+            parts.append(f"{field} in {json.dumps(list(value), ensure_ascii=False)}")
+        else:
+            parts.append(f"{field} == {json.dumps(value, ensure_ascii=False)}")
+    return " and ".join(parts)
+
+_clients: dict[tuple[str, str], "MilvusClient"] = {}
+_clients_lock = threading.Lock()
+
+def get_milvus_client(url: str = RAG["milvus_url"], db_name: str = RAG["db_name"]) -> "MilvusClient":
+    """
+    获取进程内共享的 Milvus 连接，同一地址与数据库只连接一次。
+
+    首次使用时建立连接，数据库不存在则创建，然后切换到该数据库；进程退出时关闭。
+    """
+    key = (url, db_name)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            from pymilvus import MilvusClient
+            client = MilvusClient(
+                uri=url,
+                token="root:Milvus"
+            )
+            if db_name not in client.list_databases():
+                client.create_database(db_name=db_name)
+                print(f"[OK] 已创建数据库 {db_name}")
+            client.use_database(
+                db_name=db_name
+            )
+            atexit.register(client.close)
+            _clients[key] = client
+        return client
+
+# 向量存储精度对应的 Milvus 字段类型
+MILVUS_VECTOR_TYPES = {
+    "float32": "FLOAT_VECTOR",
+    "float16": "FLOAT16_VECTOR",
+    "bfloat16": "BFLOAT16_VECTOR",
+    "int8": "INT8_VECTOR",
+}
+# Milvus 单次检索的 limit 上限
+MILVUS_MAX_LIMIT = 16384
+
+def _milvus_vector(value, vector_type: str) -> np.ndarray:
+    """
+    将 Milvus 返回的向量字段（列表、ndarray 或原始字节）还原为存储精度的数组。
+    """
+    if isinstance(value, list) and len(value) == 1 and isinstance(value[0], (bytes, bytearray)):
+        value = value[0]
+    if isinstance(value, (bytes, bytearray)):
+        return np.frombuffer(value, dtype=quantize.storage_dtype(vector_type))
+    return np.asarray(value).astype(quantize.storage_dtype(vector_type))
+
+class MilvusStore(VectorStore):
+    """
+    Milvus 后端，连接在首次访问时从进程内连接池获取。
+
+    指定 partition_key 建表时，DOC_FIELDS 作为标量字段写入 schema 并建立倒排索引，
+    partition_key 字段作为分区键，多个文档共用一个 collection 与一套向量索引。
+
+    低精度数据表中 embedding 字段为 FLOAT16/BFLOAT16/INT8_VECTOR（INT8_VECTOR 需要 Milvus 2.6 及以上），
+    二值码写入 binary_code 字段（BINARY_VECTOR，汉明距离）；有二值码时多取候选并取回其向量精排。
+    """
+    def __init__(
+            self,
+            url: str = RAG["milvus_url"],
+            db_name: str = RAG["db_name"],
+            rescore_factor: int = RAG["rescore_factor"]
+        ):
+        self.url = url
+        self.db_name = db_name
+        self.rescore_factor = rescore_factor
+        self._client = None
+        # {数据表: (存储精度, 是否有二值码)}
+        self._schemas: dict[str, tuple[str, bool]] = {}
+
+    @property
+    def client(self) -> "MilvusClient":
+        if self._client is None:
+            try:
+                self._client = get_milvus_client(self.url, self.db_name)
+            except Exception as e:
+                raise Exception(f"[ERROR] 启动 Milvus 数据库 {self.db_name} 失败: {e}") from e
+        return self._client
+
+    def has_collection(self, name: str) -> bool:
+        return self.client.has_collection(name)
+
+    def _schema(self, name: str) -> tuple[str, bool]:
+        schema = self._schemas.get(name)
+        if schema is None:
+            info = self.client.describe_collection(collection_name=name)
+            types = {field["name"]: getattr(field["type"], "name", str(field["type"])) for field in info["fields"]}
+            vector_type = next((t for t, d in MILVUS_VECTOR_TYPES.items() if d == types.get("embedding")), "float32")
+            schema = self._schemas[name] = (vector_type, "binary_code" in types)
+        return schema
+
+    def _check_int8(self):
+        """
+        INT8_VECTOR 需要 pymilvus 与 Milvus 服务端均为 2.6 及以上，旧版本在建表前直接报错。
+        """
+        from pymilvus import DataType
+        if not hasattr(DataType, "INT8_VECTOR"):
+            raise ValueError("int8 vector_type requires pymilvus >= 2.6; upgrade pymilvus or use float16/bfloat16")
+        version = self.client.get_server_version()
+        match = re.search(r"(\d+)\.(\d+)", version or "")
+        if match is None or (int(match.group(1)), int(match.group(2))) < (2, 6):
+            raise ValueError(f"int8 vector_type requires Milvus server >= 2.6, got {version}; use float16/bfloat16")
+
+    @staticmethod
+    def _encode(vectors: np.ndarray, vector_type: str) -> list:
+        codes = quantize.encode(vectors, vector_type)
+        if vector_type == "bfloat16":
+            # 未安装 ml_dtypes 时 pymilvus 接受 bfloat16 的原始字节
+            return [row.tobytes() for row in codes]
+        return list(codes)
+
+    def create_collection(
+            self,
+            name: str,
+            dim: int,
+            partition_key: str | None = None,
+            vector_type: str = "float32",
+            binary: bool = False
+        ) -> None:
+        from pymilvus import MilvusClient, DataType
+        quantize.check_type(vector_type)
+        if vector_type == "int8":
+            self._check_int8()
+        if binary and dim % 8:
+            raise ValueError(f"binary prefilter requires dim divisible by 8, got {dim}")
+        schema = MilvusClient.create_schema(
+            auto_id=True,
+            enable_dynamic_field=True,
+        )
+        schema.add_field(field_name="id", datatype=DataType.INT64, is_primary=True)
+        schema.add_field(field_name="chunk_text", datatype=DataType.VARCHAR, max_length=2048)
+        schema.add_field(field_name="embedding", datatype=DataType[MILVUS_VECTOR_TYPES[vector_type]], dim=dim)
+        if binary:
+            schema.add_field(field_name="binary_code", datatype=DataType.BINARY_VECTOR, dim=dim)
+        if partition_key:
+            for field, max_length in DOC_FIELDS.items():
+                schema.add_field(
+                    field_name=field,
+                    datatype=DataType.VARCHAR,
+                    max_length=max_length,
+                    is_partition_key=(field == partition_key)
+                )
+
+        index_params = self.client.prepare_index_params()
+        index_params.add_index(
+            field_name="id",
+            index_type="AUTOINDEX"
+        )
+        if partition_key:
+            for field in DOC_FIELDS:
+                index_params.add_index(
+                    field_name=field,
+                    index_type="INVERTED"
+                )
+
+        if vector_type == "int8":
+            # INT8_VECTOR 仅支持 HNSW 索引
+            index_params.add_index(
+                field_name="embedding",
+                index_type="HNSW",
+                metric_type="COSINE",
+                params={"M": 16, "efConstruction": 200}
+            )
+        else:
+            index_params.add_index(
+                field_name="embedding",
+                index_type="AUTOINDEX",
+                metric_type="COSINE"
+            )
+        if binary:
+            index_params.add_index(
+                field_name="binary_code",
+                index_type="BIN_IVF_FLAT",
+                metric_type="HAMMING",
+                params={"nlist": 1024}
+            )
+
+        self.client.create_collection(
+            collection_name=name,
+            schema=schema,
+            index_params=index_params
+        )
+        self._schemas[name] = (vector_type, binary)
+        res = self.client.get_load_state(
+            collection_name=name
+        )
+        print(f"[OK] Vector index {res}.")
+
+    def dimension(self, name: str) -> int | None:
+        if not self.client.has_collection(name):
+            return None
+        info = self.client.describe_collection(collection_name=name)
+        for field in info["fields"]:
+            if field["name"] == "embedding":
+                return int(field["params"]["dim"])
+        return None
+
+    def list_collections(self) -> list[str]:
+        return self.client.list_collections()
+
+    def drop_collection(self, name: str) -> None:
+        self.client.drop_collection(
+            collection_name=name
+        )
+        self._schemas.pop(name, None)
+
+    def insert(self, name: str, rows: list[dict]) -> list[int]:
+        vector_type, binary = self._schema(name)
+        if vector_type != "float32" or binary:
+            vectors = quantize.normalize([row["embedding"] for row in rows])
+            embeddings = self._encode(vectors, vector_type) if vector_type != "float32" else [row["embedding"] for row in rows]
+            codes = [c.tobytes() for c in quantize.binary_codes(vectors)] if binary else None
+            rows = [
+                {**row, "embedding": embeddings[i], **({"binary_code": codes[i]} if binary else {})}
+                for i, row in enumerate(rows)
+            ]
+        res = self.client.insert(collection_name=name, data=rows)
+        return list(res["ids"])
+
+    def search(
+            self,
+            name: str,
+            vectors: list[list[float]],
+            top_k: int,
+            output_fields: list[str] | None = None,
+            filter: dict | None = None,
+            return_vectors: bool = False
+        ) -> list[list[dict]]:
+        vector_type, binary = self._schema(name)
+        if not binary:
+            # 服务端直接按存储精度的向量计算余弦相似度，与取回向量后重算的结果相同，无需多取候选
+            search_params = {"metric_type": "COSINE"}
+            if vector_type == "int8":
+                search_params["params"] = {"ef": max(top_k, 64)}
+            res = self.client.search(
+                collection_name=name,
+                data=vectors if vector_type == "float32" else self._encode(quantize.normalize(vectors), vector_type),
+                filter=milvus_filter(filter),
+                anns_field="embedding",
+                search_params=search_params,
+                limit=top_k,
+                output_fields=list(output_fields or ["chunk_text"]) + (["embedding"] if return_vectors else [])
+            )
+            results = []
+            for hits in res:
+                group = []
+                for hit in hits:
+                    entity = dict(hit["entity"])
+                    item = {"id": hit["id"], "distance": hit["distance"], "entity": entity}
+                    if return_vectors:
+                        stored = _milvus_vector(entity.pop("embedding"), vector_type)
+                        item["vector"] = quantize.normalize(quantize.decode(stored, vector_type))
+                    group.append(item)
+                results.append(group)
+            return results
+
+        # 二值码检索：按汉明距离多取候选并取回存储的向量精排
+        queries = quantize.normalize(vectors)
+        limit = min(top_k * self.rescore_factor, MILVUS_MAX_LIMIT)
+        data = [c.tobytes() for c in quantize.binary_codes(queries)]
+        anns_field = "binary_code"
+        search_params = {"metric_type": "HAMMING", "params": {"nprobe": 64}}
+        res = self.client.search(
+            collection_name=name,
+            data=data,
+            filter=milvus_filter(filter),
+            anns_field=anns_field,
+            search_params=search_params,
+            limit=limit,
+            output_fields=list(output_fields or ["chunk_text"]) + ["embedding"]
+        )
+        results = []
+        for query, hits in zip(queries, res):
+            hits = list(hits)
+            if not hits:
+                results.append([])
+                continue
+            stored = quantize.decode(
+                np.stack([_milvus_vector(hit["entity"]["embedding"], vector_type) for hit in hits]), vector_type
+            )
+            exact = stored @ query
+            group = []
+            for i in np.argsort(-exact, kind="stable")[:top_k]:
+                item = {
+                    "id": hits[i]["id"],
+                    "distance": float(exact[i]),
+                    "entity": {k: v for k, v in dict(hits[i]["entity"]).items() if k != "embedding"}
+                }
+                if return_vectors:
+                    item["vector"] = quantize.normalize(stored[i])
+                group.append(item)
+            results.append(group)
+        return results
+
+    def get_vectors(self, name: str, ids: list[int]) -> dict[int, np.ndarray]:
+        if not ids:
+            return {}
+        vector_type, _ = self._schema(name)
+        rows = self.client.get(collection_name=name, ids=list(ids), output_fields=["embedding"])
+        return {
+            row["id"]: quantize.normalize(quantize.decode(_milvus_vector(row["embedding"], vector_type), vector_type))
+            for row in rows
+        }
+
+    def scan(self, name: str, batch_size: int = 1024, filter: dict | None = None) -> Iterator[tuple[list[dict], np.ndarray]]:
+        vector_type, _ = self._schema(name)
+        iterator = self.client.query_iterator(
+            collection_name=name,
+            batch_size=batch_size,
+            filter=milvus_filter(filter),
+            output_fields=["*"]
+        )
+        try:
+            while batch := iterator.next():
+                rows, codes = [], []
+                for row in batch:
+                    row = dict(row)
+                    codes.append(_milvus_vector(row.pop("embedding"), vector_type))
+                    row.pop("binary_code", None)
+                    rows.append(row)
+                yield rows, quantize.normalize(quantize.decode(np.stack(codes), vector_type))
+        finally:
+            iterator.close()
+
+    def delete(self, name: str, ids: list[int] | None = None, filter: dict | None = None) -> None:
+        if ids:
+            self.client.delete(collection_name=name, ids=list(ids))
+        if filter:
+            self.client.delete(collection_name=name, filter=milvus_filter(filter))
+
+    def close(self) -> None:
+        # 连接由进程内连接池持有，进程退出时统一关闭
+        self._client = None
+
+def _hashable(value) -> bool:
+    return not isinstance(value, (list, dict, set))
+
+class _LocalCollection:
+    """
+    本地数据表：vectors.<f32|f16|bf16|i8> 为只追加的归一化向量矩阵（按存储精度编码，按需 mmap），
+    binary.u8 为可选的符号位二值码，meta.jsonl 为逐行的标量字段，deleted.log 逐行追加删除墓碑，
+    collection.json 记录维度、存储精度、文件代数、已提交行数、meta.jsonl 的有效字节数与下一个分块 ID。
+
+    墓碑数超过 compact_ratio * 行数（且不少于 compact_min 行）时压缩：把存活行写入下一代文件
+    （vectors.g<代数>.f32 等），以 collection.json 原子替换为提交点，再删除旧文件与墓碑日志。
+    分块 ID 不随压缩改变，也不会复用。
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "collection.json"), "r", encoding="utf-8") as f:
+            info = json.load(f)
+        self.dim = info["dim"]
+        self.vector_type = info.get("vector_type", "float32")
+        self.binary = info.get("binary", False)
+        self.dtype = quantize.storage_dtype(self.vector_type)
+        self.generation = info.get("generation", 0)
+        self.count = info["count"]
+        self.meta_bytes = info["meta_bytes"]
+        self.rows: list[dict] = []
+        with open(self._file("meta.jsonl"), "rb") as f:
+            # 只读取已提交的部分，忽略上次中断写入的残留
+            for line in f.read(self.meta_bytes).splitlines():
+                self.rows.append(json.loads(line))
+        self._next_id = info.get("next_id", self.rows[-1]["id"] + 1 if self.rows else 0)
+        self.deleted: set[int] = set()
+        legacy_path = os.path.join(path, "deleted.json")
+        if os.path.exists(legacy_path):
+            with open(legacy_path, "r", encoding="utf-8") as f:
+                self.deleted = set(json.load(f))
+        log_path = os.path.join(path, "deleted.log")
+        if os.path.exists(log_path):
+            with open(log_path, "r+b") as f:
+                data = f.read()
+                # 最后一行没有换行符时是中断写入的残留，截掉以免与之后追加的 ID 相连
+                committed = data.rfind(b"\n") + 1
+                if committed < len(data):
+                    f.truncate(committed)
+            self.deleted.update(int(line) for line in data[:committed].split(b"\n") if line)
+        self.positions = {row["id"]: i for i, row in enumerate(self.rows)}
+        self.dead = np.asarray(sorted(self.positions[i] for i in self.deleted if i in self.positions), dtype=np.int64)
+        self._matrix = None
+        self._codes = None
+        # 标量字段倒排索引 {字段: {值: [行位置]}}，首次按该字段过滤时建立
+        self._fields: dict[str, dict] = {}
+        self._remove_stale_files()
+
+    @staticmethod
+    def create(path: str, dim: int, vector_type: str = "float32", binary: bool = False) -> "_LocalCollection":
+        os.makedirs(path, exist_ok=True)
+        open(os.path.join(path, _LocalCollection._vector_file(vector_type)), "wb").close()
+        if binary:
+            open(os.path.join(path, "binary.u8"), "wb").close()
+        open(os.path.join(path, "meta.jsonl"), "wb").close()
+        _LocalCollection._write_json(os.path.join(path, "collection.json"), {
+            "dim": dim, "vector_type": quantize.check_type(vector_type), "binary": binary,
+            "generation": 0, "count": 0, "meta_bytes": 0, "next_id": 0
+        })
+        return _LocalCollection(path)
+
+    @staticmethod
+    def _vector_file(vector_type: str) -> str:
+        return "vectors." + quantize.VECTOR_TYPES[vector_type][1]
+
+    def _file(self, name: str, generation: int | None = None) -> str:
+        """
+        数据文件路径；第 0 代沿用原文件名，之后每次压缩在扩展名前加 .g<代数>。
+        """
+        generation = self.generation if generation is None else generation
+        if generation:
+            stem, ext = name.rsplit(".", 1)
+            name = f"{stem}.g{generation}.{ext}"
+        return os.path.join(self.path, name)
+
+    def _data_files(self, generation: int) -> list[str]:
+        names = [self._vector_file(self.vector_type), "meta.jsonl"] + (["binary.u8"] if self.binary else [])
+        return [self._file(name, generation) for name in names]
+
+    def _remove_stale_files(self):
+        """
+        删除非当前代的数据文件（压缩提交后未能删除的旧文件，或提交前中断留下的新文件）。
+        """
+        current = set(self._data_files(self.generation))
+        for name in os.listdir(self.path):
+            file_path = os.path.join(self.path, name)
+            if name.startswith(("vectors.", "binary.", "meta.")) and file_path not in current:
+                try:
+                    os.remove(file_path)
+                except OSError:
+                    pass
+
+    def _info(self, count: int, meta_bytes: int, generation: int | None = None) -> dict:
+        return {
+            "dim": self.dim, "vector_type": self.vector_type, "binary": self.binary,
+            "generation": self.generation if generation is None else generation,
+            "count": count, "meta_bytes": meta_bytes, "next_id": self._next_id
+        }
+
+    @staticmethod
+    def _write_json(path: str, data):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @property
+    def next_id(self) -> int:
+        return self._next_id
+
+    @property
+    def matrix(self) -> np.ndarray:
+        if self.count == 0:
+            return np.empty((0, self.dim), dtype=self.dtype)
+        if self._matrix is None or self._matrix.shape[0] != self.count:
+            self._matrix = np.memmap(
+                self._file(self._vector_file(self.vector_type)),
+                dtype=self.dtype, mode="r", shape=(self.count, self.dim)
+            )
+        return self._matrix
+
+    @property
+    def codes(self) -> np.ndarray | None:
+        if not self.binary:
+            return None
+        width = (self.dim + 7) // 8
+        if self.count == 0:
+            return np.empty((0, width), dtype=np.uint8)
+        if self._codes is None or self._codes.shape[0] != self.count:
+            self._codes = np.memmap(self._file("binary.u8"), dtype=np.uint8, mode="r", shape=(self.count, width))
+        return self._codes
+
+    def insert(self, rows: list[dict]) -> list[int]:
+        vectors = quantize.normalize(np.asarray([row["embedding"] for row in rows], dtype=np.float32).reshape(-1, self.dim))
+        start = self.next_id
+        metas = []
+        for i, row in enumerate(rows):
+            meta = {k: v for k, v in row.items() if k != "embedding"}
+            meta["id"] = start + i
+            metas.append(meta)
+        data = "".join(json.dumps(m, ensure_ascii=False) + "\n" for m in metas).encode("utf-8")
+        with open(self._file(self._vector_file(self.vector_type)), "r+b") as f:
+            f.seek(self.count * self.dim * self.dtype.itemsize)
+            f.write(quantize.encode(vectors, self.vector_type).tobytes())
+        if self.binary:
+            codes = quantize.binary_codes(vectors)
+            with open(self._file("binary.u8"), "r+b") as f:
+                f.seek(self.count * codes.shape[1])
+                f.write(codes.tobytes())
+        with open(self._file("meta.jsonl"), "r+b") as f:
+            f.seek(self.meta_bytes)
+            f.truncate()
+            f.write(data)
+        # 先写数据再提交行数，中途失败时已提交部分保持一致
+        self._next_id = start + len(metas)
+        self._write_json(os.path.join(self.path, "collection.json"), self._info(self.count + len(metas), self.meta_bytes + len(data)))
+        for meta in metas:
+            pos = len(self.rows)
+            self.positions[meta["id"]] = pos
+            self.rows.append(meta)
+            for field, index in self._fields.items():
+                value = meta.get(field)
+                if _hashable(value):
+                    index.setdefault(value, []).append(pos)
+        self.count += len(metas)
+        self.meta_bytes += len(data)
+        return [m["id"] for m in metas]
+
+    def delete(self, ids: list[int]):
+        """
+        追加删除墓碑，只写本次新增的 ID。
+        """
+        new = list(dict.fromkeys(i for i in ids if i in self.positions and i not in self.deleted))
+        if not new:
+            return
+        with open(os.path.join(self.path, "deleted.log"), "ab") as f:
+            f.write("".join(f"{i}\n" for i in new).encode("ascii"))
+        self.deleted.update(new)
+        self.dead = np.union1d(self.dead, np.asarray([self.positions[i] for i in new], dtype=np.int64))
+
+    def should_compact(self, ratio: float, min_rows: int) -> bool:
+        return len(self.dead) >= max(min_rows, ratio * self.count)
+
+    def compact(self):
+        """
+        将存活行写入下一代文件并提交，回收已删除行占用的空间与检索开销。
+
+        只替换内存中的行列表、矩阵等对象而不原地修改，已取得的检索快照仍指向旧数据，可安全读完。
+        """
+        keep = np.setdiff1d(np.arange(self.count, dtype=np.int64), self.dead, assume_unique=True)
+        generation = self.generation + 1
+        sources = [(self.matrix, self._vector_file(self.vector_type))]
+        if self.binary:
+            sources.append((self.codes, "binary.u8"))
+        for source, name in sources:
+            with open(self._file(name, generation), "wb") as f:
+                # 分块拷贝，不把整个矩阵读入内存
+                for start in range(0, len(keep), quantize.BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(source[keep[start:start + quantize.BLOCK_ROWS]]).tobytes())
+        rows = [self.rows[pos] for pos in keep]
+        data = "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows).encode("utf-8")
+        with open(self._file("meta.jsonl", generation), "wb") as f:
+            f.write(data)
+        old_files = self._data_files(self.generation)
+        # 提交点：之后重新打开数据表即读取新一代文件
+        self._write_json(os.path.join(self.path, "collection.json"), self._info(len(rows), len(data), generation))
+        for file_path in [*old_files, os.path.join(self.path, "deleted.log"), os.path.join(self.path, "deleted.json")]:
+            try:
+                os.remove(file_path)
+            except OSError:
+                # Windows 下仍被 mmap 的旧文件无法删除，下次打开时清理
+                pass
+        removed = len(self.dead)
+        self.generation = generation
+        self.count = len(rows)
+        self.meta_bytes = len(data)
+        self.rows = rows
+        self.positions = {row["id"]: i for i, row in enumerate(rows)}
+        self.deleted = set()
+        self.dead = np.empty(0, dtype=np.int64)
+        self._matrix = None
+        self._codes = None
+        self._fields = {}
+        print(f"[OK] 压缩本地数据表 {os.path.basename(self.path)}：移除 {removed} 行，保留 {len(rows)} 行")
+
+    def _field_index(self, field: str) -> dict:
+        index = self._fields.get(field)
+        if index is None:
+            index = {}
+            for pos, row in enumerate(self.rows):
+                value = row.get(field)
+                if _hashable(value):
+                    index.setdefault(value, []).append(pos)
+            self._fields[field] = index
+        return index
+
+    def match(self, filter: dict) -> np.ndarray:
+        """
+        满足过滤条件的行位置（含已删除行），升序。
+        """
+        allowed = None
+        for field, value in filter.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            index = self._field_index(field)
+            current = np.unique(np.asarray([p for v in values if _hashable(v) for p in index.get(v, [])], dtype=np.int64))
+            allowed = current if allowed is None else np.intersect1d(allowed, current, assume_unique=True)
+        return allowed if allowed is not None else np.arange(len(self.rows), dtype=np.int64)
+
+    def snapshot(self, filter: dict | None = None) -> tuple:
+        """
+        当前已提交数据的只读视图，检索可在锁外进行。
+        """
+        allowed = self.match(filter) if filter else None
+        return self.matrix, self.codes, self.vector_type, self.dead, self.rows, allowed
+
+    def vectors(self, positions: np.ndarray) -> np.ndarray:
+        """
+        按行位置取回 float32 单位向量。
+        """
+        order = np.argsort(positions)
+        out = np.empty((len(positions), self.dim), dtype=np.float32)
+        out[order] = quantize.normalize(quantize.decode(self.matrix[np.asarray(positions)[order]], self.vector_type))
+        return out
+
+    @staticmethod
+    def search(
+            snapshot: tuple,
+            vectors: np.ndarray,
+            top_k: int,
+            output_fields: list[str] | None,
+            rescore_factor: int = RAG["rescore_factor"],
+            return_vectors: bool = False
+        ) -> list[list[dict]]:
+        matrix, codes, vector_type, dead, rows, allowed = snapshot
+        if allowed is not None:
+            # 先按标量条件缩小候选集，只对候选行计算相似度
+            allowed = np.setdiff1d(allowed, dead, assume_unique=True)
+        if (matrix.shape[0] if allowed is None else len(allowed)) == 0:
+            return [[] for _ in range(len(vectors))]
+        queries = quantize.normalize(vectors)
+        top, scores = quantize.search(
+            queries, matrix, vector_type, top_k, codes, rescore_factor,
+            subset=allowed, exclude=dead if allowed is None else None
+        )
+        results = []
+        for q in range(len(queries)):
+            hits, positions = [], []
+            for i, score in zip(top[q], scores[q]):
+                if not np.isfinite(score):
+                    continue
+                pos = allowed[i] if allowed is not None else i
+                row = rows[pos]
+                entity = {f: row.get(f) for f in output_fields} if output_fields else {k: v for k, v in row.items() if k != "id"}
+                hits.append({"id": row["id"], "distance": float(score), "entity": entity})
+                positions.append(pos)
+            if return_vectors and hits:
+                stored = quantize.normalize(quantize.decode(matrix[np.asarray(positions)], vector_type))
+                for hit, vector in zip(hits, stored):
+                    hit["vector"] = vector
+            results.append(hits)
+        return results
+
+class LocalStore(VectorStore):
+    """
+    嵌入式本地后端：无需外部服务，NumPy 向量化余弦检索，适合中小规模语料与开发/CI 环境。
+    """
+    def __init__(
+            self,
+            path: str = RAG["local_path"],
+            rescore_factor: int = RAG["rescore_factor"],
+            compact_ratio: float = RAG["local_compact_ratio"],
+            compact_min: int = RAG["local_compact_min"]
+        ):
+        self.path = path
+        self.rescore_factor = rescore_factor
+        self.compact_ratio = compact_ratio
+        self.compact_min = compact_min
+        os.makedirs(path, exist_ok=True)
+        self._collections: dict[str, _LocalCollection] = {}
+        self._lock = threading.RLock()
+
+    def _dir(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _get(self, name: str) -> _LocalCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            if not self.has_collection(name):
+                raise KeyError(f"collection {name} not found")
+            collection = _LocalCollection(self._dir(name))
+            self._collections[name] = collection
+        return collection
+
+    def has_collection(self, name: str) -> bool:
+        return os.path.exists(os.path.join(self._dir(name), "collection.json"))
+
+    def create_collection(
+            self,
+            name: str,
+            dim: int,
+            partition_key: str | None = None,
+            vector_type: str = "float32",
+            binary: bool = False
+        ) -> None:
+        # 本地后端按需为过滤字段建立倒排索引，不需要预先声明分区键
+        with self._lock:
+            self._collections[name] = _LocalCollection.create(self._dir(name), dim, vector_type, binary)
+
+    def dimension(self, name: str) -> int | None:
+        collection = self._collections.get(name)
+        if collection is not None:
+            return collection.dim
+        if not self.has_collection(name):
+            return None
+        with open(os.path.join(self._dir(name), "collection.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["dim"]
+
+    def list_collections(self) -> list[str]:
+        return sorted(name for name in os.listdir(self.path) if self.has_collection(name))
+
+    def drop_collection(self, name: str) -> None:
+        with self._lock:
+            self._collections.pop(name, None)
+            shutil.rmtree(self._dir(name), ignore_errors=True)
+
+    def insert(self, name: str, rows: list[dict]) -> list[int]:
+        if not rows:
+            return []
+        with self._lock:
+            return self._get(name).insert(rows)
+
+    def search(
+            self,
+            name: str,
+            vectors: list[list[float]],
+            top_k: int,
+            output_fields: list[str] | None = None,
+            filter: dict | None = None,
+            return_vectors: bool = False
+        ) -> list[list[dict]]:
+        with self._lock:
+            snapshot = self._get(name).snapshot(filter)
+        return _LocalCollection.search(
+            snapshot, np.asarray(vectors, dtype=np.float32), top_k, output_fields, self.rescore_factor, return_vectors
+        )
+
+    def get_vectors(self, name: str, ids: list[int]) -> dict[int, np.ndarray]:
+        with self._lock:
+            collection = self._get(name)
+            found = [i for i in ids if i in collection.positions and i not in collection.deleted]
+            if not found:
+                return {}
+            vectors = collection.vectors(np.asarray([collection.positions[i] for i in found], dtype=np.int64))
+        return dict(zip(found, vectors))
+
+    def scan(self, name: str, batch_size: int = 1024, filter: dict | None = None) -> Iterator[tuple[list[dict], np.ndarray]]:
+        with self._lock:
+            matrix, _, vector_type, dead, rows, allowed = self._get(name).snapshot(filter)
+        positions = allowed if allowed is not None else np.arange(len(matrix), dtype=np.int64)
+        positions = np.setdiff1d(positions, dead, assume_unique=True)
+        # 快照在写入与压缩时保持不变，遍历在锁外进行
+        for start in range(0, len(positions), batch_size):
+            block = positions[start:start + batch_size]
+            yield [rows[pos] for pos in block], quantize.normalize(quantize.decode(matrix[block], vector_type))
+
+    def delete(self, name: str, ids: list[int] | None = None, filter: dict | None = None) -> None:
+        with self._lock:
+            collection = self._get(name)
+            ids = list(ids or [])
+            if filter:
+                ids += [collection.rows[pos]["id"] for pos in collection.match(filter)]
+            collection.delete(ids)
+            if collection.should_compact(self.compact_ratio, self.compact_min):
+                collection.compact()
+
+def make_store(backend: str = RAG["backend"], url: str = RAG["milvus_url"], name: str = RAG["db_name"]) -> VectorStore:
+    """
+    按名称创建存储后端："milvus" 或 "local"。
+    """
+    if backend == "milvus":
+        return MilvusStore(url, name)
+    if backend == "local":
+        return LocalStore(os.path.join(RAG["local_path"], name))
+    raise ValueError(f"Unknown RAG backend: {backend}")